@@ -4,7 +4,7 @@ from flask import Flask
 from flask_cors import CORS
 from .routes import main as main_blueprint
 from config.config import Config
-from .services import initialize_models
+from .startup import readiness, warm_up
 import logging
 
 def create_app():
@@ -29,7 +29,8 @@ def create_app():
     # Register Blueprints
     app.register_blueprint(main_blueprint)
     
-    # Initialize Models
-    initialize_models()
+    # Load or train the models in the background: /healthz answers right away, /readyz once
+    # the snapshot is live, and reads are served from a popularity fallback until then
+    readiness.start(warm_up)
     
     return app
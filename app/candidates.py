@@ -0,0 +1,180 @@
+# app/candidates.py
+
+import numpy as np
+import scipy.sparse as sp
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateGenerator:
+    """
+    Base class for the first stage of the recommendation pipeline.
+
+    A generator cheaply proposes up to `k` catalog positions for one user from the compact
+    model. The union of all generators is then scored by the ranker, so per-request ranking
+    cost depends on the number of candidates rather than on the catalog size.
+    """
+
+    name = 'base'
+
+    def __init__(self, k=200):
+        self.k = k
+
+    def generate(self, model, request):
+        """
+        Propose candidates for one request.
+
+        Parameters:
+            model (dict): The compact model (see app.compact.build_compact_model).
+            request (dict): Per-request state: 'user_idx' (row in the latent matrix or -1),
+                            'purchased' (catalog positions) and 'special_positions'.
+
+        Returns:
+            np.ndarray: Catalog positions (int), at most k.
+        """
+        raise NotImplementedError
+
+
+def _top_k(scores, k):
+    """Positions of the k largest finite scores, best first."""
+    finite = np.flatnonzero(np.isfinite(scores))
+    if finite.size > k:
+        top = np.argpartition(-scores[finite], k - 1)[:k]
+        finite = finite[top]
+    return finite[np.argsort(-scores[finite], kind='stable')]
+
+
+class CFTopKGenerator(CandidateGenerator):
+    """Dishes with the highest collaborative filtering score (user factors x item factors)."""
+
+    name = 'cf'
+
+    def generate(self, model, request):
+        if request['user_idx'] < 0:
+            return np.empty(0, dtype=np.int64)
+        scores = model['item_factors'] @ model['latent_matrix'][request['user_idx']]
+        scores[request['purchased']] = -np.inf
+        return _top_k(scores, self.k)
+
+
+class CBFNeighborsGenerator(CandidateGenerator):
+    """
+    Best dishes of the user's precomputed CBF profile, or else the content neighbors of
+    the dishes the user already purchased.
+    """
+
+    name = 'cbf'
+
+    def generate(self, model, request):
+        purchased = request['purchased']
+        if 'cbf_profiles' in model and request['user_idx'] >= 0 and purchased.size:
+            profile = model['cbf_profiles'][request['user_idx']]
+            if sp.issparse(profile):
+                scores = np.full(len(model['dish_ids']), -np.inf, dtype=np.float32)
+                scores[profile.indices] = profile.data
+            else:
+                scores = np.array(profile, dtype=np.float32)
+            scores[purchased] = -np.inf
+            return _top_k(scores, self.k)
+
+        if purchased.size == 0 or model['dish_neighbors'].shape[1] == 0:
+            return np.empty(0, dtype=np.int64)
+        neighbors = model['dish_neighbors'][purchased].ravel()
+        scores = model['dish_neighbor_scores'][purchased].ravel()
+        # Accumulate similarity over purchased dishes and keep the strongest neighbors
+        totals = np.bincount(neighbors, weights=scores, minlength=len(model['dish_ids']))
+        totals[totals <= 0] = -np.inf
+        totals[purchased] = -np.inf
+        return _top_k(totals, self.k)
+
+
+class CooccurrenceGenerator(CandidateGenerator):
+    """Dishes frequently ordered together with the dishes the user already purchased."""
+
+    name = 'cooccurrence'
+
+    def generate(self, model, request):
+        purchased = request['purchased']
+        if purchased.size == 0 or 'cooccurrence_neighbors' not in model:
+            return np.empty(0, dtype=np.int64)
+        neighbors = model['cooccurrence_neighbors'][purchased].ravel()
+        scores = model['cooccurrence_scores'][purchased].ravel()
+        present = neighbors >= 0
+        totals = np.bincount(neighbors[present], weights=scores[present], minlength=len(model['dish_ids']))
+        totals[totals <= 0] = -np.inf
+        totals[purchased] = -np.inf
+        return _top_k(totals, self.k)
+
+
+class SpecialsGenerator(CandidateGenerator):
+    """Dishes with a running special promotion."""
+
+    name = 'specials'
+
+    def generate(self, model, request):
+        return np.asarray(request.get('special_positions', []), dtype=np.int64)[:self.k]
+
+
+class PopularGenerator(CandidateGenerator):
+    """Globally most popular dishes."""
+
+    name = 'popular'
+
+    def generate(self, model, request):
+        return model['popular_order'][:self.k].astype(np.int64)
+
+
+CANDIDATE_GENERATORS = {
+    CFTopKGenerator.name: CFTopKGenerator,
+    CBFNeighborsGenerator.name: CBFNeighborsGenerator,
+    CooccurrenceGenerator.name: CooccurrenceGenerator,
+    SpecialsGenerator.name: SpecialsGenerator,
+    PopularGenerator.name: PopularGenerator,
+}
+
+
+def create_candidate_generators(names, k=200):
+    """
+    Create candidate generators by name.
+
+    Parameters:
+        names (str or list): Registered generator names, as a list or a comma-separated string.
+        k (int): Candidates proposed per generator.
+
+    Returns:
+        list: CandidateGenerator instances, in the given order.
+    """
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+    generators = []
+    for name in names:
+        try:
+            generators.append(CANDIDATE_GENERATORS[name.lower()](k=k))
+        except KeyError:
+            raise ValueError(
+                f"Unknown candidate generator '{name}'. Available generators: {sorted(CANDIDATE_GENERATORS)}"
+            )
+    return generators
+
+
+def generate_candidates(model, request, generators):
+    """
+    Run every generator and return the union of their candidates.
+
+    Dishes the user already purchased are removed. A failing generator is logged and skipped
+    so the remaining sources still produce recommendations.
+
+    Returns:
+        np.ndarray: Sorted unique catalog positions.
+    """
+    proposals = []
+    for generator in generators:
+        try:
+            proposals.append(np.asarray(generator.generate(model, request), dtype=np.int64))
+        except Exception as e:
+            logger.error(f"Candidate generator '{generator.name}' failed: {e}")
+    if not proposals:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.unique(np.concatenate(proposals))
+    return np.setdiff1d(candidates, request['purchased'], assume_unique=False)
@@ -0,0 +1,248 @@
+# app/cf_backends.py
+
+import os
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.decomposition import TruncatedSVD
+from .memory import nbytes_of
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def as_sparse_matrix(user_item_matrix):
+    """Return a CSR view of a dense, sparse-backed or SciPy interaction matrix."""
+    if sp.issparse(user_item_matrix):
+        return user_item_matrix.tocsr()
+    if hasattr(user_item_matrix, 'sparse'):
+        return user_item_matrix.sparse.to_coo().tocsr()
+    return sp.csr_matrix(np.asarray(user_item_matrix))
+
+
+class CFBackend:
+    """
+    Base class for Collaborative Filtering backends.
+
+    A backend fits user and item latent factors so that the predicted score of a dish
+    for a user is the dot product of their factor vectors.
+    """
+
+    name = 'base'
+
+    def __init__(self, n_components=50):
+        self.n_components = n_components
+
+    def nbytes_parts(self):
+        """Members holding the fitted state (the arrays among the attributes by default)."""
+        return list(vars(self).values())
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the fitted backend."""
+        return nbytes_of(self)
+
+    def fit(self, user_item_matrix, confidence_matrix=None):
+        """
+        Fit the backend.
+
+        Parameters:
+            user_item_matrix (pd.DataFrame): User-Item interaction matrix.
+            confidence_matrix (scipy.sparse.csr_matrix, optional): Implicit feedback strengths
+                aligned with user_item_matrix. Backends that do not use it ignore it.
+
+        Returns:
+            tuple: (user latent factors, item latent factors)
+        """
+        raise NotImplementedError
+
+    def fold_in_users(self, user_item_matrix, chunk_size=50000):
+        """
+        Project users onto the fitted item factors, `chunk_size` rows at a time.
+
+        Parameters:
+            user_item_matrix (scipy.sparse matrix or pd.DataFrame): Users x Dishes interactions.
+            chunk_size (int): Number of users projected per step.
+
+        Returns:
+            np.ndarray: User latent factors.
+        """
+        raise NotImplementedError
+
+
+class SVDBackend(CFBackend):
+    """Truncated SVD over the explicit (zero-filled) User-Item interaction matrix."""
+
+    name = 'svd'
+
+    def __init__(self, n_components=50, random_state=42, fold_in_chunk_size=None):
+        super().__init__(n_components)
+        self.random_state = random_state
+        self.fold_in_chunk_size = fold_in_chunk_size
+        self.svd = None
+
+    def nbytes_parts(self):
+        # The fitted TruncatedSVD holds components_ and the explained variance arrays
+        return list(vars(self.svd).values()) if self.svd is not None else []
+
+    def fit(self, user_item_matrix, confidence_matrix=None):
+        # Ensure n_components does not exceed the smaller dimension of the matrix
+        n_components = min(self.n_components, min(user_item_matrix.shape) - 1)
+
+        self.svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        if self.fold_in_chunk_size:
+            # Bounded-memory mode: randomized SVD on the sparse matrix, then fold users in by chunks
+            matrix = as_sparse_matrix(user_item_matrix)
+            self.svd.fit(matrix)
+            user_factors = self.fold_in_users(matrix, self.fold_in_chunk_size)
+        else:
+            user_factors = self.svd.fit_transform(user_item_matrix)  # User latent factors
+        item_factors = self.svd.components_.T  # Item latent factors
+        return user_factors, item_factors
+
+    def fold_in_users(self, user_item_matrix, chunk_size=50000):
+        matrix = as_sparse_matrix(user_item_matrix)
+        components_t = self.svd.components_.T
+        user_factors = np.empty((matrix.shape[0], components_t.shape[1]), dtype=components_t.dtype)
+        for start in range(0, matrix.shape[0], chunk_size):
+            end = min(start + chunk_size, matrix.shape[0])
+            user_factors[start:end] = matrix[start:end] @ components_t
+        return user_factors
+
+
+class ALSBackend(CFBackend):
+    """
+    Alternating Least Squares for implicit feedback (Hu, Koren & Volinsky).
+
+    Every observed interaction r_ui becomes a preference p_ui = 1 with confidence
+    c_ui = 1 + alpha * r_ui, while missing entries are p_ui = 0 with confidence 1, so
+    unobserved dishes are weak negatives instead of hard zero ratings. Each half-step is
+    solved approximately with a few conjugate-gradient iterations warm-started from the
+    previous factors, working directly on the sparse confidence matrix. Rows are split
+    into blocks that are solved concurrently on a thread pool (the heavy lifting happens
+    in NumPy/SciPy kernels, which release the GIL).
+    """
+
+    name = 'als'
+
+    def __init__(self, n_components=50, iterations=15, regularization=0.1, alpha=40.0,
+                 cg_steps=3, num_threads=0, block_size=4096, random_state=42):
+        super().__init__(n_components)
+        self.iterations = iterations
+        self.regularization = regularization
+        self.alpha = alpha
+        self.cg_steps = cg_steps
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.random_state = random_state
+        self.item_factors = None
+
+    def fit(self, user_item_matrix, confidence_matrix=None):
+        if confidence_matrix is None:
+            # Fall back to the interaction matrix itself as the implicit feedback strength
+            confidence_matrix = as_sparse_matrix(user_item_matrix)
+
+        # Cui holds (c_ui - 1) = alpha * r_ui for the observed entries only (a copy: the
+        # caller's matrix must not be scaled in place)
+        Cui = sp.csr_matrix(confidence_matrix, dtype=np.float64, copy=True)
+        Cui.eliminate_zeros()
+        Cui.data *= self.alpha
+        Ciu = Cui.T.tocsr()
+
+        n_users, n_items = Cui.shape
+        n_components = max(1, min(self.n_components, min(Cui.shape) - 1))
+
+        rng = np.random.default_rng(self.random_state)
+        user_factors = rng.normal(scale=0.01, size=(n_users, n_components))
+        item_factors = rng.normal(scale=0.01, size=(n_items, n_components))
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            for iteration in range(self.iterations):
+                self._solve(executor, Cui, user_factors, item_factors)
+                self._solve(executor, Ciu, item_factors, user_factors)
+                logger.debug(f"ALS iteration {iteration + 1}/{self.iterations} completed.")
+
+        # Only item factors are kept on the backend (for fold-in); user factors are returned
+        self.item_factors = item_factors
+        return user_factors, item_factors
+
+    def fold_in_users(self, user_item_matrix, chunk_size=50000):
+        Cui = sp.csr_matrix(as_sparse_matrix(user_item_matrix), dtype=np.float64, copy=True)
+        Cui.data *= self.alpha
+        Y = self.item_factors
+        YtY = Y.T @ Y + self.regularization * np.eye(Y.shape[1])
+        user_factors = np.zeros((Cui.shape[0], Y.shape[1]))
+        for start in range(0, Cui.shape[0], chunk_size):
+            end = min(start + chunk_size, Cui.shape[0])
+            self._cg_block(Cui, user_factors, Y, YtY, start, end, cg_steps=Y.shape[1])
+        return user_factors
+
+    def _solve(self, executor, Cui, X, Y):
+        """Update every row of X in place given the fixed factors Y, one block per task."""
+        YtY = Y.T @ Y + self.regularization * np.eye(Y.shape[1])
+        blocks = [
+            (start, min(start + self.block_size, X.shape[0]))
+            for start in range(0, X.shape[0], self.block_size)
+        ]
+        # Consume the iterator so that worker exceptions are raised here
+        list(executor.map(lambda block: self._cg_block(Cui, X, Y, YtY, *block), blocks))
+
+    def _cg_block(self, Cui, X, Y, YtY, start, end, cg_steps=None):
+        """Run batched conjugate-gradient steps for rows [start, end) of X."""
+        C = Cui[start:end]
+        rows = np.repeat(np.arange(end - start), np.diff(C.indptr))
+        cols = C.indices
+        Ycols = Y[cols]
+
+        def apply_a(V):
+            # (YtY + Yt (Cu - I) Y + reg * I) v for every row v of V
+            weights = np.einsum('ij,ij->i', V[rows], Ycols) * C.data
+            weighted = sp.csr_matrix((weights, C.indices, C.indptr), shape=C.shape)
+            return V @ YtY + weighted @ Y
+
+        # Right-hand side Yt Cu p(u) = sum over observed dishes of c_ui * y_i
+        b = sp.csr_matrix((C.data + 1.0, C.indices, C.indptr), shape=C.shape) @ Y
+
+        x = X[start:end]
+        r = b - apply_a(x)
+        p = r.copy()
+        rsold = np.einsum('ij,ij->i', r, r)
+
+        for _ in range(cg_steps or self.cg_steps):
+            if not np.any(rsold > 1e-20):
+                break
+            Ap = apply_a(p)
+            denom = np.einsum('ij,ij->i', p, Ap)
+            step = np.divide(rsold, denom, out=np.zeros_like(rsold), where=denom > 1e-20)
+            x += step[:, None] * p
+            r -= step[:, None] * Ap
+            rsnew = np.einsum('ij,ij->i', r, r)
+            beta = np.divide(rsnew, rsold, out=np.zeros_like(rsnew), where=rsold > 1e-20)
+            p = r + beta[:, None] * p
+            rsold = rsnew
+
+        X[start:end] = x
+
+
+CF_BACKENDS = {
+    SVDBackend.name: SVDBackend,
+    ALSBackend.name: ALSBackend,
+}
+
+
+def create_cf_backend(name, **params):
+    """
+    Create a Collaborative Filtering backend by name.
+
+    Parameters:
+        name (str): Registered backend name (e.g. 'svd', 'als').
+        **params: Keyword arguments forwarded to the backend constructor.
+
+    Returns:
+        CFBackend: The backend instance.
+    """
+    try:
+        backend_cls = CF_BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown CF backend '{name}'. Available backends: {sorted(CF_BACKENDS)}")
+    return backend_cls(**params)
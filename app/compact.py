@@ -0,0 +1,597 @@
+# app/compact.py
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from .cf_backends import as_sparse_matrix
+from .memory import nbytes_of
+import logging
+
+logger = logging.getLogger(__name__)
+
+ID_DTYPE = np.int32
+SCORE_DTYPE = np.float32
+BITSET_DTYPE = np.uint64
+BITSET_WORD_BITS = 64
+MISSING_ID = -1
+
+# Dish metadata columns kept for serving, with their compact dtypes
+DISH_COLUMNS = {
+    'DishID': ID_DTYPE,
+    'DishName': object,
+    'CategoryID': ID_DTYPE,
+    'Category': object,
+    'Ingredient': object,
+    'OrderCount': SCORE_DTYPE,
+    'AverageRating': SCORE_DTYPE,
+    'Popularity': SCORE_DTYPE,
+}
+
+PREFERENCE_ID_COLUMNS = ['FavoriteDish', 'DietaryRestrictions', 'CategoryID']
+
+
+def to_id_array(values):
+    """Convert ids (possibly float with NaN or empty strings) to int32, using -1 for missing."""
+    numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+    if numeric.notna().any() and numeric.max() > np.iinfo(ID_DTYPE).max:
+        raise ValueError("IDs exceed the int32 range of the compact model.")
+    return numeric.fillna(MISSING_ID).to_numpy(dtype=ID_DTYPE)
+
+
+def lookup(ids, value):
+    """
+    Position of `value` in the sorted id array `ids`.
+
+    Returns:
+        int: The position, or -1 if the id is not present.
+    """
+    position = int(np.searchsorted(ids, value))
+    if position < len(ids) and ids[position] == value:
+        return position
+    return -1
+
+
+def lookup_many(ids, values):
+    """Vectorized lookup(): positions of `values` in the sorted `ids`, -1 where absent."""
+    values = np.asarray(values)
+    if len(ids) == 0:
+        return np.full(values.shape, -1, dtype=np.int64)
+    positions = np.searchsorted(ids, values)
+    clipped = np.minimum(positions, len(ids) - 1)
+    return np.where(ids[clipped] == values, clipped, -1)
+
+
+def build_dish_columns(dish_features_agg):
+    """Hold dish metadata column-wise in NumPy arrays, sorted by DishID."""
+    # Reset to positional labels so the returned order indexes rows of the similarity matrix
+    frame = dish_features_agg.reset_index(drop=True).sort_values('DishID', kind='stable')
+    dishes = {}
+    for column, dtype in DISH_COLUMNS.items():
+        if column not in frame.columns:
+            continue
+        if dtype is ID_DTYPE:
+            dishes[column] = to_id_array(frame[column])
+        elif dtype is object:
+            dishes[column] = frame[column].fillna('').astype(str).to_numpy(dtype=object)
+        else:
+            dishes[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0).to_numpy(dtype=dtype)
+    return dishes, frame.index.to_numpy()
+
+
+def build_dish_details(dish_ids, details):
+    """
+    Display columns of the dishes (name, description, price, image), aligned with dish_ids.
+
+    Parameters:
+        dish_ids (np.ndarray): Sorted catalog dish ids.
+        details (pd.DataFrame): One row per dish with DishID and the display columns.
+
+    Returns:
+        dict: Column name -> object array (None where a dish has no value).
+    """
+    positions = lookup_many(to_id_array(details['DishID']), dish_ids) if len(details) else np.full(len(dish_ids), -1)
+    found = positions >= 0
+    columns = {}
+    for column in details.columns.drop('DishID'):
+        values = np.full(len(dish_ids), None, dtype=object)
+        source = details[column].astype(object)
+        values[found] = source.where(source.notna(), None).to_numpy(dtype=object)[positions[found]]
+        columns[column] = values
+    return columns
+
+
+def _set_bits(bitsets, rows, category_positions):
+    """Set the bit of each category position in the given rows of a bitset array (in place)."""
+    category_positions = np.asarray(category_positions, dtype=np.int64)
+    words = category_positions // BITSET_WORD_BITS
+    bits = np.left_shift(BITSET_DTYPE(1), (category_positions % BITSET_WORD_BITS).astype(BITSET_DTYPE))
+    np.bitwise_or.at(bitsets, (rows, words), bits)
+
+
+def build_category_bitsets(dish_ids, dish_categories):
+    """
+    Per-dish category membership as bitsets.
+
+    Parameters:
+        dish_ids (np.ndarray): Sorted catalog dish ids.
+        dish_categories (pd.DataFrame): One row per (DishID, CategoryID) pair from DishCategory.
+
+    Returns:
+        tuple: (category_index, bitsets) where category_index holds the sorted int32 category
+               ids (bit i stands for category_index[i]) and bitsets is uint64 [n_dishes, n_words].
+    """
+    pair_dishes = to_id_array(dish_categories['DishID'])
+    pair_categories = to_id_array(dish_categories['CategoryID'])
+    category_index = np.unique(pair_categories[pair_categories != MISSING_ID])
+
+    n_words = max(1, -(-len(category_index) // BITSET_WORD_BITS))
+    bitsets = np.zeros((len(dish_ids), n_words), dtype=BITSET_DTYPE)
+    dish_positions = lookup_many(dish_ids, pair_dishes)
+    category_positions = lookup_many(category_index, pair_categories)
+    valid = (dish_positions >= 0) & (category_positions >= 0)
+    _set_bits(bitsets, dish_positions[valid], category_positions[valid])
+    return category_index, bitsets
+
+
+def category_bitmask(category_index, category_ids, n_words):
+    """
+    Bitmask with the bits of the given category ids set (ids outside the index are ignored).
+
+    Returns:
+        np.ndarray: uint64 [n_words].
+    """
+    mask = np.zeros((1, n_words), dtype=BITSET_DTYPE)
+    positions = lookup_many(category_index, to_id_array(category_ids))
+    positions = positions[positions >= 0]
+    _set_bits(mask, np.zeros(len(positions), dtype=np.int64), positions)
+    return mask[0]
+
+
+def category_membership(bitsets, category_index, category_ids):
+    """
+    Membership of every dish in each of the given categories.
+
+    Returns:
+        np.ndarray: bool [n_dishes, len(category_ids)]; False for ids outside the index.
+    """
+    positions = lookup_many(category_index, to_id_array(category_ids))
+    known = positions >= 0
+    safe = np.where(known, positions, 0)
+    words = bitsets[:, safe // BITSET_WORD_BITS]
+    bits = np.left_shift(BITSET_DTYPE(1), (safe % BITSET_WORD_BITS).astype(BITSET_DTYPE))
+    return ((words & bits) != 0) & known
+
+
+def bitsets_intersect(bitsets, mask):
+    """True where a bitset shares at least one category with `mask` (broadcast over the last axis)."""
+    return np.any((bitsets & mask) != 0, axis=-1)
+
+
+def build_feature_matrix(dish_ids, feature_values):
+    """
+    Dense numeric feature intensities per dish from DishFeatureMapping.
+
+    Parameters:
+        dish_ids (np.ndarray): Sorted catalog dish ids.
+        feature_values (pd.DataFrame): DishID, FeatureID, FeatureName, FeatureValue rows.
+
+    Returns:
+        tuple: (feature_names, values) where feature_names holds one name per column (in
+               FeatureID order) and values is float32 [n_dishes, n_features], NaN where a dish
+               has no value for a feature.
+    """
+    feature_values = feature_values.dropna(subset=['FeatureID'])
+    features = feature_values.drop_duplicates('FeatureID').sort_values('FeatureID')
+    feature_ids = to_id_array(features['FeatureID'])
+    feature_names = features['FeatureName'].fillna('').astype(str).to_numpy(dtype=object)
+
+    values = np.full((len(dish_ids), len(feature_ids)), np.nan, dtype=SCORE_DTYPE)
+    rows = lookup_many(dish_ids, to_id_array(feature_values['DishID']))
+    columns = lookup_many(feature_ids, to_id_array(feature_values['FeatureID']))
+    known = (rows >= 0) & (columns >= 0)
+    values[rows[known], columns[known]] = pd.to_numeric(
+        feature_values['FeatureValue'], errors='coerce'
+    ).to_numpy(dtype=SCORE_DTYPE)[known]
+    return feature_names, values
+
+
+def feature_range_mask(feature_names, feature_values, ranges):
+    """
+    Dishes whose feature intensities fall within the given ranges.
+
+    Parameters:
+        feature_names (np.ndarray): Feature name per column (matched case-insensitively).
+        feature_values (np.ndarray): float32 [n_dishes, n_features] (see build_feature_matrix).
+        ranges (dict): Feature name -> (minimum, maximum); either bound may be None.
+
+    Returns:
+        np.ndarray: bool [n_dishes]. Dishes without a value for a filtered feature are excluded.
+
+    Raises:
+        KeyError: If a feature name is unknown.
+    """
+    columns = {str(name).lower(): column for column, name in enumerate(feature_names)}
+    mask = np.ones(feature_values.shape[0], dtype=bool)
+    for name, (minimum, maximum) in ranges.items():
+        values = feature_values[:, columns[name.lower()]]
+        mask &= ~np.isnan(values)
+        if minimum is not None:
+            mask &= values >= minimum
+        if maximum is not None:
+            mask &= values <= maximum
+    return mask
+
+
+def build_preference_index(preferences, category_index=None):
+    """
+    Group preference rows per user into CSR-style arrays.
+
+    Parameters:
+        preferences (pd.DataFrame): User preferences.
+        category_index (np.ndarray, optional): Sorted category ids of the category bitsets;
+            when given, each user's dietary restrictions are also stored as a bitmask.
+
+    Returns:
+        dict: 'user_ids' (sorted unique int32), 'offsets' (rows of user i are
+              offsets[i]:offsets[i + 1]), one array per preference column and
+              'restriction_bits' (uint64 [n_users, n_words]).
+    """
+    n_words = max(1, -(-len(category_index) // BITSET_WORD_BITS)) if category_index is not None else 1
+    if preferences is None or preferences.empty:
+        empty_ids = np.empty(0, dtype=ID_DTYPE)
+        index = {'user_ids': empty_ids, 'offsets': np.zeros(1, dtype=np.int64),
+                 'PreferenceScore': np.empty(0, dtype=SCORE_DTYPE),
+                 'restriction_bits': np.zeros((0, n_words), dtype=BITSET_DTYPE)}
+        index.update({column: empty_ids for column in PREFERENCE_ID_COLUMNS})
+        return index
+
+    frame = preferences.sort_values('UserID', kind='stable')
+    row_users = to_id_array(frame['UserID'])
+    user_ids, starts = np.unique(row_users, return_index=True)
+    index = {
+        'user_ids': user_ids,
+        'offsets': np.append(starts, len(frame)).astype(np.int64),
+        'PreferenceScore': pd.to_numeric(frame['PreferenceScore'], errors='coerce').fillna(0).to_numpy(dtype=SCORE_DTYPE)
+    }
+    for column in PREFERENCE_ID_COLUMNS:
+        index[column] = to_id_array(frame[column])
+
+    index['restriction_bits'] = np.zeros((len(user_ids), n_words), dtype=BITSET_DTYPE)
+    if category_index is not None:
+        row_positions = np.repeat(np.arange(len(user_ids)), np.diff(index['offsets']))
+        category_positions = lookup_many(category_index, index['DietaryRestrictions'])
+        restricted = category_positions >= 0
+        _set_bits(index['restriction_bits'], row_positions[restricted], category_positions[restricted])
+    return index
+
+
+def user_restriction_bits(preference_index, user_id):
+    """Dietary restriction bitmask of one user (all zeros if the user has no preferences)."""
+    position = lookup(preference_index['user_ids'], user_id)
+    if position < 0:
+        return np.zeros(preference_index['restriction_bits'].shape[1], dtype=BITSET_DTYPE)
+    return preference_index['restriction_bits'][position]
+
+
+def user_preferences(preference_index, user_id):
+    """
+    Preference rows of one user as a small DataFrame (missing ids restored as NaN).
+
+    Parameters:
+        preference_index (dict): Output of build_preference_index().
+        user_id (int): The ID of the user.
+
+    Returns:
+        pd.DataFrame: UserID, FavoriteDish, DietaryRestrictions, CategoryID, PreferenceScore.
+    """
+    position = lookup(preference_index['user_ids'], user_id)
+    if position < 0:
+        return pd.DataFrame(columns=['UserID'] + PREFERENCE_ID_COLUMNS + ['PreferenceScore'])
+    start, end = preference_index['offsets'][position], preference_index['offsets'][position + 1]
+    rows = {'UserID': np.full(end - start, user_id)}
+    for column in PREFERENCE_ID_COLUMNS:
+        values = preference_index[column][start:end].astype(float)
+        values[values == MISSING_ID] = np.nan
+        rows[column] = values
+    rows['PreferenceScore'] = preference_index['PreferenceScore'][start:end]
+    return pd.DataFrame(rows)
+
+
+def dish_frame(dishes, positions, **extra_columns):
+    """
+    Materialize a small DataFrame for the selected catalog positions.
+
+    Parameters:
+        dishes (dict): Column arrays from build_dish_columns().
+        positions (np.ndarray): Catalog positions to include, in output order.
+        **extra_columns: Additional per-row arrays (e.g. Score) aligned with positions.
+
+    Returns:
+        pd.DataFrame: One row per selected dish.
+    """
+    frame = pd.DataFrame({column: values[positions] for column, values in dishes.items()})
+    for column, values in extra_columns.items():
+        frame[column] = values
+    return frame
+
+
+def build_neighbor_table(similarity, k=50, chunk_size=1024):
+    """
+    Top-k most similar dishes of every dish (excluding the dish itself).
+
+    Parameters:
+        similarity (np.ndarray): Dish x dish similarity in catalog order.
+        k (int): Neighbors kept per dish.
+        chunk_size (int): Rows processed at a time.
+
+    Returns:
+        tuple: (neighbors int32 [n_dishes, k], scores float32 [n_dishes, k]), best first.
+    """
+    return _neighbor_table(similarity.shape[0], lambda start, end: similarity[start:end], k, chunk_size)
+
+
+def build_blended_neighbor_table(content_similarity, item_factors, content_weight=0.5, k=50, chunk_size=1024):
+    """
+    Top-k similar dishes under a blend of content and collaborative similarity.
+
+    The collaborative similarity is the cosine of the item factors; dishes without
+    interactions (all-zero factors) only get the content part.
+
+    Parameters:
+        content_similarity (np.ndarray): Catalog x catalog TF-IDF cosine similarity.
+        item_factors (np.ndarray): Catalog-aligned item latent factors.
+        content_weight (float): Weight of the content similarity (the CF part gets the rest).
+        k (int): Neighbors kept per dish.
+        chunk_size (int): Rows processed at a time.
+
+    Returns:
+        tuple: (neighbors int32 [n_dishes, k], scores float32 [n_dishes, k]), best first.
+    """
+    norms = np.linalg.norm(item_factors, axis=1, keepdims=True)
+    unit_factors = np.divide(item_factors, norms, out=np.zeros_like(item_factors), where=norms > 0)
+
+    def blended_rows(start, end):
+        cf_similarity = unit_factors[start:end] @ unit_factors.T
+        return content_weight * content_similarity[start:end] + (1 - content_weight) * cf_similarity
+
+    return _neighbor_table(content_similarity.shape[0], blended_rows, k, chunk_size)
+
+
+def _neighbor_table(n_dishes, rows, k, chunk_size):
+    k = max(0, min(k, n_dishes - 1))
+    neighbors = np.empty((n_dishes, k), dtype=ID_DTYPE)
+    scores = np.empty((n_dishes, k), dtype=SCORE_DTYPE)
+    if k == 0:
+        return neighbors, scores
+    for start in range(0, n_dishes, chunk_size):
+        end = min(start + chunk_size, n_dishes)
+        block = np.array(rows(start, end), dtype=SCORE_DTYPE)
+        block[np.arange(end - start), np.arange(start, end)] = -np.inf  # Never a neighbor of itself
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+
+def update_neighbor_rows(similarity, neighbors, scores, rows, k=50, chunk_size=1024):
+    """
+    Recompute the neighbor lists of some dishes, leaving the other lists as they are.
+
+    Parameters:
+        similarity (np.ndarray): Dish x dish similarity in catalog order.
+        neighbors (np.ndarray): Current neighbor table, int32 [n_dishes, k].
+        scores (np.ndarray): Current neighbor scores, float32 [n_dishes, k].
+        rows (np.ndarray): Catalog positions whose lists are recomputed.
+        k (int): Neighbors kept per dish.
+        chunk_size (int): Rows processed at a time.
+
+    Returns:
+        tuple: (neighbors, scores), new arrays.
+    """
+    neighbors, scores = neighbors.copy(), scores.copy()
+    rows = np.asarray(rows, dtype=np.int64)
+    if k == 0:
+        return neighbors, scores
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        block = np.array(similarity[chunk], dtype=SCORE_DTYPE)
+        block[np.arange(len(chunk)), chunk] = -np.inf  # Never a neighbor of itself
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbors[chunk] = np.take_along_axis(top, order, axis=1)
+        scores[chunk] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+
+def build_compact_model(user_item_matrix, latent_matrix, item_factors, content_similarity,
+                        dish_features_agg, preferences, neighbors_per_dish=50, dish_categories=None,
+                        content_neighbors=None):
+    """
+    Build the compact serving representation of the trained models.
+
+    Every array is aligned to one of two sorted int32 id maps: 'user_ids' (rows of the
+    latent and interaction matrices) and 'dish_ids' (the catalog: rows of item factors and
+    both axes of the content similarity). Factors and scores are float32 in C order.
+
+    Parameters:
+        user_item_matrix (pd.DataFrame): User-Item interaction matrix (dense or sparse-backed).
+        latent_matrix (np.ndarray): User latent factors, rows aligned with user_item_matrix.index.
+        item_factors (np.ndarray): Item latent factors, rows aligned with user_item_matrix.columns.
+        content_similarity (np.ndarray): Dish x dish similarity, aligned with dish_features_agg rows.
+        dish_features_agg (pd.DataFrame): Aggregated dish features.
+        preferences (pd.DataFrame): User preferences.
+        neighbors_per_dish (int): Size of the precomputed content neighbor lists.
+        dish_categories (pd.DataFrame, optional): (DishID, CategoryID) pairs for the category
+            bitsets; defaults to the first category of each dish in dish_features_agg.
+        content_neighbors (tuple, optional): Precomputed (neighbors, scores) content neighbor
+            table in sorted dish id order (see app.content.ContentIndex); built from the
+            similarity when not given.
+
+    Returns:
+        dict: Compact model entries to be stored in the global models dictionary.
+    """
+    dishes, catalog_rows = build_dish_columns(dish_features_agg)
+    dish_ids = dishes['DishID']
+    if len(dish_ids) and np.any(np.diff(dish_ids) <= 0):
+        raise ValueError("Dish IDs in the catalog must be unique.")
+
+    if dish_categories is None:
+        dish_categories = dish_features_agg[['DishID', 'CategoryID']]
+    category_index, category_bits = build_category_bitsets(dish_ids, dish_categories)
+
+    # Users sorted by id so that lookups are a binary search
+    raw_user_ids = to_id_array(user_item_matrix.index)
+    user_order = np.argsort(raw_user_ids, kind='stable')
+    user_ids = raw_user_ids[user_order]
+
+    # Map CF columns onto catalog positions; dishes without interactions get zero factors
+    cf_positions = lookup_many(dish_ids, to_id_array(user_item_matrix.columns))
+    known = cf_positions >= 0
+
+    catalog_item_factors = np.zeros((len(dish_ids), item_factors.shape[1]), dtype=SCORE_DTYPE)
+    catalog_item_factors[cf_positions[known]] = item_factors[known]
+
+    interactions = as_sparse_matrix(user_item_matrix)[user_order].tocoo()
+    keep = cf_positions[interactions.col] >= 0
+    interactions = sp.csr_matrix(
+        (interactions.data[keep].astype(SCORE_DTYPE),
+         (interactions.row[keep], cf_positions[interactions.col[keep]])),
+        shape=(len(user_ids), len(dish_ids))
+    )
+    interactions.sort_indices()
+
+    similarity = np.asarray(content_similarity)
+    if not np.array_equal(catalog_rows, np.arange(len(catalog_rows))):
+        similarity = similarity[np.ix_(catalog_rows, catalog_rows)]
+
+    similarity = np.ascontiguousarray(similarity, dtype=SCORE_DTYPE)
+    if content_neighbors is not None and len(content_neighbors[0]) == len(dish_ids):
+        dish_neighbors, dish_neighbor_scores = content_neighbors
+    else:
+        dish_neighbors, dish_neighbor_scores = build_neighbor_table(similarity, k=neighbors_per_dish)
+
+    popularity = dishes['Popularity']
+    popularity_cap = np.quantile(popularity, 0.8) if len(popularity) else 0.0
+    below_cap = popularity[popularity < popularity_cap]
+
+    compact = {
+        'user_ids': user_ids,
+        'dish_ids': dish_ids,
+        'latent_matrix': np.ascontiguousarray(latent_matrix[user_order], dtype=SCORE_DTYPE),
+        'item_factors': np.ascontiguousarray(catalog_item_factors),
+        'content_similarity': similarity,
+        'dish_neighbors': dish_neighbors,
+        'dish_neighbor_scores': dish_neighbor_scores,
+        'interactions': interactions,
+        'dishes': dishes,
+        'category_index': category_index,
+        'category_bits': category_bits,
+        'preferences': build_preference_index(preferences, category_index),
+        # Catalog positions by descending popularity, for the popular-dishes fallback
+        'popular_order': np.argsort(-popularity, kind='stable').astype(ID_DTYPE),
+        # Catalog-wide popularity thresholds used by the ranker: dishes at or above the cap
+        # are excluded, dishes above the penalty threshold are down-weighted
+        'popularity_cap': float(popularity_cap),
+        'popularity_penalty_threshold': float(np.quantile(below_cap, 0.6)) if len(below_cap) else 0.0
+    }
+    logger.info(
+        f"Compact model built: {len(user_ids)} users, {len(dish_ids)} dishes, "
+        f"{compact_model_nbytes(compact) / 1e6:.1f} MB."
+    )
+    return compact
+
+
+def build_user_profiles(interactions, content_similarity, top_k=0, chunk_size=4096):
+    """
+    Precompute per-user activity and content-based profile vectors.
+
+    The CBF profile of a user is the mean similarity row of the dishes they purchased,
+    i.e. D^-1 B S for the binary purchase matrix B, computed as one sparse-dense product
+    over every user (in row chunks to bound working memory).
+
+    Parameters:
+        interactions (scipy.sparse.csr_matrix): Users x catalog interactions.
+        content_similarity (np.ndarray): Catalog x catalog similarity.
+        top_k (int): Keep only the top_k profile scores per user as a CSR matrix (0 keeps the
+                     full dense profile).
+        chunk_size (int): Users per product block.
+
+    Returns:
+        dict: 'interaction_totals' (float32 per user), 'purchased_indptr' / 'purchased_indices'
+              (CSR lists of purchased catalog positions) and 'cbf_profiles' (dense float32
+              [n_users, n_dishes] or CSR with top_k entries per row).
+    """
+    n_users, n_dishes = interactions.shape
+    interaction_totals = np.asarray(interactions.sum(axis=1), dtype=SCORE_DTYPE).ravel()
+
+    purchased = interactions.copy()
+    purchased.data = (purchased.data > 0).astype(SCORE_DTYPE)
+    purchased.eliminate_zeros()
+    purchased.sort_indices()
+    counts = np.diff(purchased.indptr)
+    # Row-normalize so that the product averages the similarity rows
+    inverse_counts = np.divide(1.0, counts, out=np.zeros(n_users), where=counts > 0).astype(SCORE_DTYPE)
+    mean_purchased = sp.diags(inverse_counts) @ purchased
+
+    k = min(top_k, n_dishes) if top_k else 0
+    if k:
+        data, indices = [], []
+    else:
+        profiles = np.empty((n_users, n_dishes), dtype=SCORE_DTYPE)
+    for start in range(0, n_users, chunk_size):
+        end = min(start + chunk_size, n_users)
+        block = np.asarray(mean_purchased[start:end] @ content_similarity, dtype=SCORE_DTYPE)
+        if not k:
+            profiles[start:end] = block
+            continue
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top.sort(axis=1)
+        data.append(np.take_along_axis(block, top, axis=1))
+        indices.append(top)
+    if k:
+        indices = np.vstack(indices) if indices else np.empty((0, k), dtype=np.int64)
+        data = np.vstack(data) if data else np.empty((0, k), dtype=SCORE_DTYPE)
+        profiles = sp.csr_matrix(
+            (data.ravel(), indices.ravel().astype(ID_DTYPE), np.arange(0, n_users * k + 1, k)),
+            shape=(n_users, n_dishes)
+        )
+        # Users without purchases (and dishes with no similarity) hold no entries
+        profiles.eliminate_zeros()
+
+    return {
+        'interaction_totals': interaction_totals,
+        'purchased_indptr': purchased.indptr.astype(np.int64),
+        'purchased_indices': purchased.indices.astype(ID_DTYPE),
+        'cbf_profiles': profiles
+    }
+
+
+def purchased_positions(compact, user_idx):
+    """Catalog positions the user purchased (from the precomputed CSR lists)."""
+    start, end = compact['purchased_indptr'][user_idx], compact['purchased_indptr'][user_idx + 1]
+    return compact['purchased_indices'][start:end]
+
+
+def profile_scores(profiles, user_idx, positions):
+    """
+    CBF profile scores of one user at the given catalog positions.
+
+    Works with dense profiles and with top-k CSR profiles (positions outside the top-k score 0).
+    """
+    if not sp.issparse(profiles):
+        return profiles[user_idx, positions]
+    start, end = profiles.indptr[user_idx], profiles.indptr[user_idx + 1]
+    indices, data = profiles.indices[start:end], profiles.data[start:end]
+    scores = np.zeros(len(positions), dtype=SCORE_DTYPE)
+    if len(indices):
+        found = lookup_many(indices, positions)
+        scores[found >= 0] = data[found[found >= 0]]
+    return scores
+
+
+def compact_model_nbytes(compact):
+    """Approximate memory held by a compact model (see app.memory.nbytes_of)."""
+    return nbytes_of(compact)
@@ -0,0 +1,189 @@
+# app/concurrency.py
+
+import time
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight (or queued) execution shared by every caller waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Per-key duplicate call suppression.
+
+    Concurrent calls to do() with the same key share a single execution of the function:
+    the first caller runs it, the others block until it finishes and receive the same
+    result (or exception).
+
+    Callers that must observe a write they just made pass fresh=True. They never join an
+    execution that was already running when they arrived; instead they share one follow-up
+    execution that starts as soon as the running one finishes, so a burst of fresh callers
+    still triggers at most one extra run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = {}
+        self._pending = {}
+
+    def do(self, key, fn, *args, fresh=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) once per concurrent group of callers with the same key.
+
+        Parameters:
+            key (hashable): Identifies calls that may share a result.
+            fn (callable): The function to execute.
+            fresh (bool): Only share an execution that starts after this call.
+
+        Returns:
+            The return value of fn.
+        """
+        with self._lock:
+            running = self._running.get(key)
+            if running is None:
+                call, role = _Call(), 'leader'
+                self._running[key] = call
+            elif not fresh:
+                call, role = running, 'follower'
+            elif key in self._pending:
+                call, role = self._pending[key], 'follower'
+            else:
+                call, role = _Call(), 'queued'
+                self._pending[key] = call
+
+        if role == 'follower':
+            logger.debug(f"Joining in-flight call for key {key!r}.")
+            return self._wait(call)
+        if role == 'leader':
+            return self._execute(key, call, fn, args, kwargs)
+
+        # Leader of a queued follow-up call: wait until no call is running, then start
+        while True:
+            with self._lock:
+                running = self._running.get(key)
+                if running is None:
+                    del self._pending[key]
+                    self._running[key] = call
+                    break
+            running.done.wait()
+        return self._execute(key, call, fn, args, kwargs)
+
+    def _execute(self, key, call, fn, args, kwargs):
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._running.get(key) is call:
+                    del self._running[key]
+            call.done.set()
+
+    @staticmethod
+    def _wait(call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self, key):
+        """Return True if a call for `key` is currently running."""
+        with self._lock:
+            return key in self._running
+
+
+class TaskGraph:
+    """
+    A small dependency graph of named tasks, executed on a thread pool.
+
+    Each task starts as soon as all of its dependencies have finished and receives their
+    results as positional arguments, in the order they were declared. If any task fails,
+    the first error is re-raised from run() right away: tasks that have not started yet are
+    cancelled, the running ones finish in the background and their results are discarded.
+    No partial result set is returned.
+    """
+
+    def __init__(self, name='tasks'):
+        self.name = name
+        self._tasks = {}
+
+    def add(self, name, fn, *dependencies):
+        """
+        Add a task.
+
+        Parameters:
+            name (str): Unique task name.
+            fn (callable): Called with the results of `dependencies`.
+            dependencies (str): Names of tasks added earlier (which keeps the graph acyclic).
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task '{name}' is already in the graph.")
+        missing = [dependency for dependency in dependencies if dependency not in self._tasks]
+        if missing:
+            raise ValueError(f"Task '{name}' depends on unknown tasks {missing}.")
+        self._tasks[name] = (fn, dependencies)
+        return name
+
+    def run(self, max_workers=None):
+        """
+        Execute every task.
+
+        Parameters:
+            max_workers (int, optional): Thread pool size (None: ThreadPoolExecutor default).
+
+        Returns:
+            dict: Task name -> result.
+        """
+        results, durations = {}, {}
+        waiting = dict(self._tasks)
+        running = {}
+        start = time.perf_counter()
+
+        def timed(name, fn, args):
+            task_start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                durations[name] = time.perf_counter() - task_start
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name)
+        try:
+            while waiting or running:
+                for name, (fn, dependencies) in list(waiting.items()):
+                    if all(dependency in results for dependency in dependencies):
+                        args = [results[dependency] for dependency in dependencies]
+                        # Tasks see the caller's context variables (e.g. the location being served)
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, timed, name, fn, args)] = name
+                        del waiting[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Task '{name}' of {self.name} failed: {e}")
+                        raise
+        except BaseException:
+            # Fail fast: don't wait for the tasks still running (a started future can't be cancelled)
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+
+        stages = ', '.join(f"{name}={seconds:.2f}s" for name, seconds in durations.items())
+        logger.info(f"Ran {self.name} in {time.perf_counter() - start:.2f}s ({stages}).")
+        return results
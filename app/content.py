@@ -0,0 +1,239 @@
+# app/content.py
+
+import threading
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from .compact import ID_DTYPE, SCORE_DTYPE, build_neighbor_table, lookup_many, to_id_array, update_neighbor_rows
+from .memory import nbytes_of
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ContentIndex:
+    """
+    Incrementally maintained content model over the dishes' combined feature text.
+
+    Terms are hashed (HashingVectorizer), so a dish's term counts do not depend on the rest
+    of the catalog and can be computed for added or edited dishes alone. Document
+    frequencies are kept per hashed term; the IDF weights (smoothed, as in TfidfVectorizer,
+    with the same min_df/max_df cut-offs) are frozen and only recomputed once the dishes
+    changed since the last recomputation exceed `idf_refresh_ratio` of the catalog. Between
+    IDF refreshes an update only computes the similarity rows of the changed dishes and
+    the neighbor lists that can be affected by them.
+
+    Numeric feature intensities (see app.compact.build_feature_matrix) are fused late: they
+    are standardized per feature (with statistics frozen together with the IDF), L2-normalized
+    per dish, and their cosine similarity is blended in with weight `numeric_weight`.
+    """
+
+    def __init__(self, n_features=1 << 20, min_df=2, max_df=0.8, idf_refresh_ratio=0.1, neighbors_per_dish=50,
+                 numeric_weight=0.0):
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, stop_words='english', alternate_sign=False, norm=None
+        )
+        self.min_df = min_df
+        self.max_df = max_df
+        self.idf_refresh_ratio = idf_refresh_ratio
+        self.neighbors_per_dish = neighbors_per_dish
+        self.numeric_weight = numeric_weight
+        self._lock = threading.Lock()
+
+        self.dish_ids = np.empty(0, dtype=ID_DTYPE)     # Sorted
+        self.texts = np.empty(0, dtype=object)
+        self.counts = sp.csr_matrix((0, n_features), dtype=np.float32)
+        self.document_frequency = np.zeros(n_features, dtype=np.int32)
+        self.idf = None
+        self.vectors = sp.csr_matrix((0, n_features), dtype=SCORE_DTYPE)
+        self.numeric = np.zeros((0, 0), dtype=SCORE_DTYPE)          # Raw intensities, NaN if missing
+        self.numeric_stats = None                                   # Frozen (mean, std) per feature
+        self.numeric_vectors = np.zeros((0, 0), dtype=SCORE_DTYPE)
+        self.similarity = np.zeros((0, 0), dtype=SCORE_DTYPE)
+        self.neighbors = np.empty((0, 0), dtype=ID_DTYPE)
+        self.neighbor_scores = np.empty((0, 0), dtype=SCORE_DTYPE)
+        self._changed_since_idf = 0
+
+    def nbytes_parts(self):
+        return [
+            self.texts, self.counts, self.document_frequency, self.idf, self.vectors, self.numeric,
+            self.numeric_stats, self.numeric_vectors, self.similarity, self.neighbors, self.neighbor_scores
+        ]
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index (the document frequencies alone are 4 bytes per hashed feature)."""
+        return nbytes_of(self)
+
+    def update(self, dish_ids, texts, numeric=None):
+        """
+        Bring the index in line with the current catalog.
+
+        Parameters:
+            dish_ids (array-like): Dish ids (unique).
+            texts (array-like): Combined feature text of each dish.
+            numeric (np.ndarray, optional): Numeric feature intensities, float32
+                [n_dishes, n_features] aligned with dish_ids (NaN where missing).
+
+        Returns:
+            int: Number of dishes added, edited or removed (0 if the index was reused as is).
+        """
+        with self._lock:
+            dish_ids = to_id_array(dish_ids)
+            texts = np.asarray(texts, dtype=object)
+            order = np.argsort(dish_ids, kind='stable')
+            dish_ids, texts = dish_ids[order], texts[order]
+            if numeric is None:
+                numeric = np.zeros((len(dish_ids), 0), dtype=SCORE_DTYPE)
+            numeric = np.asarray(numeric, dtype=SCORE_DTYPE)[order]
+            # A different set of numeric features changes every dish's numeric vector
+            layout_changed = numeric.shape[1] != self.numeric.shape[1]
+
+            # Old row of every new dish (-1 for added dishes), and which rows changed
+            old_rows = lookup_many(self.dish_ids, dish_ids)
+            known = old_rows >= 0
+            changed = ~known
+            changed[known] = self.texts[old_rows[known]] != texts[known]
+            if not layout_changed:
+                old_numeric = self.numeric[old_rows[known]]
+                same = (old_numeric == numeric[known]) | (np.isnan(old_numeric) & np.isnan(numeric[known]))
+                changed[known] |= ~same.all(axis=1)
+            removed = np.ones(len(self.dish_ids), dtype=bool)
+            removed[old_rows[known]] = False
+            unchanged_old_rows = old_rows[~changed]
+            n_changes = int(changed.sum() + removed.sum())
+            if n_changes == 0 and not layout_changed:
+                logger.info("Dish content unchanged. Reusing the content index.")
+                return 0
+
+            # Term counts: reuse unchanged rows, hash the changed ones
+            changed_rows = np.flatnonzero(changed)
+            changed_counts = self.vectorizer.transform(texts[changed_rows]).astype(np.float32).tocsr()
+            replaced = np.ones(len(self.dish_ids), dtype=bool)   # Old rows removed or edited
+            replaced[unchanged_old_rows] = False
+            self.document_frequency -= _binary_column_counts(self.counts[np.flatnonzero(replaced)])
+            self.document_frequency += _binary_column_counts(changed_counts)
+            counts = sp.vstack([
+                self.counts[unchanged_old_rows], changed_counts
+            ]).tocsr()
+            layout = np.concatenate([np.flatnonzero(~changed), changed_rows])
+            counts = counts[np.argsort(layout, kind='stable')]
+
+            self._changed_since_idf += n_changes
+            refresh = (self.idf is None or len(self.dish_ids) == 0 or layout_changed
+                       or self._changed_since_idf > self.idf_refresh_ratio * len(dish_ids))
+            if refresh:
+                self._rebuild(dish_ids, texts, counts, numeric)
+            else:
+                self._update_rows(dish_ids, texts, counts, numeric, old_rows, changed, removed)
+            logger.info(
+                f"Content index updated for {n_changes} changed dishes "
+                f"({'full rebuild' if refresh else 'incremental'}, {len(dish_ids)} dishes)."
+            )
+            return n_changes
+
+    def _weights(self, n_documents):
+        """Smoothed IDF per hashed term, zero for terms outside the min_df/max_df range."""
+        df = self.document_frequency
+        idf = np.log((1.0 + n_documents) / (1.0 + df)) + 1.0
+        allowed = (df >= self.min_df) & (df <= self.max_df * n_documents)
+        return np.where(allowed, idf, 0.0).astype(SCORE_DTYPE)
+
+    def _vectorize(self, counts):
+        return normalize(counts @ sp.diags(self.idf), norm='l2', copy=False).astype(SCORE_DTYPE).tocsr()
+
+    def _numeric_vectors(self, numeric):
+        """Standardize with the frozen statistics (missing values -> mean) and L2-normalize rows."""
+        mean, std = self.numeric_stats
+        standardized = np.nan_to_num((numeric - mean) / std, nan=0.0)
+        return normalize(standardized, norm='l2').astype(SCORE_DTYPE)
+
+    def _blend(self, text_similarity, numeric_similarity):
+        if self.numeric_weight <= 0 or numeric_similarity is None:
+            return text_similarity
+        return ((1 - self.numeric_weight) * text_similarity + self.numeric_weight * numeric_similarity).astype(SCORE_DTYPE)
+
+    def _rebuild(self, dish_ids, texts, counts, numeric):
+        self.idf = self._weights(len(dish_ids))
+        self._changed_since_idf = 0
+        vectors = self._vectorize(counts)
+
+        numeric_similarity = None
+        if numeric.shape[1] and len(dish_ids):
+            with np.errstate(all='ignore'):
+                mean = np.nan_to_num(np.nanmean(numeric, axis=0), nan=0.0)
+                std = np.nan_to_num(np.nanstd(numeric, axis=0), nan=0.0)
+            self.numeric_stats = (mean.astype(SCORE_DTYPE), np.where(std > 0, std, 1.0).astype(SCORE_DTYPE))
+            numeric_vectors = self._numeric_vectors(numeric)
+            numeric_similarity = numeric_vectors @ numeric_vectors.T
+        else:
+            numeric_vectors = np.zeros((len(dish_ids), numeric.shape[1]), dtype=SCORE_DTYPE)
+
+        similarity = np.ascontiguousarray(
+            self._blend((vectors @ vectors.T).toarray(), numeric_similarity), dtype=SCORE_DTYPE
+        )
+        neighbors, scores = build_neighbor_table(similarity, k=self.neighbors_per_dish)
+        self._publish(dish_ids, texts, counts, numeric, numeric_vectors, vectors, similarity, neighbors, scores)
+
+    def _update_rows(self, dish_ids, texts, counts, numeric, old_rows, changed, removed):
+        n = len(dish_ids)
+        changed_rows = np.flatnonzero(changed)
+        kept_new = np.flatnonzero(~changed)
+        kept_old = old_rows[kept_new]
+
+        # Reuse the unchanged vectors and similarities (always into new arrays: the previous
+        # ones may still be in use by the published models)
+        vectors = sp.vstack([self.vectors[kept_old], self._vectorize(counts[changed_rows])]).tocsr()
+        vectors = vectors[np.argsort(np.concatenate([kept_new, changed_rows]), kind='stable')]
+        similarity = np.zeros((n, n), dtype=SCORE_DTYPE)
+        similarity[np.ix_(kept_new, kept_new)] = self.similarity[np.ix_(kept_old, kept_old)]
+        numeric_vectors = np.zeros((n, numeric.shape[1]), dtype=SCORE_DTYPE)
+        numeric_similarity = None
+        if numeric.shape[1]:
+            numeric_vectors[kept_new] = self.numeric_vectors[kept_old]
+            numeric_vectors[changed_rows] = self._numeric_vectors(numeric[changed_rows])
+            numeric_similarity = numeric_vectors[changed_rows] @ numeric_vectors.T
+        changed_similarity = self._blend((vectors[changed_rows] @ vectors.T).toarray(), numeric_similarity)
+        changed_similarity = changed_similarity.astype(SCORE_DTYPE)
+        similarity[changed_rows] = changed_similarity
+        similarity[:, changed_rows] = changed_similarity.T
+
+        # Carry the old neighbor lists over to the new positions
+        new_position = np.full(len(self.dish_ids), -1, dtype=np.int64)
+        new_position[kept_old] = kept_new
+        k = max(0, min(self.neighbors_per_dish, n - 1))
+        neighbors = np.full((n, k), -1, dtype=ID_DTYPE)
+        scores = np.full((n, k), -np.inf, dtype=SCORE_DTYPE)
+        width = min(k, self.neighbors.shape[1])
+        old_neighbors = self.neighbors[kept_old, :width]
+        neighbors[kept_new, :width] = np.where(old_neighbors >= 0, new_position[old_neighbors], -1)
+        scores[kept_new, :width] = self.neighbor_scores[kept_old, :width]
+
+        # Lists to recompute: the changed dishes, lists that referenced a changed or removed
+        # dish (or are short), and lists a changed dish now beats the weakest neighbor of
+        is_changed = np.zeros(n, dtype=bool)
+        is_changed[changed_rows] = True
+        old_changed = np.flatnonzero(removed)
+        old_changed = np.concatenate([old_changed, old_rows[changed_rows][old_rows[changed_rows] >= 0]])
+        touched = is_changed.copy()
+        if k:
+            referenced = np.isin(self.neighbors[kept_old, :width], old_changed).any(axis=1)
+            touched[kept_new] |= referenced | (neighbors[kept_new] < 0).any(axis=1)
+            if len(changed_rows):
+                best_changed = changed_similarity.T.copy()
+                best_changed[changed_rows, np.arange(len(changed_rows))] = -np.inf
+                touched |= best_changed.max(axis=1) > scores[:, -1]
+        neighbors, scores = update_neighbor_rows(similarity, neighbors, scores, np.flatnonzero(touched), k=k)
+        self._publish(dish_ids, texts, counts, numeric, numeric_vectors, vectors, similarity, neighbors, scores)
+
+    def _publish(self, dish_ids, texts, counts, numeric, numeric_vectors, vectors, similarity, neighbors, scores):
+        self.dish_ids, self.texts, self.counts = dish_ids, texts, counts
+        self.numeric, self.numeric_vectors = numeric, numeric_vectors
+        self.vectors, self.similarity = vectors, similarity
+        self.neighbors, self.neighbor_scores = neighbors, scores
+
+
+def _binary_column_counts(counts):
+    """Number of rows with a nonzero entry in each column."""
+    return np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.int32)
@@ -0,0 +1,263 @@
+# app/cooccurrence.py
+
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from .compact import ID_DTYPE, SCORE_DTYPE, lookup_many
+from .dirty import OpenOrders
+from .memory import nbytes_of
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Orders of an OrderID range with their items and status, in OrderID order so that chunks
+# can be resumed from the last order seen; orders without items have a NULL DishID
+ORDER_BASKETS_QUERY = """
+SELECT "Order".OrderID, OrderItem.DishID, "Order".Status
+FROM "Order"
+LEFT JOIN OrderItem ON "Order".OrderID = OrderItem.OrderID
+WHERE "Order".OrderID > :last_order_id AND "Order".OrderID <= :upto
+ORDER BY "Order".OrderID
+"""
+
+# Baskets of orders that completed after the range they belong to was counted
+COMPLETED_BASKETS_QUERY = text("""
+SELECT OrderID, DishID FROM OrderItem WHERE OrderID IN :order_ids ORDER BY OrderID
+""").bindparams(bindparam('order_ids', expanding=True))
+
+LAST_ORDER_QUERY = 'SELECT COALESCE(MAX(OrderID), 0) FROM "Order"'
+
+_KEY_SHIFT = 32
+_HASH_PRIME = (1 << 61) - 1
+
+
+def pair_keys(first, second):
+    """Encode (smaller, larger) dish id pairs as int64 keys."""
+    return (first.astype(np.int64) << _KEY_SHIFT) | second.astype(np.int64)
+
+
+def split_pair_keys(keys):
+    return (keys >> _KEY_SHIFT).astype(np.int64), (keys & ((1 << _KEY_SHIFT) - 1)).astype(np.int64)
+
+
+class CountMinSketch:
+    """Fixed-size approximate counter (never under-estimates) for the long tail of pairs."""
+
+    def __init__(self, width=1 << 16, depth=4, seed=17):
+        self.width = width
+        self.depth = depth
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _HASH_PRIME, size=depth, dtype=np.int64)
+        self._b = rng.integers(0, _HASH_PRIME, size=depth, dtype=np.int64)
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def nbytes_parts(self):
+        return [self.table, self._a, self._b]
+
+    @property
+    def nbytes(self):
+        return nbytes_of(self)
+
+    def _buckets(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        # Multiply-shift style hashing in uint64 arithmetic (wrap-around is intended)
+        hashed = keys[None, :] * self._a.astype(np.uint64)[:, None] + self._b.astype(np.uint64)[:, None]
+        return ((hashed >> np.uint64(17)) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts):
+        if len(keys) == 0:
+            return
+        buckets = self._buckets(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], buckets[row], counts)
+
+    def estimate(self, keys):
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        buckets = self._buckets(keys)
+        return self.table[np.arange(self.depth)[:, None], buckets].min(axis=0)
+
+
+class CooccurrenceCounter:
+    """
+    Incrementally count how often dishes are ordered together.
+
+    Baskets are streamed from OrderItem in OrderID order. Counts are kept in a table of at
+    most `max_pairs` pairs; when that budget is exceeded the weakest pairs are moved into a
+    fixed-size count-min sketch, so memory stays bounded while their counts are not lost
+    entirely. A pair that shows up again re-enters the table with its sketch estimate as a
+    base count, so a pair that was evicted while rare can still become a served neighbor.
+    Counts are exact until the first eviction; afterwards a re-admitted pair may be
+    over-counted by the sketch error, never under-counted.
+
+    update() only reads orders newer than the last one it has seen. Orders it passed while
+    they were still open (see OpenOrders) are counted once they complete.
+    """
+
+    def __init__(self, max_pairs=2000000, max_basket_size=50, sketch_width=1 << 16, sketch_depth=4,
+                 open_statuses=('Pending',)):
+        self.max_pairs = max_pairs
+        self.max_basket_size = max_basket_size
+        self.pair_counts = pd.Series(dtype=np.int64)   # pair key -> count (base included)
+        self.pair_base = pd.Series(dtype=np.int64)     # pair key -> sketch estimate it was re-admitted with
+        self.dish_counts = pd.Series(dtype=np.int64)   # DishID -> number of baskets containing it
+        self.sketch = CountMinSketch(sketch_width, sketch_depth)
+        self.n_evicted = 0                             # Pairs moved into the sketch so far
+        self.open_orders = OpenOrders(open_statuses)
+        self.n_baskets = 0
+        self.last_order_id = 0
+        self._lock = threading.Lock()
+
+    def nbytes_parts(self):
+        return [self.pair_counts, self.pair_base, self.dish_counts, self.sketch, self.open_orders.order_ids]
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the counts, the sketch and the tracked open orders."""
+        return nbytes_of(self)
+
+    def update(self, engine, chunksize=50000):
+        """
+        Count the baskets of orders completed since the last update: orders newer than the
+        last processed order, and older orders that were still open when they were passed.
+
+        Returns:
+            int: Number of new baskets counted.
+        """
+        with self._lock:
+            new_baskets = 0
+            carry = None
+            with engine.connect() as connection:
+                upto = int(connection.execute(text(LAST_ORDER_QUERY)).scalar())
+
+                completed = self.open_orders.check(connection)
+                if not completed.empty:
+                    new_baskets += self._add_baskets(pd.read_sql(
+                        COMPLETED_BASKETS_QUERY, connection, params={'order_ids': sorted(completed['OrderID'].astype(int))}
+                    ))
+
+                chunks = pd.read_sql(
+                    text(ORDER_BASKETS_QUERY), connection,
+                    params={'last_order_id': int(self.last_order_id), 'upto': upto}, chunksize=chunksize
+                )
+                for chunk in chunks:
+                    if chunk.empty:
+                        continue
+                    if carry is not None:
+                        chunk = pd.concat([carry, chunk], ignore_index=True)
+                    # The last order may continue in the next chunk
+                    last_order = chunk['OrderID'].iloc[-1]
+                    carry = chunk[chunk['OrderID'] == last_order]
+                    new_baskets += self._add_orders(chunk[chunk['OrderID'] != last_order])
+            if carry is not None:
+                new_baskets += self._add_orders(carry)
+            self.last_order_id = max(self.last_order_id, upto)
+            logger.info(
+                f"Co-occurrence counts updated with {new_baskets} new baskets "
+                f"({len(self.pair_counts)} exact pairs, {self.n_baskets} baskets in total)."
+            )
+            return new_baskets
+
+    def _add_orders(self, rows):
+        # Rows of ORDER_BASKETS_QUERY: completed orders are counted, open ones are counted later
+        self.open_orders.add(rows)
+        completed = rows[(rows['Status'] == 'Completed') & rows['DishID'].notna()]
+        return self._add_baskets(completed[['OrderID', 'DishID']].astype(np.int64))
+
+    def _add_baskets(self, rows):
+        if rows.empty:
+            return 0
+        rows = rows.drop_duplicates(['OrderID', 'DishID'])
+
+        sizes = rows.groupby('OrderID')['DishID'].transform('size')
+        n_baskets = rows['OrderID'].nunique()
+        self.n_baskets += n_baskets
+        self.dish_counts = self.dish_counts.add(rows['DishID'].value_counts(), fill_value=0).astype(np.int64)
+
+        # Very large baskets add quadratically many weak pairs; they only count towards dish totals
+        rows = rows[sizes <= self.max_basket_size]
+        pairs = rows.merge(rows, on='OrderID')
+        pairs = pairs[pairs['DishID_x'] < pairs['DishID_y']]
+        if not pairs.empty:
+            keys = pair_keys(pairs['DishID_x'].to_numpy(), pairs['DishID_y'].to_numpy())
+            new_counts = pd.Series(keys).value_counts()
+            if self.n_evicted:
+                self._readmit(new_counts.index.difference(self.pair_counts.index))
+            self.pair_counts = self.pair_counts.add(new_counts, fill_value=0).astype(np.int64)
+            self._prune()
+        return n_baskets
+
+    def _readmit(self, keys):
+        """Start pairs entering the table at their sketch estimate (0 for pairs never evicted, up to collisions)."""
+        base = pd.Series(self.sketch.estimate(keys.to_numpy(dtype=np.int64)), index=keys)
+        base = base[base > 0]
+        if base.empty:
+            return
+        self.pair_counts = pd.concat([self.pair_counts, base])
+        self.pair_base = pd.concat([self.pair_base, base])
+
+    def _prune(self):
+        """Move the weakest pairs into the sketch once the table budget is exceeded."""
+        if len(self.pair_counts) <= self.max_pairs:
+            return
+        # Keep headroom so that pruning does not run on every chunk
+        keep = self.pair_counts.nlargest(self.max_pairs // 2).index
+        evicted = self.pair_counts.drop(keep)
+        # The sketch already holds the base of re-admitted pairs; only add what was counted since
+        base = self.pair_base.reindex(evicted.index, fill_value=0)
+        self.sketch.add(evicted.index.to_numpy(dtype=np.int64), (evicted - base).to_numpy())
+        self.n_evicted += len(evicted)
+        self.pair_counts = self.pair_counts.loc[keep]
+        self.pair_base = self.pair_base[self.pair_base.index.isin(keep)]
+        logger.info(f"Moved {len(evicted)} weak dish pairs into the count-min sketch.")
+
+    def build_index(self, dish_ids, top_k=20, measure='lift', min_count=2):
+        """
+        Top-k co-occurring dishes of every catalog dish.
+
+        Parameters:
+            dish_ids (np.ndarray): Sorted catalog dish ids the index is aligned with.
+            top_k (int): Neighbors kept per dish.
+            measure (str): 'lift' (P(a, b) / (P(a) P(b))) or 'pmi' (log of the lift).
+            min_count (int): Minimum number of shared baskets for a pair to be kept.
+
+        Returns:
+            dict: 'neighbors' (catalog positions, int32 [n_dishes, top_k], -1 padded),
+                  'scores' (float32), 'counts' (int32 shared baskets).
+        """
+        with self._lock:
+            n_dishes = len(dish_ids)
+            neighbors = np.full((n_dishes, top_k), -1, dtype=ID_DTYPE)
+            scores = np.zeros((n_dishes, top_k), dtype=SCORE_DTYPE)
+            counts = np.zeros((n_dishes, top_k), dtype=np.int32)
+            if self.pair_counts.empty or n_dishes == 0 or top_k == 0:
+                return {'neighbors': neighbors, 'scores': scores, 'counts': counts}
+
+            keys = self.pair_counts.index.to_numpy(dtype=np.int64)
+            pair_count = self.pair_counts.to_numpy()
+            first, second = split_pair_keys(keys)
+            count_first = self.dish_counts.reindex(first).fillna(0).to_numpy()
+            count_second = self.dish_counts.reindex(second).fillna(0).to_numpy()
+
+            lift = pair_count * self.n_baskets / np.maximum(count_first * count_second, 1)
+            score = np.log(lift) if measure.lower() == 'pmi' else lift
+
+            # Both directions of every pair, mapped onto catalog positions
+            source = lookup_many(dish_ids, np.concatenate([first, second]))
+            target = lookup_many(dish_ids, np.concatenate([second, first]))
+            score = np.concatenate([score, score]).astype(SCORE_DTYPE)
+            pair_count = np.concatenate([pair_count, pair_count])
+            valid = (source >= 0) & (target >= 0) & (pair_count >= min_count)
+            source, target, score, pair_count = source[valid], target[valid], score[valid], pair_count[valid]
+
+            # Sort by source, then by descending score, and keep the first top_k of every source
+            order = np.lexsort((-score, source))
+            source, target, score, pair_count = source[order], target[order], score[order], pair_count[order]
+            starts = np.searchsorted(source, source, side='left')
+            rank = np.arange(len(source)) - starts
+            kept = rank < top_k
+            neighbors[source[kept], rank[kept]] = target[kept]
+            scores[source[kept], rank[kept]] = score[kept]
+            counts[source[kept], rank[kept]] = pair_count[kept]
+            return {'neighbors': neighbors, 'scores': scores, 'counts': counts}
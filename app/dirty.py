@@ -0,0 +1,288 @@
+# app/dirty.py
+
+import time
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from .compact import lookup_many
+import logging
+
+logger = logging.getLogger(__name__)
+
+# New rows since the last scan; rowid watermarks, as in the snapshot fingerprint queries
+NEW_RATINGS_QUERY = """
+SELECT Customer.UserID, MAX(UserRating.rowid) AS LastRowID
+FROM UserRating
+JOIN Customer ON UserRating.CustomerID = Customer.CustomerID
+WHERE UserRating.rowid > :last_rowid
+GROUP BY Customer.UserID
+"""
+
+NEW_PREFERENCES_QUERY = """
+SELECT UserID, MAX(rowid) AS LastRowID
+FROM UserPreference
+WHERE rowid > :last_rowid
+GROUP BY UserID
+"""
+
+# Orders placed since the last scan, with their status
+NEW_ORDERS_QUERY = """
+SELECT "Order".OrderID, Customer.UserID, "Order".Status
+FROM "Order"
+JOIN Customer ON "Order".CustomerID = Customer.CustomerID
+WHERE "Order".OrderID > :last_order_id
+"""
+
+# Current status of orders seen open earlier (deleted orders are simply not returned)
+ORDER_STATUS_QUERY = text("""
+SELECT "Order".OrderID, Customer.UserID, "Order".Status
+FROM "Order"
+LEFT JOIN Customer ON "Order".CustomerID = Customer.CustomerID
+WHERE "Order".OrderID IN :order_ids
+""").bindparams(bindparam('order_ids', expanding=True))
+
+OPEN_ORDERS_QUERY = text("""
+SELECT OrderID FROM "Order" WHERE Status IN :statuses AND OrderID > :after AND OrderID <= :upto
+""").bindparams(bindparam('statuses', expanding=True))
+
+WATERMARKS_QUERY = """
+SELECT
+    (SELECT COALESCE(MAX(rowid), 0) FROM UserRating),
+    (SELECT COALESCE(MAX(rowid), 0) FROM UserPreference),
+    (SELECT COALESCE(MAX(OrderID), 0) FROM "Order")
+"""
+
+STORED_USERS_QUERY = "SELECT DISTINCT UserID FROM DishRecommendation"
+
+USERS_WITH_DISHES_QUERY = text(
+    "SELECT DISTINCT UserID FROM DishRecommendation WHERE DishID IN :dish_ids"
+).bindparams(bindparam('dish_ids', expanding=True))
+
+# Per-dish availability levels compared between scans
+OUT_OF_STOCK, LOW_STOCK, IN_STOCK = 0, 1, 2
+
+# Reasons that only depend on live specials/inventory, not on the trained models
+RULE_DATA_REASONS = frozenset({'dish_available', 'dish_unavailable'})
+
+
+class OpenOrders:
+    """
+    Orders behind an OrderID watermark that were still open when the watermark passed them.
+
+    Only orders in one of `statuses` (e.g. 'Pending') are tracked, since only those can still
+    complete. check() drops every tracked order that is no longer open, whether it completed,
+    was cancelled or refunded, or was deleted, so the set stays as small as the open backlog.
+    """
+
+    def __init__(self, statuses=('Pending',)):
+        self.statuses = tuple(statuses)
+        self.order_ids = set()
+
+    def add(self, orders):
+        """Track the open ones of already read orders (a DataFrame with OrderID and Status)."""
+        self.order_ids.update(orders.loc[orders['Status'].isin(self.statuses), 'OrderID'].astype(int))
+
+    def add_range(self, connection, after, upto):
+        """Track the open orders with after < OrderID <= upto."""
+        if not self.statuses:
+            return
+        open_orders = pd.read_sql(
+            OPEN_ORDERS_QUERY, connection, params={'statuses': list(self.statuses), 'after': after, 'upto': upto}
+        )
+        self.order_ids.update(open_orders['OrderID'].astype(int))
+
+    def check(self, connection):
+        """
+        Re-read the tracked orders and stop tracking the ones that are no longer open.
+
+        Returns:
+            pd.DataFrame: OrderID and UserID of the tracked orders completed since the last check.
+        """
+        if not self.order_ids:
+            return pd.DataFrame({'OrderID': pd.Series(dtype=np.int64), 'UserID': pd.Series(dtype=np.int64)})
+        orders = pd.read_sql(ORDER_STATUS_QUERY, connection, params={'order_ids': sorted(self.order_ids)})
+        self.order_ids = set(orders.loc[orders['Status'].isin(self.statuses), 'OrderID'].astype(int))
+        return orders.loc[orders['Status'] == 'Completed', ['OrderID', 'UserID']]
+
+    def __len__(self):
+        return len(self.order_ids)
+
+
+class DirtyUserTracker:
+    """
+    Track which users' stored recommendations may no longer match their inputs.
+
+    A user becomes dirty when they rate a dish, complete an order or update their preferences,
+    or when a dish in their stored top-N runs out of stock, drops below the low-stock threshold
+    or ends its special. A dish that comes back in stock or starts a special can enter anyone's
+    top-N, so it dirties every user with stored recommendations. Users that are not dirty are
+    still regenerated once their recommendations are older than `staleness_bound` seconds.
+
+    Changes are detected by scan() from rowid/OrderID watermarks and by diffing the specials
+    and inventory against the previous scan; writers in this process can also call mark().
+    The first scan only records the watermarks.
+    """
+
+    def __init__(self, staleness_bound=86400, low_stock_threshold=5, open_statuses=('Pending',)):
+        self.staleness_bound = staleness_bound
+        self.low_stock_threshold = low_stock_threshold
+        self._lock = threading.Lock()
+        self._dirty = {}          # UserID -> (first marked at, set of reasons)
+        self._generated_at = {}   # UserID -> when its stored recommendations were written
+        self._watermarks = None   # (last rating rowid, last preference rowid, last OrderID)
+        self._open_orders = OpenOrders(open_statuses)   # Orders that may still complete
+        self._dish_state = None   # (dish_ids, availability levels, special mask) of the last scan
+
+    def mark(self, user_ids, reason):
+        """Mark users as dirty, remembering why."""
+        now = time.time()
+        with self._lock:
+            for user_id in user_ids:
+                _, reasons = self._dirty.setdefault(int(user_id), (now, set()))
+                reasons.add(reason)
+
+    def mark_generated(self, user_id):
+        """Record that the user's recommendations were just regenerated."""
+        with self._lock:
+            self._dirty.pop(int(user_id), None)
+            self._generated_at[int(user_id)] = time.time()
+
+    def scan(self, engine, rule_context=None):
+        """
+        Mark the users affected by changes since the previous scan.
+
+        Parameters:
+            engine (sqlalchemy.Engine): Database engine.
+            rule_context (RuleContext, optional): Freshly loaded specials and inventory.
+
+        Returns:
+            int: Number of users marked dirty by this scan.
+        """
+        marked = {}
+        with engine.connect() as connection:
+            if self._watermarks is None:
+                self._watermarks = tuple(int(value) for value in connection.execute(text(WATERMARKS_QUERY)).fetchone())
+                self._open_orders.add_range(connection, 0, self._watermarks[2])
+                logger.info(f"Dirty-user tracking starts at watermarks {self._watermarks}.")
+            else:
+                last_rating, last_preference, last_order = self._watermarks
+
+                ratings = pd.read_sql(text(NEW_RATINGS_QUERY), connection, params={'last_rowid': last_rating})
+                marked['ratings'] = ratings['UserID']
+                if not ratings.empty:
+                    last_rating = int(ratings['LastRowID'].max())
+
+                preferences = pd.read_sql(text(NEW_PREFERENCES_QUERY), connection, params={'last_rowid': last_preference})
+                marked['preferences'] = preferences['UserID']
+                if not preferences.empty:
+                    last_preference = int(preferences['LastRowID'].max())
+
+                orders = pd.read_sql(text(NEW_ORDERS_QUERY), connection, params={'last_order_id': last_order})
+                completed_users = [orders.loc[orders['Status'] == 'Completed', 'UserID']]
+                # Orders passed while open: the ones completed since, then the newly passed ones
+                completed_users.append(self._open_orders.check(connection)['UserID'])
+                self._open_orders.add(orders)
+                if not orders.empty:
+                    last_order = int(orders['OrderID'].max())
+                marked['orders'] = pd.concat(completed_users)
+
+                self._watermarks = (last_rating, last_preference, last_order)
+
+            if rule_context is not None:
+                marked.update(self._scan_dishes(connection, rule_context))
+
+        counts = {}
+        for reason, user_ids in marked.items():
+            user_ids = pd.unique(pd.Series(user_ids).dropna().astype(np.int64))
+            if len(user_ids):
+                self.mark(user_ids, reason)
+                counts[reason] = len(user_ids)
+        if counts:
+            summary = ', '.join(f"{reason}={count}" for reason, count in counts.items())
+            logger.info(f"Dirty-user scan marked users for: {summary}.")
+        return sum(counts.values())
+
+    def _scan_dishes(self, connection, rule_context):
+        """Users affected by specials and stock changes since the previous scan."""
+        dish_ids = rule_context.dish_ids
+        levels = np.full(len(dish_ids), IN_STOCK, dtype=np.int8)
+        levels[rule_context.quantity < self.low_stock_threshold] = LOW_STOCK
+        levels[rule_context.quantity <= 0] = OUT_OF_STOCK
+        specials = rule_context.special_mask.copy()
+
+        previous, self._dish_state = self._dish_state, (dish_ids, levels, specials)
+        if previous is None:
+            return {}
+        previous_ids, previous_levels, previous_specials = previous
+        positions = lookup_many(previous_ids, dish_ids)
+        known = positions >= 0
+        old_levels = np.where(known, previous_levels[np.maximum(positions, 0)], levels)
+        old_specials = np.where(known, previous_specials[np.maximum(positions, 0)], specials)
+
+        entering = (levels > old_levels) | (specials & ~old_specials)
+        leaving = (levels < old_levels) | (~specials & old_specials)
+        if entering.any():
+            users = pd.read_sql(text(STORED_USERS_QUERY), connection)['UserID']
+            return {'dish_available': users}
+        if leaving.any():
+            changed = [int(dish_id) for dish_id in dish_ids[leaving]]
+            users = pd.read_sql(USERS_WITH_DISHES_QUERY, connection, params={'dish_ids': changed})['UserID']
+            return {'dish_unavailable': users}
+        return {}
+
+    def due_users(self, engine, limit=None, reasons=None, include_stale=None):
+        """
+        Users whose stored recommendations should be regenerated now.
+
+        Only users that have stored recommendations are returned (the others get theirs
+        generated on their next request): dirty users first, oldest first, then users whose
+        recommendations are older than the staleness bound. Dirty users without stored
+        recommendations are dropped.
+
+        Parameters:
+            engine (sqlalchemy.Engine): Database engine.
+            limit (int, optional): Maximum number of users to return.
+            reasons (set, optional): Only return dirty users all of whose reasons are in
+                this set.
+            include_stale (bool, optional): Also return users past the staleness bound
+                (defaults to True when `reasons` is not given).
+
+        Returns:
+            list: (UserID, reason) tuples.
+        """
+        with engine.connect() as connection:
+            stored = set(pd.read_sql(text(STORED_USERS_QUERY), connection)['UserID'].astype(int))
+        now = time.time()
+        with self._lock:
+            # Recommendations of unknown age (written before startup) start their staleness clock now
+            for user_id in stored.difference(self._generated_at):
+                self._generated_at[user_id] = now
+            for user_id in set(self._dirty).difference(stored):
+                del self._dirty[user_id]
+
+            dirty = sorted(self._dirty.items(), key=lambda item: item[1][0])
+            due = [
+                (user_id, ','.join(sorted(user_reasons))) for user_id, (_, user_reasons) in dirty
+                if reasons is None or user_reasons <= reasons
+            ]
+            if include_stale is None:
+                include_stale = reasons is None
+            if not include_stale:
+                return due[:limit] if limit else due
+            stale = sorted(
+                (generated_at, user_id) for user_id, generated_at in self._generated_at.items()
+                if user_id in stored and user_id not in self._dirty
+                and now - generated_at > self.staleness_bound
+            )
+            due.extend((user_id, 'stale') for _, user_id in stale)
+        return due[:limit] if limit else due
+
+    def stats(self):
+        """Return the number of dirty users, of users with known recommendation age and of tracked open orders."""
+        with self._lock:
+            return {
+                'dirty_users': len(self._dirty),
+                'tracked_users': len(self._generated_at),
+                'open_orders': len(self._open_orders)
+            }
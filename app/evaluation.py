@@ -0,0 +1,361 @@
+# app/evaluation.py
+
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .compact import compact_model_nbytes
+from .content import ContentIndex
+from .cooccurrence import CooccurrenceCounter
+from .rules import RuleContextCache
+from .models import TOP_N
+from .utils import extract_order_events
+from . import services
+from config.config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FoldSnapshot:
+    """In-memory stand-in for a Snapshot that holds the training tables of one fold."""
+
+    def __init__(self, version, tables):
+        self.version = version
+        self.tables = tables
+
+    def frame(self, table):
+        """Return a copy of `table` (an empty DataFrame if the fold has no such table)."""
+        return self.tables.get(table, pd.DataFrame()).copy()
+
+    def iter_chunks(self, table, chunksize=50000):
+        """Yield `table` in DataFrames of at most `chunksize` rows."""
+        frame = self.tables.get(table, pd.DataFrame())
+        for start in range(0, len(frame), chunksize):
+            yield frame.iloc[start:start + chunksize].reset_index(drop=True)
+
+
+class Fold:
+    """Training data, test users and their relevant dishes of one time-based split."""
+
+    def __init__(self, index, cutoff, end, snapshot, baskets, relevant):
+        self.index = index
+        self.cutoff = cutoff          # Training data is strictly older than this
+        self.end = end                # Test window: [cutoff, end)
+        self.snapshot = snapshot
+        self.baskets = baskets        # Training baskets (OrderID, DishID)
+        self.relevant = relevant      # UserID -> dish ids first ordered in the test window
+
+
+class _TrainingBaskets(CooccurrenceCounter):
+    """Co-occurrence counts of a fold's training baskets; update() never reads the database."""
+
+    def __init__(self, baskets):
+        super().__init__(max_pairs=Config.COOCCURRENCE_MAX_PAIRS)
+        self._add_baskets(baskets)
+
+    def update(self, engine, chunksize=50000):
+        return 0
+
+
+class EvaluationState:
+    """Location state used to train and query one fold in isolation (see services.use_location())."""
+
+    def __init__(self, fold, location=None):
+        self.name = f"evaluation-fold-{fold.index}"
+        self.engine = services.location_engine(location or Config.DEFAULT_LOCATION)
+        self.snapshot_dir = None
+        self.models = {}
+        self.rule_contexts = RuleContextCache(ttl=Config.RULE_DATA_TTL)
+        self.cooccurrence_counter = _TrainingBaskets(fold.baskets)
+        self.content_index = ContentIndex(
+            idf_refresh_ratio=Config.CONTENT_IDF_REFRESH_RATIO, neighbors_per_dish=Config.NEIGHBORS_PER_DISH,
+            numeric_weight=Config.NUMERIC_FEATURE_WEIGHT
+        )
+        self.dirty_users = None
+        self.serving_store = None
+
+
+def build_folds(snapshot, events, n_folds=3):
+    """
+    Time-based expanding-window splits of the completed orders.
+
+    The order dates are cut at the quantiles 1/(n+1), ..., n/(n+1). Fold i trains on the
+    orders before cutoff i and tests on the orders up to the next cutoff (the last fold up
+    to the latest order). Relevant dishes are the ones a user ordered in the test window
+    but had not ordered or rated before. Ratings carry no timestamp and are part of every
+    training set.
+
+    Parameters:
+        snapshot (Snapshot): The extracted data (ratings, dish features, preferences, ...).
+        events (pd.DataFrame): Completed order lines from extract_order_events().
+        n_folds (int): Number of folds.
+
+    Returns:
+        list: Fold objects, oldest cutoff first.
+    """
+    events = events.sort_values('OrderDate', kind='stable').reset_index(drop=True)
+    ratings = snapshot.frame('ratings')
+    dates = events['OrderDate']
+    boundaries = list(dates.quantile([(i + 1) / (n_folds + 1) for i in range(n_folds)]))
+    boundaries.append(dates.max() + pd.Timedelta(seconds=1))
+
+    shared = {
+        table: snapshot.frame(table)
+        for table in ('dish_features', 'dish_categories', 'dish_feature_values', 'preferences')
+    }
+    folds = []
+    for index in range(n_folds):
+        cutoff, end = boundaries[index], boundaries[index + 1]
+        train = events[dates < cutoff]
+        test = events[(dates >= cutoff) & (dates < end)]
+
+        orders = train.groupby(['UserID', 'DishID']).size().rename('PurchaseCount').reset_index()
+        # Popularity as of the cutoff, so that test-window orders do not leak into the ranking
+        popularity = pd.DataFrame({'DishID': shared['dish_features']['DishID'].unique()})
+        popularity = popularity.merge(
+            train.groupby('DishID').size().rename('OrderCount').reset_index(), on='DishID', how='left'
+        ).merge(
+            ratings.groupby('DishID')['Rating'].mean().rename('AverageRating').reset_index(), on='DishID', how='left'
+        ).fillna(0)
+
+        seen = pd.concat([orders[['UserID', 'DishID']], ratings[['UserID', 'DishID']]]).drop_duplicates()
+        test_pairs = test[['UserID', 'DishID']].drop_duplicates().merge(
+            seen, on=['UserID', 'DishID'], how='left', indicator=True
+        )
+        test_pairs = test_pairs[test_pairs['_merge'] == 'left_only']
+        trained_users = set(seen['UserID'].astype(int))
+        relevant = {
+            int(user_id): dishes.to_numpy(dtype=np.int64)
+            for user_id, dishes in test_pairs.groupby('UserID')['DishID']
+            if int(user_id) in trained_users
+        }
+
+        tables = dict(shared, ratings=ratings, orders=orders, dish_popularity=popularity)
+        fold_snapshot = FoldSnapshot(f"evaluation-{index}-{cutoff:%Y%m%dT%H%M%S}", tables)
+        folds.append(Fold(index, cutoff, end, fold_snapshot, train[['OrderID', 'DishID']], relevant))
+        logger.info(
+            f"Fold {index}: {len(train)} training order lines before {cutoff}, "
+            f"{len(relevant)} test users with new dishes before {end}."
+        )
+    return folds
+
+
+def ranking_metrics(recommended, relevant, k):
+    """
+    Precision@k, recall@k and NDCG@k (binary relevance) of one ranked list.
+
+    Parameters:
+        recommended (np.ndarray): Recommended dish ids, best first.
+        relevant (np.ndarray): Relevant dish ids.
+        k (int): Cut-off.
+
+    Returns:
+        tuple: (precision, recall, ndcg).
+    """
+    hits = np.isin(np.asarray(recommended)[:k], relevant)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = float(discounts[:len(hits)][hits].sum())
+    idcg = float(discounts[:min(k, len(relevant))].sum())
+    n_hits = int(hits.sum())
+    return n_hits / k, n_hits / len(relevant), dcg / idcg if idcg > 0 else 0.0
+
+
+# Config attributes an evaluation grid may vary: settings read while a fold is trained or
+# queried that change what is trained or how it is ranked. Anything else (serving, scheduling,
+# storage, or read once per process like TOP_N) would silently report the defaults, so it is
+# rejected; a new setting can be evaluated once it is listed here.
+TUNABLE_PREFIXES = (
+    'CF_', 'ALS_', 'CBF_', 'CANDIDATE', 'COOCCURRENCE_', 'SIMILAR_', 'COLD_START_', 'SEGMENT_',
+    'RERANK_', 'EXPLORATION_'
+)
+TUNABLE_PARAMETERS = frozenset({
+    'TRAINING_MODE', 'STREAMING_CHUNK_SIZE', 'NEIGHBORS_PER_DISH', 'NUMERIC_FEATURE_WEIGHT',
+    'BUSINESS_RULES', 'DIETARY_PENALTY', 'PROMOTION_BOOST', 'LOW_STOCK_THRESHOLD', 'LOW_STOCK_PENALTY',
+    'MAX_PER_CATEGORY', 'MMR_LAMBDA'
+})
+
+
+def is_tunable(name):
+    """Whether an evaluation grid may vary the Config attribute `name`."""
+    return name in TUNABLE_PARAMETERS or name.startswith(TUNABLE_PREFIXES)
+
+
+def parameter_grid(grid):
+    """
+    Expand {Config attribute: [values]} into one override dict per combination.
+
+    Raises:
+        ValueError: If a name is not a Config attribute or not tunable (see is_tunable()).
+    """
+    unknown = [name for name in grid if not hasattr(Config, name)]
+    if unknown:
+        raise ValueError(f"Unknown configuration parameters {unknown}.")
+    fixed = sorted(name for name in grid if not is_tunable(name))
+    if fixed:
+        raise ValueError(f"Configuration parameters {fixed} have no effect on an evaluation run.")
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))] or [{}]
+
+
+# Per worker process: the folds (sent once) and the Config values before any override
+_folds = []
+_location = None
+_defaults = {}
+
+
+def _init_worker(folds, location):
+    global _folds, _location
+    _folds, _location = folds, location
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+
+def _apply_overrides(overrides):
+    """Apply one configuration to Config (restoring values overridden by earlier tasks)."""
+    for name, value in _defaults.items():
+        setattr(Config, name, value)
+    for name, value in overrides.items():
+        _defaults.setdefault(name, getattr(Config, name))
+        setattr(Config, name, value)
+    # Built from Config at import time; everything else is read when a fold is trained or queried
+    services.candidate_generators = services.build_candidate_generators()
+    services.rules_engine = services.build_rules_engine()
+
+
+def _evaluate(fold_index, overrides, k, max_users, seed):
+    """Train one configuration on one fold and query it for the fold's test users."""
+    fold = _folds[fold_index]
+    _apply_overrides(overrides)
+    state = EvaluationState(fold, _location)
+    with services.use_location(state):
+        start = time.perf_counter()
+        trained = services.train_models(fold.snapshot)
+        train_seconds = time.perf_counter() - start
+        state.models.update(trained)
+        state.models['snapshot_version'] = fold.snapshot.version
+
+        users = np.array(sorted(fold.relevant), dtype=np.int64)
+        if max_users and len(users) > max_users:
+            users = np.sort(np.random.default_rng(seed).choice(users, max_users, replace=False))
+
+        scores, latencies, recommended = [], [], set()
+        for user_id in users:
+            start = time.perf_counter()
+            recommendations = services.generate_hybrid_recommendations(int(user_id))
+            latencies.append(time.perf_counter() - start)
+            dish_ids = recommendations['DishID'].to_numpy() if not recommendations.empty else np.empty(0)
+            recommended.update(int(dish_id) for dish_id in dish_ids[:k])
+            scores.append(ranking_metrics(dish_ids, fold.relevant[int(user_id)], k))
+
+    scores = np.array(scores, dtype=np.float64).reshape(-1, 3)
+    return {
+        'fold': fold_index,
+        'parameters': overrides,
+        'users': len(users),
+        'precision': float(scores[:, 0].mean()) if len(scores) else 0.0,
+        'recall': float(scores[:, 1].mean()) if len(scores) else 0.0,
+        'ndcg': float(scores[:, 2].mean()) if len(scores) else 0.0,
+        'coverage': len(recommended) / max(len(trained['dish_ids']), 1),
+        'train_seconds': train_seconds,
+        'model_bytes': compact_model_nbytes(trained),
+        'latencies': latencies
+    }
+
+
+def evaluate(grid=None, n_folds=3, k=10, max_users=200, workers=None, location=None, seed=0):
+    """
+    Cross-validate configurations offline and report quality next to cost.
+
+    Every (fold, configuration) pair is trained with the production build
+    (services.train_models) and queried through generate_hybrid_recommendations on a
+    process pool. Configurations are Config overrides, e.g. {'CF_COMPONENTS': [20, 50],
+    'CANDIDATES_PER_GENERATOR': [50, 200]}. Business rules use the current specials and
+    inventory. Lists hold at most TOP_N dishes, so k cannot exceed it. Settings that an
+    evaluation run cannot vary (see is_tunable()) are rejected.
+
+    Parameters:
+        grid (dict, optional): Config attribute -> values to try (None: the current configuration).
+        n_folds (int): Number of time-based folds (see build_folds()).
+        k (int): Cut-off of the ranking metrics.
+        max_users (int): Test users sampled per fold (0 = all).
+        workers (int, optional): Worker processes (None: one per CPU).
+        location (str, optional): Location to evaluate (defaults to Config.DEFAULT_LOCATION).
+        seed (int): Seed of the test-user sample.
+
+    Returns:
+        list: One dict per configuration with its parameters, the fold means of precision,
+              recall, ndcg, coverage, train_seconds and model_bytes, and latency_p50_ms /
+              latency_p95_ms over all queried users.
+    """
+    if not 1 <= k <= TOP_N:
+        raise ValueError(f"k must be between 1 and TOP_N ({TOP_N}); recommendation lists hold at most TOP_N dishes.")
+    configurations = parameter_grid(grid or {})
+    with services.location_scope(location):
+        snapshot = services.refresh_snapshot()
+        if snapshot is None:
+            raise ValueError("No training data snapshot available.")
+        events = extract_order_events(services.current_location().engine)
+    if events.empty:
+        raise ValueError("No dated completed orders to split.")
+    folds = build_folds(snapshot, events, n_folds=n_folds)
+
+    logger.info(f"Evaluating {len(configurations)} configurations on {n_folds} folds.")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(folds, location)) as executor:
+        futures = [
+            executor.submit(_evaluate, fold.index, overrides, k, max_users, seed)
+            for overrides in configurations for fold in folds
+        ]
+        runs = [future.result() for future in futures]
+
+    report = []
+    for overrides in configurations:
+        config_runs = [run for run in runs if run['parameters'] == overrides]
+        latencies = np.concatenate([run['latencies'] for run in config_runs]) * 1000
+        entry = {'parameters': overrides, 'folds': len(config_runs), 'users': sum(run['users'] for run in config_runs)}
+        for metric in ('precision', 'recall', 'ndcg', 'coverage', 'train_seconds', 'model_bytes'):
+            entry[metric] = float(np.mean([run[metric] for run in config_runs]))
+        entry['latency_p50_ms'] = float(np.percentile(latencies, 50)) if len(latencies) else None
+        entry['latency_p95_ms'] = float(np.percentile(latencies, 95)) if len(latencies) else None
+        report.append(entry)
+    return report
+
+
+def format_report(report, k=10):
+    """Render evaluate() results as a text table."""
+    header = (f"{'parameters':<48} {'P@' + str(k):>7} {'R@' + str(k):>7} {'NDCG':>7} {'cover':>7} "
+              f"{'train s':>8} {'model MB':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    lines = [header, '-' * len(header)]
+    for entry in report:
+        parameters = ', '.join(f"{name}={value}" for name, value in entry['parameters'].items()) or '(current)'
+        lines.append(
+            f"{parameters:<48} {entry['precision']:>7.4f} {entry['recall']:>7.4f} {entry['ndcg']:>7.4f} "
+            f"{entry['coverage']:>7.3f} {entry['train_seconds']:>8.2f} {entry['model_bytes'] / 1e6:>9.2f} "
+            f"{entry['latency_p50_ms'] or 0:>7.2f} {entry['latency_p95_ms'] or 0:>7.2f}"
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline evaluation of recommendation configurations.")
+    parser.add_argument('--grid', default='{}', help='JSON object: Config attribute -> list of values.')
+    parser.add_argument('--folds', type=int, default=Config.EVALUATION_FOLDS)
+    parser.add_argument('--k', type=int, default=Config.EVALUATION_K)
+    parser.add_argument('--max-users', type=int, default=Config.EVALUATION_MAX_USERS)
+    parser.add_argument('--workers', type=int, default=Config.EVALUATION_WORKERS or None)
+    parser.add_argument('--location', default=None)
+    parser.add_argument('--output', default=None, help='Also write the report as JSON to this file.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    logging.getLogger('app.services').setLevel(logging.WARNING)
+    results = evaluate(
+        json.loads(args.grid), n_folds=args.folds, k=args.k, max_users=args.max_users,
+        workers=args.workers, location=args.location
+    )
+    print(format_report(results, k=args.k))
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
@@ -0,0 +1,67 @@
+# app/exploration.py
+
+import time
+import hashlib
+import numpy as np
+from .compact import SCORE_DTYPE
+import logging
+
+logger = logging.getLogger(__name__)
+
+# SplitMix64 constants
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def exploration_bucket(period, now=None):
+    """Index of the rotation period `now` falls in (always 0 if period is 0: never rotate)."""
+    if period <= 0:
+        return 0
+    return int((time.time() if now is None else now) // period)
+
+
+def exploration_seed(user_id, model_version, bucket):
+    """Stable 64-bit seed of a (user, model version, time bucket) triple."""
+    key = f"{int(user_id)}:{model_version}:{bucket}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def splitmix64(values):
+    """SplitMix64 finalizer over a uint64 array (wrap-around arithmetic is intended)."""
+    z = values + _GOLDEN_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * _MIX_1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_2
+    return z ^ (z >> np.uint64(31))
+
+
+def exploration_noise(user_id, model_version, positions, strength=0.3, period=3600, now=None):
+    """
+    Deterministic exploration noise for a user's candidates.
+
+    Every (user, model version, time bucket) gets a seed, and a dish's noise is a uniform
+    value in [0, strength) hashed from the seed and its catalog position. A dish therefore
+    gets the same noise whatever the candidate set looks like, at a cost proportional to the
+    number of candidates. Within a bucket the same inputs rank identically. The noise
+    changes when the models are retrained or the bucket rotates.
+
+    Parameters:
+        user_id (int): The ID of the user.
+        model_version (str): Version of the models (e.g. the snapshot version).
+        positions (np.ndarray): Catalog positions of the candidates.
+        strength (float): Upper bound of the noise (0 disables it).
+        period (int): Seconds per rotation bucket (0 = never rotate).
+        now (float, optional): Timestamp to use instead of the current time.
+
+    Returns:
+        np.ndarray: float32 noise aligned with positions.
+    """
+    if strength <= 0:
+        return np.zeros(len(positions), dtype=SCORE_DTYPE)
+    seed = np.array([exploration_seed(user_id, model_version, exploration_bucket(period, now))], dtype=np.uint64)
+    # One SplitMix64 step per (seed, position): the seed is mixed first so that consecutive
+    # positions of different users do not share a stream
+    hashed = splitmix64(splitmix64(seed) ^ np.asarray(positions, dtype=np.uint64))
+    # Top 24 bits -> uniform float32 in [0, 1)
+    uniform = (hashed >> np.uint64(40)).astype(np.float32) * np.float32(2.0 ** -24)
+    return (np.float32(strength) * uniform).astype(SCORE_DTYPE)
@@ -0,0 +1,105 @@
+# app/fallback.py
+
+import time
+import threading
+from sqlalchemy import text
+from .models import TOP_N, create_location_engine, get_engine
+from .registry import validate_location
+from config.config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# In-stock dishes by popularity (order count + 2 x average rating, as in the models), with the
+# display columns of the stored recommendations
+POPULAR_DISHES_QUERY = """
+WITH stock AS (
+    SELECT DishIngredient.DishID, SUM(Storage.Quantity) AS TotalQuantity
+    FROM DishIngredient
+    JOIN Storage ON DishIngredient.IngredientID = Storage.IngredientID
+    GROUP BY DishIngredient.DishID
+),
+orders AS (
+    SELECT DishID, COUNT(*) AS OrderCount FROM OrderItem GROUP BY DishID
+),
+ratings AS (
+    SELECT DishID, AVG(Rating) AS AverageRating FROM UserRating GROUP BY DishID
+)
+SELECT
+    Dish.DishID, Dish.Name, Dish.Description, Dish.Price, Dish.ImageURL,
+    COALESCE(orders.OrderCount, 0) + 2 * COALESCE(ratings.AverageRating, 0) AS Score,
+    stock.TotalQuantity
+FROM Dish
+JOIN stock ON Dish.DishID = stock.DishID
+LEFT JOIN orders ON Dish.DishID = orders.DishID
+LEFT JOIN ratings ON Dish.DishID = ratings.DishID
+WHERE stock.TotalQuantity > 0
+ORDER BY Score DESC, Dish.DishID
+LIMIT :limit
+"""
+
+
+class PopularityFallback:
+    """
+    Popular dishes per location, served while the recommendation models are loading.
+
+    Reads the database directly (no pandas or trained models) and caches each location's
+    list for `ttl` seconds.
+    """
+
+    def __init__(self, ttl=60, list_size=50):
+        self.ttl = ttl
+        self.list_size = list_size
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._lists = {}   # Location -> (expires at, rows)
+
+    def _engine(self, location):
+        engine = self._engines.get(location)
+        if engine is None:
+            if location == Config.DEFAULT_LOCATION:
+                engine = get_engine()
+            else:
+                engine = create_location_engine(Config.LOCATION_DATABASE_URI.format(location=location))
+            self._engines[location] = engine
+        return engine
+
+    def popular_dishes(self, location=None, limit=None, exclude=None):
+        """
+        Return the location's most popular in-stock dishes.
+
+        Parameters:
+            location (str, optional): Location name (defaults to Config.DEFAULT_LOCATION).
+            limit (int, optional): Maximum number of dishes (defaults to TOP_N).
+            exclude (int, optional): Dish id to leave out.
+
+        Returns:
+            list: Dicts with DishID, Name, Description, Price, ImageURL, Score, TotalQuantity
+                  and Reason, best first (empty if the database cannot be read).
+
+        Raises:
+            ValueError: If the location name is invalid.
+            LookupError: If the location has no database.
+        """
+        location = validate_location(location or Config.DEFAULT_LOCATION)
+        with self._lock:
+            engine = self._engine(location)
+            cached = self._lists.get(location)
+        if cached is None or cached[0] <= time.time():
+            try:
+                with engine.connect() as connection:
+                    rows = [
+                        dict(row._mapping, Reason='Popular Dish')
+                        for row in connection.execute(text(POPULAR_DISHES_QUERY), {'limit': self.list_size})
+                    ]
+            except Exception as e:
+                logger.error(f"Error retrieving popular dishes of location '{location}': {e}")
+                return []
+            cached = (time.time() + self.ttl, rows)
+            with self._lock:
+                self._lists[location] = cached
+        return [dict(row) for row in cached[1] if row['DishID'] != exclude][:limit or TOP_N]
+
+
+# Popular dishes served until /readyz goes green
+popularity_fallback = PopularityFallback(ttl=Config.FALLBACK_TTL, list_size=Config.FALLBACK_LIST_SIZE)
@@ -0,0 +1,86 @@
+# app/group.py
+
+import numpy as np
+import scipy.sparse as sp
+from .compact import BITSET_DTYPE, SCORE_DTYPE, lookup_many
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How member scores are combined into one group score per dish
+GROUP_STRATEGIES = {
+    'average': lambda scores: scores.mean(axis=0),
+    'least_misery': lambda scores: scores.min(axis=0),    # The least happy member decides
+    'most_pleasure': lambda scores: scores.max(axis=0),   # The happiest member decides
+}
+
+
+def group_member_scores(model, user_ids):
+    """
+    Score the whole catalog for every member of a group in one batch.
+
+    Members with interactions get the hybrid score (dynamic alpha * CF + beta * CBF profile),
+    computed as one matrix product over the latent factors; cold-start members with
+    preferences get the scores of their preference segment. Members with neither are skipped.
+
+    Parameters:
+        model (dict): The compact model.
+        user_ids (array-like): Member user ids.
+
+    Returns:
+        tuple: (scores float32 [n_scored_members, n_dishes], scored user ids).
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    n_dishes = len(model['dish_ids'])
+
+    rows = lookup_many(model['user_ids'], user_ids)
+    known = rows >= 0
+    rows = rows[known]
+    cf_scores = model['latent_matrix'][rows] @ model['item_factors'].T
+    profiles = model['cbf_profiles'][rows]
+    cbf_scores = profiles.toarray() if sp.issparse(profiles) else profiles
+    hybrid = model['alpha'][rows, None] * cf_scores + model['beta'][rows, None] * cbf_scores
+
+    cold_ids = user_ids[~known]
+    positions = lookup_many(model['preferences']['user_ids'], cold_ids)
+    has_segment = (positions >= 0) & (len(model['segment_lists']) > 0)
+    segments = model['segment_of_user'][positions[has_segment]]
+    segment_scores = np.zeros((len(segments), n_dishes), dtype=SCORE_DTYPE)
+    lists = model['segment_lists'][segments]
+    ranked = lists >= 0
+    segment_scores[np.nonzero(ranked)[0], lists[ranked]] = model['segment_scores'][segments][ranked]
+
+    scores = np.vstack([hybrid.astype(SCORE_DTYPE), segment_scores])
+    scored = np.concatenate([user_ids[known], cold_ids[has_segment]])
+    return scores, scored
+
+
+def normalize_member_scores(scores):
+    """Min-max normalize every member's scores to [0, 1] so that members weigh equally."""
+    low = scores.min(axis=1, keepdims=True)
+    span = scores.max(axis=1, keepdims=True) - low
+    return np.divide(scores - low, span, out=np.zeros_like(scores), where=span > 0)
+
+
+def aggregate_scores(scores, strategy='average'):
+    """
+    Combine member scores [n_members, n_dishes] into one group score per dish.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    try:
+        aggregate = GROUP_STRATEGIES[strategy.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown group strategy '{strategy}'. Available strategies: {sorted(GROUP_STRATEGIES)}")
+    return aggregate(normalize_member_scores(scores)).astype(SCORE_DTYPE)
+
+
+def union_restriction_bits(preference_index, user_ids):
+    """One dietary restriction bitmask holding the restrictions of every member."""
+    n_words = preference_index['restriction_bits'].shape[1]
+    positions = lookup_many(preference_index['user_ids'], np.asarray(user_ids, dtype=np.int64))
+    bits = preference_index['restriction_bits'][positions[positions >= 0]]
+    if len(bits) == 0:
+        return np.zeros(n_words, dtype=BITSET_DTYPE)
+    return np.bitwise_or.reduce(bits, axis=0)
@@ -0,0 +1,54 @@
+# app/memory.py
+
+import sys
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def nbytes_of(*values, seen=None):
+    """
+    Approximate memory held by model data.
+
+    Counts NumPy arrays, SciPy sparse matrices, pandas objects (without the contents of
+    Python objects they reference), sets, dicts/lists/tuples of those, and objects that list
+    their memory-holding members in an `nbytes_parts()` method. Every object is counted once
+    however often it is referenced, so arrays shared between a model and the object that
+    built it are not counted twice. Anything else counts as 0.
+
+    Parameters:
+        *values: The data to measure.
+        seen (set, optional): ids of objects already counted, shared across calls.
+
+    Returns:
+        int: Bytes.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    for value in values:
+        if value is None or id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif sp.issparse(value):
+            total += sum(
+                getattr(value, name).nbytes for name in ('data', 'indices', 'indptr', 'row', 'col')
+                if hasattr(value, name)
+            )
+        elif isinstance(value, pd.Index):
+            total += value.memory_usage()
+        elif isinstance(value, (pd.Series, pd.DataFrame)):
+            total += int(np.sum(value.memory_usage(index=True)))
+        elif isinstance(value, (set, frozenset)):
+            total += sys.getsizeof(value)
+        elif isinstance(value, dict):
+            total += nbytes_of(*value.values(), seen=seen)
+        elif isinstance(value, (list, tuple)):
+            total += nbytes_of(*value, seen=seen)
+        elif hasattr(value, 'nbytes_parts'):
+            total += nbytes_of(*value.nbytes_parts(), seen=seen)
+    return total
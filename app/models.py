@@ -3,6 +3,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import os
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,28 +11,62 @@ logger = logging.getLogger(__name__)
 # Define the absolute path to the SQLite database
 DATABASE_PATH = r"C:\Users\user\Desktop\30-9\project-root 9-9 3\config\NEWDB.db"
 
-# Verify if the database file exists
-if not os.path.exists(DATABASE_PATH):
-    logger.error(f"SQLite database file not found at path: {DATABASE_PATH}")
-    raise FileNotFoundError(f"SQLite database file not found at path: {DATABASE_PATH}")
-
 # SQLite connection string
 DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
 
-# Initialize the  engine
-try:
-    engine = create_engine(
-        DATABASE_URI,
-        connect_args={"check_same_thread": False},  # Necessary for SQLite in multi-threaded apps
-        echo=False  # Set to True for verbose SQL output (useful for debugging)
-    )
-    logger.info("SQLite database engine initialized successfully.")
-except Exception as e:
-    logger.error(f"Error initializing SQLite engine: {e}")
-    raise e
-
-# Create a configured "Session" class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Return the default database engine, created on first use.
+
+    Importing this module never touches the database, so the app can start (and report
+    its health) before the database is reachable.
+
+    Raises:
+        FileNotFoundError: If the SQLite database file does not exist.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            # Verify if the database file exists
+            if not os.path.exists(DATABASE_PATH):
+                logger.error(f"SQLite database file not found at path: {DATABASE_PATH}")
+                raise FileNotFoundError(f"SQLite database file not found at path: {DATABASE_PATH}")
+            try:
+                _engine = create_engine(
+                    DATABASE_URI,
+                    connect_args={"check_same_thread": False},  # Necessary for SQLite in multi-threaded apps
+                    echo=False  # Set to True for verbose SQL output (useful for debugging)
+                )
+                logger.info("SQLite database engine initialized successfully.")
+            except Exception as e:
+                logger.error(f"Error initializing SQLite engine: {e}")
+                raise e
+        return _engine
+
+def create_location_engine(uri):
+    """
+    Create the engine of another location's database, configured like the default engine.
+
+    Raises:
+        LookupError: If `uri` points to a SQLite file that does not exist.
+    """
+    if uri.startswith('sqlite:///'):
+        path = uri[len('sqlite:///'):]
+        if not os.path.exists(path):
+            raise LookupError(f"SQLite database file not found at path: {path}")
+        return create_engine(uri, connect_args={"check_same_thread": False}, echo=False)
+    return create_engine(uri, echo=False)
+
+def __getattr__(name):
+    # `engine` and the configured "Session" class are created on first access
+    if name == 'engine':
+        return get_engine()
+    if name == 'SessionLocal':
+        return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Other configurations
 TOP_N = 10  # Number of top recommendations to fetch
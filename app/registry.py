@@ -0,0 +1,220 @@
+# app/registry.py
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from .concurrency import SingleFlight
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Location names end up in snapshot paths and database URIs
+LOCATION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+def validate_location(name):
+    """
+    Check a location name.
+
+    Returns:
+        str: The name.
+
+    Raises:
+        ValueError: If the name is not 1-64 letters, digits, '-' or '_'.
+    """
+    if not isinstance(name, str) or not LOCATION_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid location '{name}'. Use up to 64 letters, digits, '-' and '_'.")
+    return name
+
+
+class LocationUnavailable(RuntimeError):
+    """Raised for a location whose models failed to load, until its retry backoff has passed."""
+
+    def __init__(self, name, error, retry_after):
+        super().__init__(f"Models of location '{name}' are unavailable ({error}). Retry in {retry_after:.0f}s.")
+        self.name = name
+        self.error = error
+        self.retry_after = retry_after
+
+
+class ModelRegistry:
+    """
+    Model state per location (tenant), loaded on first use and evicted least-recently-used first.
+
+    `factory(name)` creates the empty state of a location (an object with a `models` dict),
+    `loader(state)` fills its models (from the on-disk artifact or by training) and
+    `sizer(state)` measures the memory it holds in bytes. After every load, the least recently used
+    locations are evicted until the resident models fit in `memory_budget` bytes (0 = no
+    budget). Pinned locations, the location just loaded and locations that are still
+    loading are never evicted, so a single location larger than the budget is still served.
+    Requests keep the state they started with, so evicting never breaks a running request;
+    the next request of an evicted location loads it again.
+
+    A load that raises or leaves the models empty fails the requests waiting for it with
+    LocationUnavailable, and so does every request within the retry backoff that follows
+    (`retry_backoff` seconds, doubled after each consecutive failure up to 16 times that),
+    so a broken location is not re-extracted and retrained by every request.
+    """
+
+    def __init__(self, factory, loader, sizer, memory_budget=0, pinned=(), on_evict=None, retry_backoff=60):
+        self.factory = factory
+        self.loader = loader
+        self.sizer = sizer
+        self.memory_budget = memory_budget
+        self.pinned = frozenset(pinned)
+        self.on_evict = on_evict
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._states = OrderedDict()   # Location -> state, least recently used first
+        self._loads = SingleFlight()
+        self._stats = {}               # Location -> counters, kept across evictions
+
+    def state(self, name):
+        """Return the location's state without loading its models or marking it as used."""
+        with self._lock:
+            return self._state(name)
+
+    def _state(self, name):
+        state = self._states.get(name)
+        if state is None:
+            state = self._states[name] = self.factory(name)
+            self._states.move_to_end(name, last=False)  # Not used yet
+            self._counters(name)
+        return state
+
+    def get(self, name):
+        """
+        Return the location's state with its models loaded, and mark it as most recently used.
+
+        Raises:
+            LocationUnavailable: If the load failed, or failed recently (see retry_backoff).
+            Whatever the factory raises for an unknown location.
+        """
+        with self._lock:
+            state = self._state(name)
+            self._states.move_to_end(name)
+            stats = self._counters(name)
+            stats['last_used'] = time.time()
+            loaded = bool(state.models)
+            if not loaded:
+                retry_after = self._retry_after(stats, stats['last_used'])
+                if retry_after > 0:
+                    stats['rejected'] += 1
+                    raise LocationUnavailable(name, stats['last_error'], retry_after)
+            stats['hits' if loaded else 'misses'] += 1
+        if not loaded:
+            self._loads.do(name, self._load, name, state)
+        return state
+
+    def _counters(self, name):
+        return self._stats.setdefault(name, {
+            'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'failures': 0, 'rejected': 0,
+            'consecutive_failures': 0, 'last_used': None, 'loaded_at': None, 'load_seconds': None,
+            'failed_at': None, 'last_error': None
+        })
+
+    def _retry_after(self, stats, now):
+        """Seconds until a location that failed to load may be loaded again (0 if it may now)."""
+        if not stats['consecutive_failures']:
+            return 0
+        backoff = self.retry_backoff * 2 ** min(stats['consecutive_failures'] - 1, 4)
+        return max(stats['failed_at'] + backoff - now, 0)
+
+    def _load(self, name, state):
+        logger.info(f"Loading models of location '{name}'...")
+        start = time.perf_counter()
+        try:
+            self.loader(state)
+            error = None if state.models else 'the load produced no models'
+        except Exception as e:
+            error = str(e)
+        duration = time.perf_counter() - start
+        with self._lock:
+            stats = self._counters(name)
+            if error is not None:
+                stats['failures'] += 1
+                stats['consecutive_failures'] += 1
+                stats['failed_at'] = time.time()
+                stats['last_error'] = error
+                retry_after = self._retry_after(stats, stats['failed_at'])
+            else:
+                stats['loads'] += 1
+                stats['consecutive_failures'] = 0
+                stats['loaded_at'] = time.time()
+                stats['load_seconds'] = round(duration, 3)
+        if error is not None:
+            logger.error(f"Loading location '{name}' failed after {duration:.1f}s: {error}. Retrying in {retry_after:.0f}s.")
+            raise LocationUnavailable(name, error, retry_after)
+        logger.info(f"Location '{name}' loaded in {duration:.1f}s.")
+        self.enforce_budget(keep=name)
+
+    def enforce_budget(self, keep=None):
+        """Evict least recently used locations until the resident models fit in the budget."""
+        if not self.memory_budget:
+            return []
+        with self._lock:
+            sizes = {name: self.sizer(state) for name, state in self._states.items()}
+            total = sum(sizes.values())
+            evicted = []
+            for name in list(self._states):
+                if total <= self.memory_budget:
+                    break
+                if name == keep or name in self.pinned or self._loads.in_flight(name):
+                    continue
+                evicted.append((name, self._states.pop(name)))
+                self._counters(name)['evictions'] += 1
+                total -= sizes[name]
+        for name, state in evicted:
+            logger.info(
+                f"Evicted location '{name}' ({sizes[name] / 1e6:.1f} MB); "
+                f"{total / 1e6:.1f} MB of {self.memory_budget / 1e6:.1f} MB resident."
+            )
+            if self.on_evict is not None:
+                self.on_evict(state)
+        return [name for name, _ in evicted]
+
+    def evict(self, name):
+        """Drop a location's state; returns False if it was not resident or is pinned."""
+        with self._lock:
+            if name in self.pinned or name not in self._states:
+                return False
+            state = self._states.pop(name)
+            self._counters(name)['evictions'] += 1
+        if self.on_evict is not None:
+            self.on_evict(state)
+        logger.info(f"Evicted location '{name}'.")
+        return True
+
+    def resident(self):
+        """Return (location, state) pairs of the resident locations, least recently used first."""
+        with self._lock:
+            return list(self._states.items())
+
+    def stats(self):
+        """
+        Return registry-wide and per-location statistics.
+
+        Returns:
+            dict: 'memory_budget' and 'resident_bytes' (bytes), and 'locations': location ->
+                  hits, misses (requests that had to load the models), loads, evictions,
+                  failures, consecutive_failures, rejected (requests refused during the
+                  retry backoff), failed_at, last_error, load_seconds, last_used, loaded_at,
+                  resident, nbytes and snapshot_version.
+        """
+        with self._lock:
+            locations = {}
+            for name, counters in self._stats.items():
+                state = self._states.get(name)
+                models = state.models if state is not None else {}
+                locations[name] = {
+                    **counters,
+                    'resident': state is not None and bool(models),
+                    'nbytes': self.sizer(state) if models else 0,
+                    'snapshot_version': models.get('snapshot_version')
+                }
+        return {
+            'memory_budget': self.memory_budget,
+            'resident_bytes': sum(location['nbytes'] for location in locations.values()),
+            'locations': locations
+        }
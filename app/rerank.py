@@ -0,0 +1,166 @@
+# app/rerank.py
+
+import numpy as np
+from .compact import BITSET_DTYPE, BITSET_WORD_BITS
+import logging
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODES = ('quota', 'mmr', 'none')
+
+
+class _CategoryQuota:
+    """
+    Track how many selected dishes each category already holds.
+
+    A dish counts towards every category it belongs to; dishes without any category share
+    one extra 'uncategorized' bucket. A dish is eligible while all of its categories are
+    below `max_per_category`.
+    """
+
+    def __init__(self, bitsets, max_per_category):
+        self.bitsets = bitsets
+        self.max_per_category = max_per_category
+        self.uncategorized = ~np.any(bitsets != 0, axis=1)
+        n_words = bitsets.shape[1]
+        self.counts = np.zeros(n_words * BITSET_WORD_BITS + 1, dtype=np.int64)
+        self.full = np.zeros(n_words, dtype=BITSET_DTYPE)
+        self.uncategorized_full = False
+
+    def eligible(self):
+        if self.max_per_category is None:
+            return np.ones(len(self.bitsets), dtype=bool)
+        eligible = ~np.any((self.bitsets & self.full) != 0, axis=1)
+        if self.uncategorized_full:
+            eligible &= ~self.uncategorized
+        return eligible
+
+    def add(self, index):
+        if self.uncategorized[index]:
+            bits = [len(self.counts) - 1]
+        else:
+            words = self.bitsets[index].astype('<u8')
+            bits = np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little'))
+        for bit in bits:
+            self.counts[bit] += 1
+            if self.max_per_category is not None and self.counts[bit] >= self.max_per_category:
+                if bit == len(self.counts) - 1:
+                    self.uncategorized_full = True
+                else:
+                    word, offset = divmod(bit, BITSET_WORD_BITS)
+                    self.full[word] |= BITSET_DTYPE(1) << BITSET_DTYPE(offset)
+
+
+def rerank_quota(scores, bitsets, top_n=10, max_per_category=2):
+    """
+    Greedy quota re-ranking: take the best remaining dish whose categories are all below quota.
+
+    Parameters:
+        scores (np.ndarray): Candidate scores.
+        bitsets (np.ndarray): Category bitsets of the candidates, uint64 [n, n_words].
+        top_n (int): Number of dishes to select.
+        max_per_category (int): Maximum number of selected dishes per category (None: no limit).
+
+    Returns:
+        np.ndarray: Indices of the selected candidates, in rank order.
+    """
+    quota = _CategoryQuota(bitsets, max_per_category)
+    remaining = np.ones(len(scores), dtype=bool)
+    selected = []
+    for _ in range(min(top_n, len(scores))):
+        eligible = remaining & quota.eligible()
+        if not eligible.any():
+            break
+        index = int(np.argmax(np.where(eligible, scores, -np.inf)))
+        selected.append(index)
+        remaining[index] = False
+        quota.add(index)
+    return np.asarray(selected, dtype=np.int64)
+
+
+def rerank_mmr(scores, positions, bitsets, neighbors, neighbor_scores, n_dishes,
+               top_n=10, max_per_category=2, mmr_lambda=0.7):
+    """
+    Maximal marginal relevance re-ranking over the precomputed content neighbor table.
+
+    Each step takes the dish maximizing
+        mmr_lambda * relevance - (1 - mmr_lambda) * max similarity to the already selected dishes,
+    where relevance is the min-max normalized score and similarity comes from the neighbor
+    table (dishes outside each other's neighbor lists count as dissimilar). The category
+    quota still applies.
+
+    Parameters:
+        scores (np.ndarray): Candidate scores.
+        positions (np.ndarray): Catalog positions of the candidates.
+        bitsets (np.ndarray): Category bitsets of the candidates.
+        neighbors (np.ndarray): Neighbor catalog positions per dish, int32 [n_dishes, k].
+        neighbor_scores (np.ndarray): Matching similarities, float32 [n_dishes, k].
+        n_dishes (int): Catalog size.
+        top_n (int): Number of dishes to select.
+        max_per_category (int): Maximum number of selected dishes per category (None: no limit).
+        mmr_lambda (float): Trade-off between relevance (1.0) and diversity (0.0).
+
+    Returns:
+        np.ndarray: Indices of the selected candidates, in rank order.
+    """
+    n = len(scores)
+    span = scores.max() - scores.min() if n else 0.0
+    relevance = (scores - scores.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+
+    # Catalog position -> candidate index, to update similarities from neighbor lists
+    candidate_of = np.full(n_dishes, -1, dtype=np.int64)
+    candidate_of[positions] = np.arange(n)
+
+    quota = _CategoryQuota(bitsets, max_per_category)
+    remaining = np.ones(n, dtype=bool)
+    max_similarity = np.zeros(n, dtype=np.float32)
+    selected = []
+    for _ in range(min(top_n, n)):
+        eligible = remaining & quota.eligible()
+        if not eligible.any():
+            break
+        marginal = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        index = int(np.argmax(np.where(eligible, marginal, -np.inf)))
+        selected.append(index)
+        remaining[index] = False
+        quota.add(index)
+
+        # Similarity to the newly selected dish, for candidates in its neighbor list
+        neighbor_candidates = candidate_of[neighbors[positions[index]]]
+        found = neighbor_candidates >= 0
+        np.maximum.at(max_similarity, neighbor_candidates[found], neighbor_scores[positions[index]][found])
+    return np.asarray(selected, dtype=np.int64)
+
+
+def rerank(model, positions, scores, mode='quota', top_n=10, max_per_category=2, mmr_lambda=0.7):
+    """
+    Diversity re-ranking stage over scored candidates.
+
+    Parameters:
+        model (dict): The compact model (category bitsets and neighbor table are used).
+        positions (np.ndarray): Catalog positions of the candidates.
+        scores (np.ndarray): Candidate scores.
+        mode (str): 'quota' (greedy with per-category limits), 'mmr' (maximal marginal
+                    relevance with per-category limits) or 'none' (top scores only).
+        top_n (int): Number of dishes to return.
+        max_per_category (int): Maximum number of dishes per category.
+        mmr_lambda (float): Relevance weight for 'mmr'.
+
+    Returns:
+        np.ndarray: Indices into `positions` of the selected dishes, in rank order.
+    """
+    scores = np.nan_to_num(np.asarray(scores, dtype=np.float32), nan=0.0)
+    if len(positions) == 0:
+        return np.empty(0, dtype=np.int64)
+    mode = mode.lower()
+    if mode == 'none':
+        return np.argsort(-scores, kind='stable')[:top_n]
+    bitsets = model['category_bits'][positions]
+    if mode == 'quota':
+        return rerank_quota(scores, bitsets, top_n=top_n, max_per_category=max_per_category)
+    if mode == 'mmr':
+        return rerank_mmr(
+            scores, positions, bitsets, model['dish_neighbors'], model['dish_neighbor_scores'],
+            len(model['dish_ids']), top_n=top_n, max_per_category=max_per_category, mmr_lambda=mmr_lambda
+        )
+    raise ValueError(f"Unknown re-ranking mode '{mode}'. Available modes: {list(RERANK_MODES)}")
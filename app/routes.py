@@ -1,12 +1,137 @@
 # app/routes.py
 
-from flask import Blueprint, jsonify, request
-from .services import generate_and_store_recommendations, get_user_recommendations,save_user_preferences
+from functools import wraps
+from flask import Blueprint, jsonify, request, url_for
+from .registry import LocationUnavailable
+from .startup import readiness
+from .workers import RegenerationQueueFull
+from config.config import Config
+
+# The recommendation services (pandas, scikit-learn) are imported inside the views: they are
+# loaded by the startup thread, and the app serves /healthz and fallbacks until then. Every
+# view that imports them goes through until_ready, so no request blocks on that import
 
 main = Blueprint('main', __name__)
 
+# Marks responses served by the popularity fallback while the models load
+FALLBACK_HEADERS = {'X-Recommendation-Source': 'popularity-fallback'}
+
+def loading_response():
+    # 503 while the models load, or when neither the models nor the fallback can serve
+    if readiness.is_ready():
+        message = "Recommendations are temporarily unavailable. Retry later."
+    else:
+        message = "Recommendation models are loading. Retry later."
+    return (
+        jsonify({"error": message, **readiness.status()}),
+        503,
+        {'Retry-After': str(Config.STARTUP_RETRY_AFTER)}
+    )
+
+def until_ready(fallback=None):
+    """
+    Serve `fallback` (503 with Retry-After if None) until the models are live (see /readyz),
+    and for a location whose models failed to load (see ModelRegistry.get()).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if readiness.is_ready():
+                try:
+                    return view(*args, **kwargs)
+                except LocationUnavailable as e:
+                    if fallback is None:
+                        return jsonify({"error": str(e)}), 503, {'Retry-After': str(max(int(e.retry_after), 1))}
+            elif fallback is None:
+                return loading_response()
+            try:
+                return fallback(*args, **kwargs)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except LookupError:
+                return jsonify({"error": f"Location '{request.args.get('location')}' not found."}), 404
+        return wrapper
+    return decorator
+
+def with_location(view):
+    """Serve the view from the location in the optional ?location= parameter (default location otherwise)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from .services import get_location, use_location
+        location = request.args.get('location')
+        try:
+            state = get_location(location)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except LookupError:
+            return jsonify({"error": f"Location '{location}' not found."}), 404
+        with use_location(state):
+            return view(*args, **kwargs)
+    return wrapper
+
+def popular_dishes(limit=None, exclude=None):
+    # Popular in-stock dishes of the requested location (TOP_N by default), read straight from its database
+    from .fallback import popularity_fallback
+    return popularity_fallback.popular_dishes(request.args.get('location'), limit=limit, exclude=exclude)
+
+def popular_recommendations(user_id):
+    rec_list = popular_dishes()
+    if not rec_list:
+        return loading_response()
+    for dish in rec_list:
+        dish['AvailabilityStatus'] = 'In Stock'
+    return jsonify(rec_list), 200, FALLBACK_HEADERS
+
+def parse_group_request():
+    """Return (user_ids, strategy, top_n, None) from the request body, or an error response as the last item."""
+    # Body: {"user_ids": [1, 2, 3], "strategy": "least_misery", "top_n": 10}
+    body = request.get_json(silent=True) or {}
+    user_ids = body.get('user_ids')
+    if not isinstance(user_ids, list) or not user_ids or not all(isinstance(user_id, int) for user_id in user_ids):
+        return None, None, None, (jsonify({"error": "'user_ids' must be a non-empty list of integer user IDs."}), 400)
+    if len(user_ids) > Config.GROUP_MAX_SIZE:
+        return None, None, None, (jsonify({"error": f"Groups are limited to {Config.GROUP_MAX_SIZE} users."}), 400)
+    top_n = body.get('top_n', 10)
+    if not isinstance(top_n, int) or top_n < 1:
+        return None, None, None, (jsonify({"error": "'top_n' must be a positive integer."}), 400)
+    return user_ids, body.get('strategy'), top_n, None
+
+def popular_group_recommendations():
+    user_ids, _, top_n, error = parse_group_request()
+    if error is not None:
+        return error
+    dishes = popular_dishes(limit=top_n)
+    if not dishes:
+        return loading_response()
+    return jsonify({"user_ids": user_ids, "recommendations": dishes}), 200, FALLBACK_HEADERS
+
+def popular_related_dishes(key):
+    """Fallback of the dish-to-dish endpoints: popular dishes other than the requested one, under `key`."""
+    def fallback(dish_id):
+        limit = max(1, request.args.get('limit', default=10, type=int))
+        dishes = popular_dishes(limit=limit, exclude=dish_id)
+        if not dishes:
+            return loading_response()
+        related = [{'DishID': dish['DishID'], 'DishName': dish['Name'], 'Score': dish['Score']} for dish in dishes]
+        return jsonify({"dish_id": dish_id, key: related}), 200, FALLBACK_HEADERS
+    return fallback
+
+@main.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({"status": "ok"}), 200
+
+@main.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: green once the default location's models are live
+    status = readiness.status()
+    return jsonify(status), 200 if readiness.is_ready() else 503
+
 @main.route('/api/generate_recommendations/<int:user_id>', methods=['POST'])
+@until_ready()
+@with_location
 def generate_recommendations(user_id):
+    from .services import generate_and_store_recommendations
     success = generate_and_store_recommendations(user_id)
     if success:
         return jsonify({"message": "Recommendations generated successfully."}), 200
@@ -14,7 +139,11 @@ def generate_recommendations(user_id):
         return jsonify({"error": "Failed to generate recommendations. Ensure you have sufficient interaction data."}), 400
 
 @main.route('/api/recommendations/<int:user_id>', methods=['GET'])
+@until_ready(popular_recommendations)
+@with_location
 def recommendations(user_id):
+    from .services import generate_and_store_recommendations, get_user_recommendations
+
     # Check if recommendations exist for the user
     recommendations = get_user_recommendations(user_id)
 
@@ -35,12 +164,113 @@ def recommendations(user_id):
     return jsonify(rec_list), 200
 
 
+@main.route('/api/recommendations/group', methods=['POST'])
+@until_ready(popular_group_recommendations)
+@with_location
+def group_recommendations():
+    from .services import generate_group_recommendations
+    user_ids, strategy, top_n, error = parse_group_request()
+    if error is not None:
+        return error
+
+    try:
+        recommendations = generate_group_recommendations(user_ids, strategy=strategy, top_n=top_n)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if recommendations.empty:
+        return jsonify({"error": "Failed to generate group recommendations."}), 400
+    return jsonify({"user_ids": user_ids, "recommendations": recommendations.to_dict(orient='records')}), 200
+
 @main.route('/api/preferences/<int:user_id>', methods=['POST'])
+@until_ready()
+@with_location
 def update_preferences(user_id):
+    from .services import current_location, persist_user_preferences, regeneration_queue
+
     # Extract preferences from the request body
     preferences = request.json
     
-    # Save preferences and generate recommendations
-    save_user_preferences(user_id, preferences)
+    # Save preferences; regeneration happens in the background
+    if not persist_user_preferences(user_id, preferences):
+        return jsonify({"error": "Failed to save preferences."}), 500
+
+    try:
+        version = regeneration_queue.submit((current_location().name, user_id))
+    except RegenerationQueueFull:
+        return jsonify({
+            "message": "Preferences saved, but recommendations could not be queued for regeneration. Retry later."
+        }), 503
     
-    return jsonify({"message": "Preferences saved and recommendations generated."}), 200
\ No newline at end of file
+    return jsonify({
+        "message": "Preferences saved. Recommendations are being regenerated.",
+        "version": version,
+        "status_url": url_for('main.recommendation_status', user_id=user_id, location=request.args.get('location'))
+    }), 202
+
+@main.route('/api/recommendations/<int:user_id>/status', methods=['GET'])
+@until_ready()
+@with_location
+def recommendation_status(user_id):
+    from .services import current_location, regeneration_queue
+    # Poll until completed_version reaches the version returned by the preferences update
+    status = regeneration_queue.status((current_location().name, user_id))
+    if status is None:
+        return jsonify({"user_id": user_id, "state": "idle", "requested_version": 0, "completed_version": 0}), 200
+    return jsonify({"user_id": user_id, **status}), 200
+
+@main.route('/api/dishes/<int:dish_id>/frequently_with', methods=['GET'])
+@until_ready(popular_related_dishes('frequently_with'))
+@with_location
+def frequently_with(dish_id):
+    from .services import get_frequently_ordered_with
+    limit = request.args.get('limit', default=10, type=int)
+    dishes = get_frequently_ordered_with(dish_id, limit=max(1, limit))
+    if dishes is None:
+        return jsonify({"error": f"Dish {dish_id} not found."}), 404
+    return jsonify({"dish_id": dish_id, "frequently_with": dishes}), 200
+
+@main.route('/api/dishes/<int:dish_id>/similar', methods=['GET'])
+@until_ready(popular_related_dishes('similar'))
+@with_location
+def similar_dishes(dish_id):
+    from .services import get_similar_dishes
+    limit = request.args.get('limit', default=10, type=int)
+    user_id = request.args.get('user_id', default=None, type=int)
+
+    # Feature intensity filters, e.g. ?max_spiciness=3&min_sweetness=1
+    feature_ranges = {}
+    for name, value in request.args.items():
+        bound, _, feature = name.partition('_')
+        if bound not in ('min', 'max') or not feature:
+            continue
+        try:
+            value = float(value)
+        except ValueError:
+            return jsonify({"error": f"Invalid value for '{name}'."}), 400
+        minimum, maximum = feature_ranges.get(feature, (None, None))
+        feature_ranges[feature] = (value, maximum) if bound == 'min' else (minimum, value)
+
+    try:
+        dishes = get_similar_dishes(dish_id, limit=max(1, limit), user_id=user_id, feature_ranges=feature_ranges)
+    except KeyError as e:
+        return jsonify({"error": f"Unknown dish feature {e}."}), 400
+    if dishes is None:
+        return jsonify({"error": f"Dish {dish_id} not found."}), 404
+    return jsonify({"dish_id": dish_id, "similar": dishes}), 200
+
+@main.route('/api/locations', methods=['GET'])
+@until_ready()
+def locations():
+    from .services import model_registry
+    # Per-location cache statistics of the model registry (hits, loads, evictions, memory)
+    return jsonify(model_registry.stats()), 200
+
+@main.route('/api/rules', methods=['GET'])
+@until_ready()
+def rules():
+    # Business rules in evaluation order, with the time spent in each since startup
+    from .services import rules_engine
+    return jsonify({
+        "rules": [rule.name for rule in rules_engine.rules],
+        "timings": rules_engine.timings()
+    }), 200
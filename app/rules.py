@@ -0,0 +1,312 @@
+# app/rules.py
+
+import time
+import threading
+import numpy as np
+from .compact import BITSET_DTYPE, bitsets_intersect, category_bitmask, lookup_many, to_id_array
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RuleContext:
+    """
+    Per-dish arrays the business rules are evaluated against.
+
+    Every array is aligned with `dish_ids` (the compact model catalog), so a rule turns into
+    an index into these arrays followed by a mask or a multiplier.
+    """
+
+    def __init__(self, dish_ids, category_bits, category_index, special_dish_ids=(), inventory=None):
+        self.dish_ids = np.asarray(dish_ids)
+        self.category_bits = category_bits      # uint64 [n_dishes, n_words], see build_category_bitsets
+        self.category_index = category_index    # Sorted category ids, one per bit
+        n_dishes = len(self.dish_ids)
+
+        special_positions = lookup_many(self.dish_ids, to_id_array(special_dish_ids))
+        self.special_mask = np.zeros(n_dishes, dtype=bool)
+        self.special_mask[special_positions[special_positions >= 0]] = True
+
+        # Total ingredient stock per dish; dishes without inventory rows have no stock
+        self.quantity = np.zeros(n_dishes, dtype=np.float32)
+        if inventory is not None and not inventory.empty:
+            positions = lookup_many(self.dish_ids, to_id_array(inventory['DishID']))
+            found = positions >= 0
+            self.quantity[positions[found]] = inventory['TotalQuantity'].to_numpy(dtype=np.float32)[found]
+
+        self.loaded_at = time.monotonic()
+
+    @property
+    def special_positions(self):
+        return np.flatnonzero(self.special_mask)
+
+    def restriction_bits(self, restrictions):
+        """Per-user lists of restricted category ids -> uint64 [n_users, n_words] bitmasks."""
+        n_words = self.category_bits.shape[1]
+        if not len(restrictions):
+            return np.zeros((0, n_words), dtype=BITSET_DTYPE)
+        return np.stack([category_bitmask(self.category_index, ids, n_words) for ids in restrictions])
+
+
+class RuleBatch:
+    """
+    Scores of a batch of users over a shared set of candidate dishes, updated in place by the rules.
+
+    Attributes:
+        positions (np.ndarray): Catalog positions of the candidates, shape (n_candidates,).
+        scores (np.ndarray): float32, shape (n_users, n_candidates).
+        keep (np.ndarray): bool, False where a rule filtered the dish out.
+        reasons (np.ndarray): object, the reason set by the last rule that tagged the dish ('' if none).
+        restriction_bits (np.ndarray): Per-user dietary restriction bitmasks, uint64 [n_users, n_words].
+    """
+
+    def __init__(self, positions, scores, restriction_bits):
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.scores = np.atleast_2d(np.array(scores, dtype=np.float32))
+        self.keep = np.ones(self.scores.shape, dtype=bool)
+        self.reasons = np.full(self.scores.shape, '', dtype=object)
+        self.restriction_bits = restriction_bits
+
+
+class BusinessRule:
+    """
+    Base class for declarative business rules.
+
+    A rule only defines which (user, dish) cells it matches via mask(); its action
+    (multiply, add, or filter) is shared by every rule of the same kind.
+    """
+
+    name = 'base'
+
+    def __init__(self, reason=None):
+        self.reason = reason
+
+    def mask(self, context, batch):
+        """Return a boolean array broadcastable to (n_users, n_candidates)."""
+        raise NotImplementedError
+
+    def apply(self, context, batch):
+        mask = np.broadcast_to(self.mask(context, batch), batch.scores.shape)
+        self.act(batch, mask)
+        if self.reason:
+            batch.reasons[mask] = self.reason
+
+    def act(self, batch, mask):
+        raise NotImplementedError
+
+
+class PenaltyRule(BusinessRule):
+    """Multiply the score of matching dishes by `factor`."""
+
+    def __init__(self, factor=0.5, reason=None):
+        super().__init__(reason)
+        self.factor = factor
+
+    def act(self, batch, mask):
+        batch.scores *= np.where(mask, np.float32(self.factor), np.float32(1.0))
+
+
+class BoostRule(BusinessRule):
+    """Add `boost` to the score of matching dishes."""
+
+    def __init__(self, boost=1.0, reason=None):
+        super().__init__(reason)
+        self.boost = boost
+
+    def act(self, batch, mask):
+        batch.scores += np.where(mask, np.float32(self.boost), np.float32(0.0))
+
+
+class FilterRule(BusinessRule):
+    """Remove matching dishes."""
+
+    def act(self, batch, mask):
+        batch.keep &= ~mask
+
+
+class DietaryPenaltyRule(PenaltyRule):
+    """Penalize dishes in any of the user's dietary restriction categories."""
+
+    name = 'dietary_penalty'
+
+    def mask(self, context, batch):
+        # (1, n_candidates, n_words) & (n_users, 1, n_words) -> any shared bit per cell
+        dish_bits = context.category_bits[batch.positions][None, :, :]
+        return bitsets_intersect(dish_bits, batch.restriction_bits[:, None, :])
+
+
+class PromotionBoostRule(BoostRule):
+    """Boost dishes with a running special promotion."""
+
+    name = 'promotion_boost'
+
+    def __init__(self, boost=1.0, reason='Special Promotion'):
+        super().__init__(boost, reason)
+
+    def mask(self, context, batch):
+        return context.special_mask[batch.positions]
+
+
+class OutOfStockFilterRule(FilterRule):
+    """Drop dishes without ingredient stock."""
+
+    name = 'out_of_stock_filter'
+
+    def mask(self, context, batch):
+        return context.quantity[batch.positions] <= 0
+
+
+class LowStockPenaltyRule(PenaltyRule):
+    """Penalize dishes with low ingredient stock instead of excluding them."""
+
+    name = 'low_stock_penalty'
+
+    def __init__(self, factor=0.5, threshold=5, reason=None):
+        super().__init__(factor, reason)
+        self.threshold = threshold
+
+    def mask(self, context, batch):
+        return context.quantity[batch.positions] < self.threshold
+
+
+# Evaluation order of the original business rules
+DEFAULT_RULES = 'dietary_penalty,promotion_boost,out_of_stock_filter,low_stock_penalty'
+
+BUSINESS_RULES = {
+    DietaryPenaltyRule.name: DietaryPenaltyRule,
+    PromotionBoostRule.name: PromotionBoostRule,
+    OutOfStockFilterRule.name: OutOfStockFilterRule,
+    LowStockPenaltyRule.name: LowStockPenaltyRule,
+}
+
+
+class RulesEngine:
+    """
+    Evaluate a sequence of business rules, in order, over a RuleBatch.
+
+    The time spent in each rule is accumulated and available from timings().
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._lock = threading.Lock()
+        self._timings = {rule.name: [0, 0.0] for rule in self.rules}
+
+    def evaluate(self, context, positions, scores, restrictions=None, restriction_bits=None):
+        """
+        Apply every rule to the candidates of one user (1-D scores) or a batch of users (2-D scores).
+
+        Parameters:
+            context (RuleContext): Per-dish rule data.
+            positions (np.ndarray): Catalog positions of the candidates.
+            scores (np.ndarray): Scores, shape (n_candidates,) or (n_users, n_candidates).
+            restrictions (list, optional): Per-user arrays of restricted category ids.
+            restriction_bits (np.ndarray, optional): Precomputed per-user restriction bitmasks,
+                used instead of `restrictions`.
+
+        Returns:
+            RuleBatch: Adjusted scores, keep mask and reasons (always 2-D).
+        """
+        n_users = np.atleast_2d(scores).shape[0]
+        if restriction_bits is None:
+            restriction_bits = context.restriction_bits(restrictions if restrictions is not None else [()] * n_users)
+        batch = RuleBatch(positions, scores, np.atleast_2d(restriction_bits))
+        elapsed = {}
+        for rule in self.rules:
+            start = time.perf_counter()
+            rule.apply(context, batch)
+            elapsed[rule.name] = time.perf_counter() - start
+
+        with self._lock:
+            for name, seconds in elapsed.items():
+                self._timings[name][0] += 1
+                self._timings[name][1] += seconds
+        timings = ', '.join(f"{name}={seconds * 1000:.3f}ms" for name, seconds in elapsed.items())
+        logger.debug(f"Business rules on {batch.scores.shape}: {timings}")
+        return batch
+
+    def timings(self):
+        """Return {rule name: {'calls', 'total_ms', 'mean_ms'}} accumulated since startup."""
+        with self._lock:
+            return {
+                name: {
+                    'calls': calls,
+                    'total_ms': total * 1000,
+                    'mean_ms': total * 1000 / calls if calls else 0.0
+                }
+                for name, (calls, total) in self._timings.items()
+            }
+
+
+def create_rules_engine(names, params=None):
+    """
+    Create a RulesEngine from rule names.
+
+    Parameters:
+        names (str or list): Registered rule names in evaluation order, as a list or a
+                             comma-separated string.
+        params (dict, optional): Constructor keyword arguments per rule name.
+
+    Returns:
+        RulesEngine: The engine.
+    """
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+    params = params or {}
+    rules = []
+    for name in names:
+        try:
+            rule_cls = BUSINESS_RULES[name.lower()]
+        except KeyError:
+            raise ValueError(f"Unknown business rule '{name}'. Available rules: {sorted(BUSINESS_RULES)}")
+        rules.append(rule_cls(**params.get(name.lower(), {})))
+    return RulesEngine(rules)
+
+
+class RuleContextCache:
+    """
+    Keep the current RuleContext for `ttl` seconds.
+
+    Specials and inventory change independently of the trained models, so the context is
+    reloaded when it expires or when the model catalog (cache key) changes. Loads run
+    outside the cache lock and one at a time; while one thread reloads an expired context,
+    the others keep scoring with the expired one instead of waiting for the database.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._key = None
+        self._context = None
+        self._generation = 0   # Bumped by invalidate(); a load started before is not cached
+
+    def get(self, key, loader):
+        with self._lock:
+            context = self._context
+            usable = context is not None and self._key == key
+            if usable and time.monotonic() - context.loaded_at < self.ttl:
+                return context
+        if usable and not self._load_lock.acquire(blocking=False):
+            return context  # Another thread is reloading it
+        if not usable:
+            self._load_lock.acquire()
+        try:
+            with self._lock:
+                # Reloaded by another thread while this one waited
+                if (self._context is not None and self._key == key
+                        and time.monotonic() - self._context.loaded_at < self.ttl):
+                    return self._context
+                generation = self._generation
+            context = loader()
+            with self._lock:
+                if self._generation == generation:
+                    self._key, self._context = key, context
+            return context
+        finally:
+            self._load_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._context = None
+            self._generation += 1
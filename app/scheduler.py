@@ -0,0 +1,155 @@
+# app/scheduler.py
+
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Monotonic change counters: new rating and preference rows, and completed orders
+CHANGE_COUNTS_QUERY = """
+SELECT
+    (SELECT COALESCE(MAX(rowid), 0) FROM UserRating) AS ratings,
+    (SELECT COUNT(*) FROM "Order" WHERE Status = 'Completed') AS orders,
+    (SELECT COALESCE(MAX(rowid), 0) FROM UserPreference) AS preferences
+"""
+
+
+def count_changes(engine):
+    """
+    Read the change counters of the training inputs.
+
+    Returns:
+        dict: {'ratings', 'orders', 'preferences'} counters; differences between two reads
+              are the number of new ratings, completed orders and preference rows.
+    """
+    with engine.connect() as connection:
+        row = connection.execute(text(CHANGE_COUNTS_QUERY)).mappings().fetchone()
+    return {name: int(value) for name, value in row.items()}
+
+
+class RetrainScheduler:
+    """
+    Decide on every tick whether to run a full retrain, a cheap incremental refresh, or nothing.
+
+    - Full retrain: the changes since the last full retrain reach `retrain_threshold`, or
+      `max_interval` seconds have passed and anything changed at all. Never more often
+      than every `min_interval` seconds.
+    - Incremental refresh: the changes since the last run of either kind reach
+      `refresh_threshold`.
+
+    A tick that finds a run still in progress is skipped. Every run is logged and kept in
+    history() with the reason it fired. A tick that starts no run calls `maintenance` (if
+    given) instead: the counters only cover the training inputs, so work driven by other
+    data, such as inventory and specials changes or the staleness bound of stored
+    recommendations, has to run whether they moved or not.
+    """
+
+    def __init__(self, full_retrain, incremental_refresh, counter, refresh_threshold=1,
+                 retrain_threshold=500, min_interval=300, max_interval=3600, history_size=100,
+                 maintenance=None):
+        self.full_retrain = full_retrain
+        self.incremental_refresh = incremental_refresh
+        self.counter = counter
+        self.maintenance = maintenance
+        self.refresh_threshold = refresh_threshold
+        self.retrain_threshold = retrain_threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._running = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self._last_full = None        # (monotonic time, counters) at the start of the last full retrain
+        self._last_run = None         # Counters at the start of the last run of either kind
+
+    def start(self, counters=None, full_retrain_done=True):
+        """
+        Set the baseline, typically right after the startup model build.
+
+        Parameters:
+            counters (dict, optional): Counters the current models reflect (read now if omitted).
+            full_retrain_done (bool): Whether the current models come from a full retrain.
+        """
+        counters = counters if counters is not None else self.counter()
+        self._last_run = counters
+        self._last_full = (time.monotonic(), counters) if full_retrain_done else None
+
+    def decide(self, counters, now=None):
+        """
+        Return (kind, reason) for the given counters; kind is 'full', 'incremental' or None.
+        """
+        now = time.monotonic() if now is None else now
+        if self._last_full is None:
+            return 'full', 'no full retrain yet'
+
+        last_full_at, full_baseline = self._last_full
+        since_full = _total_changes(counters, full_baseline)
+        since_run = _total_changes(counters, self._last_run)
+        elapsed = now - last_full_at
+
+        if elapsed >= self.min_interval:
+            if since_full >= self.retrain_threshold:
+                return 'full', f"{since_full} changes since the last full retrain (threshold {self.retrain_threshold})"
+            if elapsed >= self.max_interval and since_full > 0:
+                return 'full', f"{elapsed:.0f}s since the last full retrain with {since_full} changes"
+        if since_run >= self.refresh_threshold and since_run > 0:
+            return 'incremental', f"{since_run} changes since the last run (threshold {self.refresh_threshold})"
+        return None, None
+
+    def tick(self):
+        """Run whatever decide() asks for; meant to be called periodically by a scheduler."""
+        if not self._running.acquire(blocking=False):
+            logger.info("Previous retrain run is still in progress. Skipping this tick.")
+            return None
+        try:
+            try:
+                counters = self.counter()
+            except Exception as e:
+                logger.error(f"Could not read change counters: {e}")
+                return None
+            kind, reason = self.decide(counters)
+            if kind is None:
+                logger.debug(f"No retrain needed (counters {counters}).")
+                if self.maintenance is not None:
+                    try:
+                        self.maintenance()
+                    except Exception as e:
+                        logger.error(f"Scheduled maintenance failed: {e}")
+                return None
+
+            logger.info(f"Starting {kind} model run: {reason}.")
+            started_at, start = datetime.now(), time.monotonic()
+            error = None
+            try:
+                (self.full_retrain if kind == 'full' else self.incremental_refresh)()
+            except Exception as e:
+                logger.error(f"{kind.capitalize()} model run failed: {e}")
+                error = str(e)
+            duration = time.monotonic() - start
+
+            # Changes that arrived during the run are picked up by the next tick
+            self._last_run = counters
+            if kind == 'full' and error is None:
+                self._last_full = (start, counters)
+            self._history.append({
+                'kind': kind,
+                'reason': reason,
+                'counters': counters,
+                'started_at': started_at.isoformat(),
+                'duration_seconds': round(duration, 3),
+                'error': error
+            })
+            logger.info(f"{kind.capitalize()} model run finished in {duration:.1f}s.")
+            return kind
+        finally:
+            self._running.release()
+
+    def history(self):
+        """Return the most recent runs, oldest first."""
+        return list(self._history)
+
+
+def _total_changes(counters, baseline):
+    return sum(max(counters[name] - baseline.get(name, 0), 0) for name in counters)
@@ -0,0 +1,126 @@
+# app/segments.py
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster import KMeans
+from .compact import ID_DTYPE, SCORE_DTYPE, category_membership, lookup_many
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def preference_profiles(preference_index, dish_ids, category_index):
+    """
+    Build per-user preference profiles from the preference index.
+
+    Each preference row is weighted by its share of the user's total PreferenceScore
+    (uniform if the scores sum to zero).
+
+    Returns:
+        tuple: (category_weights [n_users, n_categories], favorites CSR [n_users, n_dishes]
+               with the weights of favorite dishes, restriction flags [n_users, n_categories])
+    """
+    user_ids = preference_index['user_ids']
+    offsets = preference_index['offsets']
+    n_users, n_dishes, n_categories = len(user_ids), len(dish_ids), len(category_index)
+
+    row_users = np.repeat(np.arange(n_users), np.diff(offsets))
+    scores = preference_index['PreferenceScore'].astype(np.float64)
+    totals = np.bincount(row_users, weights=scores, minlength=n_users)
+    counts = np.maximum(np.diff(offsets), 1)
+    weights = np.where(totals[row_users] != 0, scores / np.where(totals != 0, totals, 1)[row_users],
+                       1.0 / counts[row_users])
+
+    category_positions = lookup_many(category_index, preference_index['CategoryID'])
+    known = category_positions >= 0
+    category_weights = np.zeros((n_users, n_categories), dtype=SCORE_DTYPE)
+    np.add.at(category_weights, (row_users[known], category_positions[known]), weights[known])
+
+    favorite_positions = lookup_many(dish_ids, preference_index['FavoriteDish'])
+    known = favorite_positions >= 0
+    favorites = sp.csr_matrix(
+        (weights[known].astype(SCORE_DTYPE), (row_users[known], favorite_positions[known])),
+        shape=(n_users, n_dishes)
+    )
+
+    # Restriction bitmasks expanded to one 0/1 flag per category
+    restrictions = category_membership(
+        preference_index['restriction_bits'], category_index, category_index
+    ).astype(SCORE_DTYPE)
+    return category_weights, favorites, restrictions
+
+
+def build_segments(preference_index, dish_ids, category_bits, category_index, content_similarity,
+                   n_segments=16, list_size=100, random_state=42):
+    """
+    Cluster users' preference profiles into segments and rank dishes per segment.
+
+    A profile is the user's category weights (explicit category preferences plus the
+    categories of their favorite dishes, L1-normalized) followed by their dietary
+    restriction flags. A segment's dish score is the category affinity of its centroid plus
+    the mean content similarity to its members' favorite dishes.
+
+    Parameters:
+        preference_index (dict): Output of build_preference_index().
+        dish_ids (np.ndarray): Sorted catalog dish ids.
+        category_bits (np.ndarray): Catalog category bitsets.
+        category_index (np.ndarray): Sorted category ids, one per bit.
+        content_similarity (np.ndarray): Catalog x catalog content similarity.
+        n_segments (int): Number of segments (capped at the number of distinct profiles).
+        list_size (int): Ranked dishes kept per segment.
+        random_state (int): Seed for the clustering.
+
+    Returns:
+        dict: 'segment_of_user' (int32, aligned with preference_index['user_ids']),
+              'segment_lists' (catalog positions, int32 [n_segments, list_size], -1 padded)
+              and 'segment_scores' (float32).
+    """
+    n_users, n_dishes = len(preference_index['user_ids']), len(dish_ids)
+    empty = {
+        'segment_of_user': np.zeros(n_users, dtype=ID_DTYPE),
+        'segment_lists': np.full((0, list_size), -1, dtype=ID_DTYPE),
+        'segment_scores': np.zeros((0, list_size), dtype=SCORE_DTYPE)
+    }
+    if n_users == 0 or n_dishes == 0:
+        return empty
+
+    membership = category_membership(category_bits, category_index, category_index).astype(SCORE_DTYPE)
+    category_weights, favorites, restrictions = preference_profiles(preference_index, dish_ids, category_index)
+    affinity = category_weights + np.asarray(favorites @ membership, dtype=SCORE_DTYPE)
+    affinity_totals = affinity.sum(axis=1, keepdims=True)
+    affinity = np.divide(affinity, affinity_totals, out=np.zeros_like(affinity), where=affinity_totals > 0)
+    features = np.hstack([affinity, restrictions])
+
+    n_clusters = max(1, min(n_segments, len(np.unique(features, axis=0))))
+    if n_clusters == 1:
+        labels = np.zeros(n_users, dtype=np.int64)
+    else:
+        labels = KMeans(n_clusters=n_clusters, n_init=3, random_state=random_state).fit_predict(features)
+
+    # Mean category affinity and mean favorite weights of every segment's members
+    assignment = sp.csr_matrix(
+        (np.ones(n_users, dtype=SCORE_DTYPE), (labels, np.arange(n_users))), shape=(n_clusters, n_users)
+    )
+    sizes = np.asarray(assignment.sum(axis=1)).ravel()
+    assignment = sp.diags(1.0 / np.maximum(sizes, 1)).astype(SCORE_DTYPE) @ assignment
+    segment_affinity = np.asarray(assignment @ affinity, dtype=SCORE_DTYPE)
+    segment_favorites = assignment @ favorites
+
+    scores = segment_affinity @ membership.T
+    scores += np.asarray(segment_favorites @ content_similarity, dtype=SCORE_DTYPE)
+
+    k = min(list_size, n_dishes)
+    top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    segment_lists = np.full((n_clusters, list_size), -1, dtype=ID_DTYPE)
+    segment_scores = np.zeros((n_clusters, list_size), dtype=SCORE_DTYPE)
+    positive = top_scores > 0
+    segment_lists[:, :k] = np.where(positive, top, -1)
+    segment_scores[:, :k] = np.where(positive, top_scores, 0)
+
+    logger.info(f"Clustered {n_users} preference profiles into {n_clusters} cold-start segments.")
+    return {
+        'segment_of_user': labels.astype(ID_DTYPE),
+        'segment_lists': segment_lists,
+        'segment_scores': segment_scores
+    }
@@ -1,132 +1,637 @@
+import os
+import contextvars
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 from sqlalchemy import text
-from sklearn.decomposition import TruncatedSVD
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
 from .utils import (
     extract_user_ratings,
     extract_user_orders,
     extract_dish_features,
     extract_user_preferences,
+    extract_user_ratings_chunked,
+    extract_user_orders_chunked,
+    extract_dish_popularity,
+    extract_dish_categories,
+    extract_dish_feature_values,
+    extract_dish_details,
     preprocess_interaction_data,
     preprocess_dish_features,
-    apply_business_rules
+    build_confidence_matrix,
+    load_rule_context
+)
+from .cf_backends import create_cf_backend
+from .candidates import create_candidate_generators, generate_candidates
+from .rules import RuleContextCache, create_rules_engine
+from .rerank import rerank
+from .content import ContentIndex
+from .exploration import exploration_noise
+from .group import aggregate_scores, group_member_scores, union_restriction_bits
+from .cooccurrence import CooccurrenceCounter
+from .dirty import RULE_DATA_REASONS, DirtyUserTracker
+from .segments import build_segments
+from .compact import (
+    build_blended_neighbor_table,
+    build_compact_model,
+    build_dish_details,
+    build_feature_matrix,
+    build_user_profiles,
+    bitsets_intersect,
+    dish_frame,
+    feature_range_mask,
+    lookup,
+    lookup_many,
+    profile_scores,
+    purchased_positions,
+    to_id_array,
+    user_restriction_bits
+)
+from .concurrency import SingleFlight, TaskGraph
+from .memory import nbytes_of
+from .registry import ModelRegistry, validate_location
+from .serving import create_serving_store, decode_recommendations, encode_recommendations
+from .workers import RegenerationQueue
+from .snapshot import SnapshotWriter, compute_source_fingerprint, load_latest_snapshot
+from .streaming import (
+    stream_interaction_statistics,
+    build_interaction_matrix,
+    build_streaming_confidence_matrix
 )
 from config.config import Config
-from .models import engine, TOP_N
+from .models import create_location_engine, get_engine, TOP_N
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Global dictionary to store models and related data
-models = {}
+def location_engine(name):
+    """Return the database engine of a location (the default engine for the default location)."""
+    if name == Config.DEFAULT_LOCATION:
+        return get_engine()
+    return create_location_engine(Config.LOCATION_DATABASE_URI.format(location=name))
+
+class LocationState:
+    """Models, database engine and incremental training state of one restaurant location."""
+
+    def __init__(self, name):
+        self.name = name
+        self.engine = location_engine(name)
+        if name == Config.DEFAULT_LOCATION:
+            self.snapshot_dir = Config.SNAPSHOT_DIR
+        else:
+            self.snapshot_dir = os.path.join(Config.SNAPSHOT_DIR, 'locations', name)
+
+        # Dictionary to store the location's models and related data
+        self.models = {}
+
+        # Specials/inventory data of the business rules, cached briefly
+        self.rule_contexts = RuleContextCache(ttl=Config.RULE_DATA_TTL)
+
+        # Basket co-occurrence counts, updated incrementally from new orders on every model build
+        self.cooccurrence_counter = CooccurrenceCounter(
+            max_pairs=Config.COOCCURRENCE_MAX_PAIRS, open_statuses=Config.OPEN_ORDER_STATUSES
+        )
+
+        # Hashed TF-IDF content model, updated only for the dishes whose features changed
+        self.content_index = ContentIndex(
+            idf_refresh_ratio=Config.CONTENT_IDF_REFRESH_RATIO, neighbors_per_dish=Config.NEIGHBORS_PER_DISH,
+            numeric_weight=Config.NUMERIC_FEATURE_WEIGHT
+        )
+
+        # Users whose stored recommendations are out of date, regenerated after each retrain
+        self.dirty_users = DirtyUserTracker(
+            staleness_bound=Config.STALENESS_BOUND, low_stock_threshold=Config.LOW_STOCK_THRESHOLD,
+            open_statuses=Config.OPEN_ORDER_STATUSES
+        )
+
+        # Precomputed top-N lists read by the API, kept apart from the transactional database
+        self.serving_store = create_serving_store(
+            Config.SERVING_STORE, os.path.join(Config.SERVING_STORE_DIR, f"{name}.db")
+        )
+
+def _load_location(state):
+    # Registry loader: reuses the model artifact of an unchanged snapshot, trains otherwise
+    with use_location(state):
+        initialize_models()
+
+def _close_location(state):
+    # Evicted locations release their pooled and serving-store connections (running
+    # requests keep working: both reopen connections on demand)
+    if state.engine is not get_engine():
+        state.engine.dispose()
+    if state.serving_store is not None:
+        state.serving_store.close()
+
+def location_nbytes(state):
+    # Registry sizer: the compact model plus the location's incremental training state
+    # (content index, co-occurrence counts and sketch); objects shared between them count once
+    return nbytes_of(state.models, state.content_index, state.cooccurrence_counter)
+
+# Location states, loaded on first use; least recently used locations are evicted when
+# the resident models exceed the memory budget. The default location stays resident.
+model_registry = ModelRegistry(
+    factory=LocationState,
+    loader=_load_location,
+    sizer=location_nbytes,
+    memory_budget=Config.MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+    pinned=[Config.DEFAULT_LOCATION],
+    on_evict=_close_location,
+    retry_backoff=Config.LOCATION_RETRY_BACKOFF
+)
+
+# Location served by the current request or task (unset: the default location)
+_current_location = contextvars.ContextVar('current_location', default=None)
+
+# Serving-store writes buffered by bulk_serving_writes() (unset: written immediately)
+_serving_writes = contextvars.ContextVar('serving_writes', default=None)
+
+def current_location():
+    """Return the state of the location being served."""
+    state = _current_location.get()
+    return state if state is not None else model_registry.state(Config.DEFAULT_LOCATION)
 
-def initialize_models():
+@contextmanager
+def use_location(state):
+    """Serve everything inside the block from the given location state."""
+    token = _current_location.set(state)
+    try:
+        yield state
+    finally:
+        _current_location.reset(token)
+
+def get_location(name=None):
+    """
+    Return the state of location `name` with its models loaded (on first use, or after eviction).
+
+    Parameters:
+        name (str, optional): The location (defaults to Config.DEFAULT_LOCATION).
+
+    Raises:
+        ValueError: If the name is invalid.
+        LookupError: If the location has no database.
+    """
+    return model_registry.get(validate_location(name or Config.DEFAULT_LOCATION))
+
+@contextmanager
+def location_scope(name=None):
+    """Serve everything inside the block from location `name` (see get_location())."""
+    with use_location(get_location(name)) as state:
+        yield state
+
+class _LocationModels(MutableMapping):
+    """The models dictionary of the location being served (see current_location())."""
+
+    def __getitem__(self, key):
+        return current_location().models[key]
+
+    def __setitem__(self, key, value):
+        current_location().models[key] = value
+
+    def __delitem__(self, key):
+        del current_location().models[key]
+
+    def __iter__(self):
+        return iter(current_location().models)
+
+    def __len__(self):
+        return len(current_location().models)
+
+    def clear(self):
+        current_location().models.clear()
+
+# Models and related data of the current location
+models = _LocationModels()
+
+# Deduplicates concurrent model builds and per-user recommendation generation
+_flights = SingleFlight()
+
+def build_candidate_generators():
+    """Create the candidate generators configured in Config.CANDIDATE_GENERATORS."""
+    return create_candidate_generators(Config.CANDIDATE_GENERATORS, k=Config.CANDIDATES_PER_GENERATOR)
+
+def build_rules_engine():
+    """Compile the business rules configured in Config.BUSINESS_RULES with their Config parameters."""
+    return create_rules_engine(Config.BUSINESS_RULES, {
+        'dietary_penalty': {'factor': Config.DIETARY_PENALTY},
+        'promotion_boost': {'boost': Config.PROMOTION_BOOST},
+        'low_stock_penalty': {'factor': Config.LOW_STOCK_PENALTY, 'threshold': Config.LOW_STOCK_THRESHOLD}
+    })
+
+# First stage of the hybrid pipeline: each generator proposes a few hundred dishes to rank
+candidate_generators = build_candidate_generators()
+
+# Business rules compiled once from config; their specials/inventory data is cached per location
+rules_engine = build_rules_engine()
+
+def refresh_snapshot(force=False):
+    """
+    Extraction stage: write the training data to a local columnar snapshot.
+
+    Extraction is skipped when the source tables are unchanged since the latest snapshot.
+
+    Parameters:
+        force (bool): Re-extract even if the source tables are unchanged.
+
+    Returns:
+        Snapshot or None: The current snapshot, or None if extraction failed.
+    """
+    streaming = Config.TRAINING_MODE.lower() == 'streaming'
+    location = current_location()
+    engine = location.engine
+
+    try:
+        fingerprint = compute_source_fingerprint(engine)
+    except Exception as e:
+        logger.warning(f"Could not fingerprint source tables, forcing extraction: {e}")
+        fingerprint, force = 'unknown', True
+
+    current = load_latest_snapshot(location.snapshot_dir)
+    if not force and current is not None and current.fingerprint == fingerprint:
+        logger.info(f"Source tables unchanged since snapshot {current.version}. Skipping extraction.")
+        return current
+
+    logger.info("Extracting training data into a new snapshot...")
+    writer = SnapshotWriter(location.snapshot_dir, fingerprint)
+    try:
+        # The extraction queries are independent: each runs on its own pooled connection
+        # and writes its own snapshot table
+        extraction = TaskGraph('snapshot extraction')
+        if streaming:
+            # Copy interactions chunk by chunk so extraction memory stays bounded
+            extraction.add('ratings', lambda: [
+                writer.append_chunk('ratings', chunk)
+                for chunk in extract_user_ratings_chunked(engine, Config.STREAMING_CHUNK_SIZE)
+            ])
+            extraction.add('orders', lambda: [
+                writer.append_chunk('orders', chunk)
+                for chunk in extract_user_orders_chunked(engine, Config.STREAMING_CHUNK_SIZE)
+            ])
+        else:
+            extraction.add('ratings', lambda: writer.write_table('ratings', extract_user_ratings(engine)))
+            extraction.add('orders', lambda: writer.write_table('orders', extract_user_orders(engine)))
+
+        def write_dish_features():
+            dish_features = extract_dish_features(engine)
+            if dish_features.empty:
+                raise ValueError("No dish features extracted.")
+            writer.write_table('dish_features', dish_features)
+
+        extraction.add('dish_features', write_dish_features)
+        extraction.add('dish_popularity', lambda: writer.write_table('dish_popularity', extract_dish_popularity(engine)))
+        extraction.add('dish_categories', lambda: writer.write_table('dish_categories', extract_dish_categories(engine)))
+        extraction.add('dish_feature_values', lambda: writer.write_table(
+            'dish_feature_values', extract_dish_feature_values(engine)
+        ))
+        extraction.add('dish_details', lambda: writer.write_table('dish_details', extract_dish_details(engine)))
+        extraction.add('preferences', lambda: writer.write_table('preferences', extract_user_preferences(engine)))
+        extraction.run(max_workers=Config.MODEL_BUILD_WORKERS or None)
+
+        return writer.commit(keep=Config.SNAPSHOT_KEEP)
+    except Exception as e:
+        writer.abort()
+        logger.error(f"Error writing training data snapshot: {e}")
+        return None
+
+def initialize_models(force=False, fresh=False):
     """
     Initialize and train Collaborative Filtering (CF) and Content-Based Filtering (CBF) models.
     This function should be called during application startup and whenever user data changes.
+
+    Training reads from the columnar snapshot written by refresh_snapshot(). If the live
+    models were already trained on the current snapshot, retraining is skipped. Overlapping
+    calls (scheduler, preference updates) share a single in-flight build. Models are
+    built for the current location (see location_scope()); a location without models
+    loads the model artifact saved with its snapshot when the source data is unchanged.
+
+    Parameters:
+        force (bool): Re-extract and retrain even if the source data is unchanged.
+        fresh (bool): Do not join a build that started before this call; use this after
+                      writing data that the new models must reflect.
+
+    Returns:
+        bool: True if the live models reflect the current snapshot, False if the build failed
+              (the previous models, if any, are kept).
     """
+    return _flights.do(('initialize_models', current_location().name), _initialize_models, force, fresh=fresh)
+
+def _initialize_models(force=False):
     try:
         logger.info("Initializing recommendation models...")
 
-        # Extract data from the database
-        ratings = extract_user_ratings(engine)
-        orders = extract_user_orders(engine)
-        dish_features = extract_dish_features(engine)
-        preferences = extract_user_preferences(engine)
-        
-        # Preprocess data
-        user_item_matrix = preprocess_interaction_data(ratings, orders)
-        dish_features_agg = preprocess_dish_features(dish_features)
-        
-        # Check if user_item_matrix is empty
-        if user_item_matrix.empty:
-            logger.warning("User-Item interaction matrix is empty. No data available for training.")
-            return
-        
-        # Train Collaborative Filtering model
-        svd, latent_matrix, item_factors = train_collaborative_filtering(user_item_matrix)
-        
-        # Train Content-Based Filtering model
-        tfidf, content_similarity, feature_matrix = train_content_based(dish_features_agg)
-        
+        location = current_location()
+        engine = location.engine
+
+        # Extract data from the database (or reuse the unchanged snapshot)
+        snapshot = refresh_snapshot(force=force)
+        if snapshot is None:
+            logger.warning("No training data snapshot available. Keeping the previous models.")
+            return False
+        if not force and models.get('snapshot_version') == snapshot.version:
+            logger.info(f"Models are already trained on snapshot {snapshot.version}. Skipping retrain.")
+            return True
+        if not force and not models:
+            # Models saved when this snapshot was trained (e.g. before a restart or eviction)
+            saved = snapshot.load_model()
+            if saved is not None and saved.get('snapshot_version') == snapshot.version:
+                models.update(saved)
+                models['engine'] = engine
+                logger.info(f"Loaded the models trained on snapshot {snapshot.version} for location '{location.name}'.")
+                return True
+
+        trained = train_models(snapshot)
+
         # Update the global models dictionary with the latest models and data
         models.clear()  # Clear existing models to avoid stale data
-        models['user_item_matrix'] = user_item_matrix
-        models['svd'] = svd
-        models['latent_matrix'] = latent_matrix
-        models['item_factors'] = item_factors
-        models['tfidf'] = tfidf
-        models['content_similarity'] = content_similarity
-        models['feature_matrix'] = feature_matrix
-        models['dish_features_agg'] = dish_features_agg
-        models['preferences'] = preferences
+        models.update(trained)
         models['engine'] = engine  # Database engine
+        models['snapshot_version'] = snapshot.version
+
+        # Saved with the snapshot so that the location can be loaded again without retraining
+        try:
+            snapshot.save_model({key: value for key, value in models.items() if key not in ('engine', 'tfidf')})
+        except Exception as e:
+            logger.warning(f"Could not save the models of snapshot {snapshot.version}: {e}")
         
-        logger.info("Recommendation models initialized successfully.")
+        logger.info(f"Recommendation models initialized successfully for location '{location.name}'.")
+        return True
     except Exception as e:
         logger.error(f"Error during model initialization: {e}")
+        return False
 
-def train_collaborative_filtering(user_item_matrix, n_components=50):
+def train_models(snapshot):
     """
-    Train a Collaborative Filtering model using Truncated SVD.
+    Train every model of the current location on a snapshot, without publishing them.
+
+    Parameters:
+        snapshot (Snapshot): Training data (anything with frame(), iter_chunks() and version).
+
+    Returns:
+        dict: The compact model with 'cf_model', 'tfidf' and 'feature_matrix'.
+
+    Raises:
+        Exception: The error of the first stage that failed.
+    """
+    streaming = Config.TRAINING_MODE.lower() == 'streaming'
+    use_confidence = Config.CF_BACKEND.lower() == 'als'
+    location = current_location()
+
+    # The build is a dependency graph: interaction matrix -> CF fit and dish features ->
+    # CBF fit run concurrently (as does the basket count), then the compact model, then
+    # the per-user and per-dish tables derived from it. Models are only published once
+    # every stage succeeded.
+    def interactions():
+        confidence_matrix = None
+        if streaming:
+            # Read interactions chunk by chunk into sparse sufficient statistics
+            logger.info(f"Streaming interactions in chunks of {Config.STREAMING_CHUNK_SIZE} rows.")
+            stats = stream_interaction_statistics(
+                snapshot.iter_chunks('ratings', Config.STREAMING_CHUNK_SIZE),
+                snapshot.iter_chunks('orders', Config.STREAMING_CHUNK_SIZE)
+            )
+            user_item_matrix = build_interaction_matrix(stats)
+            if use_confidence:
+                confidence_matrix = build_streaming_confidence_matrix(
+                    stats,
+                    order_weight=Config.ALS_ORDER_WEIGHT,
+                    rating_weight=Config.ALS_RATING_WEIGHT
+                )
+        else:
+            ratings = snapshot.frame('ratings')
+            orders = snapshot.frame('orders')
+            user_item_matrix = preprocess_interaction_data(ratings, orders)
+            # Implicit-feedback backends weight raw order counts and ratings separately
+            if use_confidence and not user_item_matrix.empty:
+                confidence_matrix = build_confidence_matrix(
+                    ratings, orders, user_item_matrix.index, user_item_matrix.columns,
+                    order_weight=Config.ALS_ORDER_WEIGHT,
+                    rating_weight=Config.ALS_RATING_WEIGHT
+                )
+        # Check if user_item_matrix is empty
+        if user_item_matrix.empty:
+            raise ValueError("User-Item interaction matrix is empty. No data available for training.")
+        return user_item_matrix, confidence_matrix
+
+    def dish_data():
+        dish_features = snapshot.frame('dish_features')
+        dish_categories = snapshot.frame('dish_categories')
+        if dish_categories.empty:
+            # Snapshots written before categories were extracted: use the joined dish features
+            dish_categories = dish_features[['DishID', 'CategoryID']]
+        dish_features_agg = preprocess_dish_features(dish_features, snapshot.frame('dish_popularity'))
+        # Numeric feature intensities in catalog (sorted dish id) order
+        feature_values = snapshot.frame('dish_feature_values')
+        if feature_values.empty:
+            feature_values = pd.DataFrame(columns=['DishID', 'FeatureID', 'FeatureName', 'FeatureValue'])
+        numeric_features = build_feature_matrix(np.sort(to_id_array(dish_features_agg['DishID'])), feature_values)
+        return dish_features_agg, dish_categories, numeric_features
+
+    def collaborative_filtering(interaction_data):
+        user_item_matrix, confidence_matrix = interaction_data
+        cf_model, latent_matrix, item_factors = train_collaborative_filtering(
+            user_item_matrix,
+            n_components=Config.CF_COMPONENTS,
+            confidence_matrix=confidence_matrix,
+            fold_in_chunk_size=Config.STREAMING_CHUNK_SIZE if streaming else None
+        )
+        if cf_model is None:
+            raise ValueError("Collaborative Filtering training failed.")
+        return cf_model, latent_matrix, item_factors
+
+    def content_based(dish_inputs):
+        tfidf, content_similarity, feature_matrix = train_content_based(dish_inputs[0], dish_inputs[2][1])
+        if tfidf is None:
+            raise ValueError("Content-Based Filtering training failed.")
+        return tfidf, content_similarity, feature_matrix
+
+    def compact_model(interaction_data, dish_inputs, cf, cbf):
+        # Convert to the compact serving representation (float32 factors, int32 id maps,
+        # column-wise dish metadata) before publishing
+        dish_features_agg, dish_categories, (feature_names, feature_values) = dish_inputs
+        index = cbf[0]
+        compact = build_compact_model(
+            interaction_data[0], cf[1], cf[2], cbf[1],
+            dish_features_agg, snapshot.frame('preferences'), neighbors_per_dish=Config.NEIGHBORS_PER_DISH,
+            dish_categories=dish_categories, content_neighbors=(index.neighbors, index.neighbor_scores)
+        )
+        # Raw numeric intensities for range filters such as "spiciness <= 3"
+        compact['feature_names'], compact['feature_values'] = feature_names, feature_values
+        # Display columns served with the lists of the serving store
+        dish_details = snapshot.frame('dish_details')
+        if not dish_details.empty:
+            compact['dish_details'] = build_dish_details(compact['dish_ids'], dish_details)
+        return compact
+
+    def user_profiles(compact):
+        # Per-user activity, dynamic weights, purchased lists and CBF profiles
+        profiles = build_user_profiles(
+            compact['interactions'], compact['content_similarity'], top_k=Config.CBF_PROFILE_TOP_K
+        )
+        profiles['alpha'], profiles['beta'] = compute_dynamic_weights(profiles['interaction_totals'])
+        return profiles
+
+    def segments(compact):
+        # Cold-start segments: clustered preference profiles with a ranked list per segment
+        return build_segments(
+            compact['preferences'], compact['dish_ids'], compact['category_bits'],
+            compact['category_index'], compact['content_similarity'],
+            n_segments=Config.COLD_START_SEGMENTS, list_size=Config.SEGMENT_LIST_SIZE
+        )
+
+    def similar_dishes(compact):
+        # "Similar dishes" lists blending content and CF item similarity
+        neighbors, scores = build_blended_neighbor_table(
+            compact['content_similarity'], compact['item_factors'],
+            content_weight=Config.SIMILAR_CONTENT_WEIGHT, k=Config.SIMILAR_DISHES_TOP_K
+        )
+        return {'similar_dishes': neighbors, 'similar_dish_scores': scores}
+
+    def cooccurrence_index(compact, _):
+        # "Frequently ordered together" index over the new catalog
+        return build_cooccurrence_index(compact['dish_ids'], update=False)
+
+    build = TaskGraph('model build')
+    build.add('interactions', interactions)
+    build.add('dish_data', dish_data)
+    build.add('baskets', lambda: location.cooccurrence_counter.update(location.engine, chunksize=Config.STREAMING_CHUNK_SIZE))
+    build.add('cf', collaborative_filtering, 'interactions')
+    build.add('cbf', content_based, 'dish_data')
+    build.add('compact', compact_model, 'interactions', 'dish_data', 'cf', 'cbf')
+    build.add('user_profiles', user_profiles, 'compact')
+    build.add('segments', segments, 'compact')
+    build.add('similar_dishes', similar_dishes, 'compact')
+    build.add('cooccurrence_index', cooccurrence_index, 'compact', 'baskets')
+    results = build.run(max_workers=Config.MODEL_BUILD_WORKERS or None)
+
+    compact = results['compact']
+    for stage in ('user_profiles', 'segments', 'similar_dishes', 'cooccurrence_index'):
+        compact.update(results[stage])
+    compact['cf_model'] = results['cf'][0]
+    compact['tfidf'], _, compact['feature_matrix'] = results['cbf']
+    return compact
+
+def build_cooccurrence_index(dish_ids, update=True):
+    """
+    Count the baskets of new completed orders and build the co-occurrence index.
+
+    Parameters:
+        dish_ids (np.ndarray): Sorted catalog dish ids.
+        update (bool): Count new baskets first (False when they were just counted).
+
+    Returns:
+        dict: 'cooccurrence_neighbors', 'cooccurrence_scores' and 'cooccurrence_counts'
+              (empty dict if the index could not be built).
+    """
+    try:
+        location = current_location()
+        if update:
+            location.cooccurrence_counter.update(location.engine, chunksize=Config.STREAMING_CHUNK_SIZE)
+        index = location.cooccurrence_counter.build_index(
+            dish_ids,
+            top_k=Config.COOCCURRENCE_TOP_K,
+            measure=Config.COOCCURRENCE_MEASURE,
+            min_count=Config.COOCCURRENCE_MIN_COUNT
+        )
+        return {f"cooccurrence_{name}": values for name, values in index.items()}
+    except Exception as e:
+        logger.error(f"Error building co-occurrence index: {e}")
+        return {}
+
+def train_collaborative_filtering(user_item_matrix, n_components=50, backend=None, confidence_matrix=None,
+                                  fold_in_chunk_size=None):
+    """
+    Train a Collaborative Filtering model with the configured backend (Truncated SVD or implicit ALS).
     
     Parameters:
         user_item_matrix (pd.DataFrame): User-Item interaction matrix.
-        n_components (int): Number of latent factors for SVD.
+        n_components (int): Number of latent factors.
+        backend (str, optional): Backend name; defaults to Config.CF_BACKEND.
+        confidence_matrix (scipy.sparse.csr_matrix, optional): Implicit feedback strengths used by ALS.
+        fold_in_chunk_size (int, optional): Fit SVD on the sparse matrix and compute user factors
+            this many users at a time (bounded-memory streaming mode).
         
     Returns:
-        tuple: (TruncatedSVD model, user latent factors, item latent factors)
+        tuple: (CF backend model, user latent factors, item latent factors)
     """
     try:
-        logger.info("Training Collaborative Filtering model...")
-
-        # Ensure n_components does not exceed the smaller dimension of the matrix
-        n_components = min(n_components, min(user_item_matrix.shape) - 1)
-
-        svd = TruncatedSVD(n_components=n_components, random_state=42)
-        latent_matrix = svd.fit_transform(user_item_matrix)  # User latent factors
-        item_factors = svd.components_.T  # Item latent factors
+        backend = backend or Config.CF_BACKEND
+        logger.info(f"Training Collaborative Filtering model with the '{backend}' backend...")
+
+        params = {'n_components': n_components}
+        if backend.lower() == 'svd':
+            params['fold_in_chunk_size'] = fold_in_chunk_size
+        elif backend.lower() == 'als':
+            params.update(
+                iterations=Config.ALS_ITERATIONS,
+                regularization=Config.ALS_REGULARIZATION,
+                alpha=Config.ALS_ALPHA,
+                cg_steps=Config.ALS_CG_STEPS,
+                num_threads=Config.ALS_NUM_THREADS
+            )
+        cf_model = create_cf_backend(backend, **params)
+        latent_matrix, item_factors = cf_model.fit(user_item_matrix, confidence_matrix)
 
         logger.info("Collaborative Filtering model trained successfully.")
-        return svd, latent_matrix, item_factors
+        return cf_model, latent_matrix, item_factors
     except Exception as e:
         logger.error(f"Error training Collaborative Filtering model: {e}")
         return None, None, None
 
-def train_content_based(dish_features_agg):
+def train_content_based(dish_features_agg, numeric_features=None):
     """
     Train a Content-Based Filtering model using TF-IDF vectorization.
+
+    The content index is updated incrementally: only added, edited or removed dishes are
+    re-vectorized, and only their similarity rows and the neighbor lists they affect are
+    recomputed (see app/content.py). Numeric feature intensities are blended into the
+    similarity with weight Config.NUMERIC_FEATURE_WEIGHT.
     
     Parameters:
         dish_features_agg (pd.DataFrame): Aggregated dish features.
+        numeric_features (np.ndarray, optional): float32 [n_dishes, n_features] intensities
+            in sorted dish id order (see build_feature_matrix).
         
     Returns:
-        tuple: (TF-IDF Vectorizer, Cosine similarity matrix, Feature matrix)
+        tuple: (Content index, Cosine similarity matrix, Feature matrix), aligned with the
+               rows of dish_features_agg
     """
     try:
         logger.info("Training Content-Based Filtering model...")
-        tfidf = TfidfVectorizer(stop_words='english', max_df=0.8, min_df=2)  # Adjusted parameters for diversity
-        feature_matrix = tfidf.fit_transform(dish_features_agg['combined_features'])
-        content_similarity = cosine_similarity(feature_matrix)
+        content_index = current_location().content_index
+        dish_ids = to_id_array(dish_features_agg['DishID'])
+        if numeric_features is not None:
+            # Rows of numeric_features follow the sorted dish ids
+            numeric_features = numeric_features[np.argsort(np.argsort(dish_ids, kind='stable'))]
+        content_index.update(dish_ids, dish_features_agg['combined_features'], numeric_features)
+        content_similarity, feature_matrix = content_index.similarity, content_index.vectors
+        # The index is in dish id order; map it back onto the rows of dish_features_agg
+        rows = lookup_many(content_index.dish_ids, dish_ids)
+        if not np.array_equal(rows, np.arange(len(rows))):
+            content_similarity = content_similarity[np.ix_(rows, rows)]
+            feature_matrix = feature_matrix[rows]
         logger.info("Content-Based Filtering model trained successfully.")
-        return tfidf, content_similarity, feature_matrix
+        return content_index, content_similarity, feature_matrix
     except Exception as e:
         logger.error(f"Error training Content-Based Filtering model: {e}")
         return None, None, None
 
-def generate_and_store_recommendations(user_id):
+def generate_and_store_recommendations(user_id, fresh=False):
     """
     Generate recommendations for a user and store them in the database.
+
+    Concurrent calls for the same user wait on one in-flight generation and share its result.
     
     Parameters:
         user_id (int): The ID of the user for whom to generate recommendations.
+        fresh (bool): Do not join a generation that started before this call.
         
     Returns:
         bool: True if recommendations were generated and stored successfully, False otherwise.
     """
+    return _flights.do(('generate_and_store_recommendations', current_location().name, user_id),
+                       _generate_and_store_recommendations, user_id, fresh=fresh)
+
+def _generate_and_store_recommendations(user_id):
     try:
         logger.info(f"Generating recommendations for User ID: {user_id}")
 
@@ -134,22 +639,21 @@ def generate_and_store_recommendations(user_id):
         recommendations = pd.DataFrame()
 
         # Check if user exists in the interaction matrix
-        if user_id in models['user_item_matrix'].index:
+        if lookup(models['user_ids'], user_id) >= 0:
             logger.info(f"User ID {user_id} found in the interaction matrix. Generating hybrid recommendations.")
             # Generate hybrid recommendations using CF and CBF
             recommendations = generate_hybrid_recommendations(user_id)
         else:
             logger.info(f"User ID {user_id} not found in the interaction matrix. Checking user preferences.")
             # Check if user has preferences
-            user_prefs = models['preferences'][models['preferences']['UserID'] == user_id]
-            if not user_prefs.empty:
+            if lookup(models['preferences']['user_ids'], user_id) >= 0:
                 logger.info(f"User ID {user_id} has preferences. Generating content-based recommendations.")
                 # Generate content-based recommendations based on preferences
                 recommendations = generate_content_based_recommendations(user_id)
             else:
                 # Handle missing preferences with a fallback
                 logger.warning(f"User ID {user_id} has no interactions or preferences. Recommending popular dishes.")
-                recommendations = recommend_popular_dishes(models['dish_features_agg'])
+                recommendations = recommend_popular_dishes(models['dishes'], models['popular_order'], user_id=user_id)
                 if recommendations.empty:
                     logger.warning(f"Still no fallback recommendations found for User ID {user_id}.")
                     return False
@@ -160,50 +664,94 @@ def generate_and_store_recommendations(user_id):
 
         # Insert recommendations into the database
         insert_recommendations(user_id, recommendations)
+        current_location().dirty_users.mark_generated(user_id)
 
         logger.info(f"Recommendations generated and stored for User ID {user_id}.")
         return True
     except Exception as e:
         logger.error(f"Error generating and storing recommendations for User ID {user_id}: {e}")
         return False
-    
-def calculate_dynamic_weights(user_id):
+
+def get_rule_context():
+    """Return the rule data (specials, inventory) for the current model catalog."""
+    location = current_location()
+    return location.rule_contexts.get(
+        models.get('snapshot_version'),
+        lambda: load_rule_context(models['dish_ids'], models['category_bits'], models['category_index'], location.engine)
+    )
+
+def apply_rules_to_candidates(user_id, positions, scores):
     """
-    Calculate dynamic weights for CF and CBF based on user activity level.
-    
+    Run the business rules over one user's candidates.
+
     Parameters:
         user_id (int): The ID of the user.
-        
+        positions (np.ndarray): Catalog positions of the candidates.
+        scores (np.ndarray): Candidate scores aligned with positions.
+
     Returns:
-        tuple: (alpha, beta) where alpha is the weight for CF and beta for CBF.
+        tuple: (positions, scores, reasons) of the candidates that pass the rules.
+    """
+    logger.info(f"Applying business rules for User ID {user_id}.")
+    restriction_bits = user_restriction_bits(models['preferences'], user_id)
+    batch = rules_engine.evaluate(get_rule_context(), positions, scores, restriction_bits=restriction_bits)
+    keep = batch.keep[0]
+    return positions[keep], batch.scores[0][keep], batch.reasons[0][keep]
+
+def top_n_frame(positions, scores, reason):
+    """Materialize the TOP_N highest scoring dishes as a recommendations DataFrame."""
+    order = np.argsort(-scores, kind='stable')[:TOP_N]
+    recommendations = dish_frame(models['dishes'], positions[order], Score=scores[order])
+    recommendations['Reason'] = reason
+    return recommendations
+
+def compute_dynamic_weights(user_interactions):
     """
-    # Retrieve the number of interactions for the user (e.g., number of orders or ratings)
-    user_interactions = models['user_item_matrix'].loc[user_id].sum()
+    Calculate dynamic weights for CF and CBF based on user activity level, for every user at once.
     
+    Parameters:
+        user_interactions (np.ndarray): Interaction total per user (e.g., number of orders or ratings).
+        
+    Returns:
+        tuple: (alpha, beta) float32 arrays where alpha is the weight for CF and beta for CBF.
+    """
     # Define thresholds for low and high activity levels
     low_activity_threshold = 5  # Example threshold for low activity
     high_activity_threshold = 20  # Example threshold for high activity
     
-    # Set dynamic weights based on the user's activity level
-    if user_interactions <= low_activity_threshold:
-        # More weight for CBF for low-activity users (e.g., new users)
-        alpha = 0.3
-        beta = 0.7
-    elif user_interactions >= high_activity_threshold:
-        # More weight for CF for highly active users
-        alpha = 0.7
-        beta = 0.3
-    else:
-        # Gradually adjust weights between CF and CBF based on activity level
-        activity_range = high_activity_threshold - low_activity_threshold
-        alpha = 0.3 + (0.4 * ((user_interactions - low_activity_threshold) / activity_range))
-        beta = 1 - alpha
+    # Low-activity users (e.g., new users) get more weight for CBF (alpha = 0.3), highly active
+    # users more weight for CF (alpha = 0.7); in between the weights are adjusted gradually
+    activity_range = high_activity_threshold - low_activity_threshold
+    alpha = 0.3 + 0.4 * np.clip((user_interactions - low_activity_threshold) / activity_range, 0.0, 1.0)
+    alpha = alpha.astype(np.float32)
+    beta = (1 - alpha).astype(np.float32)
     
     return alpha, beta
 
+def calculate_dynamic_weights(user_id):
+    """
+    Calculate dynamic weights for CF and CBF based on user activity level.
+    
+    Parameters:
+        user_id (int): The ID of the user.
+        
+    Returns:
+        tuple: (alpha, beta) where alpha is the weight for CF and beta for CBF.
+    """
+    # Precomputed per snapshot; users without interactions get the low-activity weights
+    user_idx = lookup(models['user_ids'], user_id)
+    if user_idx < 0:
+        alpha, beta = compute_dynamic_weights(np.zeros(1))
+        return float(alpha[0]), float(beta[0])
+    return float(models['alpha'][user_idx]), float(models['beta'][user_idx])
+
 def generate_hybrid_recommendations(user_id):
     """
     Generate top N recommendations for a user using hybrid CF and CBF with strong diversity encouragement.
+
+    Two stages: the configured candidate generators (CF top-k, CBF neighbors, specials,
+    popular) propose a small set of dishes, and only that union is scored, penalized,
+    filtered by business rules and diversified.
     
     Parameters:
         user_id (int): The ID of the user.
@@ -215,109 +763,77 @@ def generate_hybrid_recommendations(user_id):
         logger.info(f"Generating hybrid recommendations for User ID {user_id} with strong diversity encouragement.")
 
         # Retrieve user index in the interaction matrix
-        if user_id not in models['user_item_matrix'].index:
+        user_idx = lookup(models['user_ids'], user_id)
+        if user_idx < 0:
             logger.error(f"User ID {user_id} not found in the interaction matrix.")
             return pd.DataFrame()  # Return empty DataFrame if user not found
 
-        user_idx = models['user_item_matrix'].index.get_loc(user_id)
-
-        # Retrieve user latent factors for CF
-        user_latent_factors = models['latent_matrix'][user_idx]
-
-        # Retrieve item latent factors for CF
-        item_factors = models['item_factors']
+        dishes = models['dishes']
+
+        # Dishes the user already purchased
+        purchased = purchased_positions(models, user_idx)
+
+        # Stage 1: candidate generation
+        request = {
+            'user_id': user_id,
+            'user_idx': user_idx,
+            'purchased': purchased,
+            'special_positions': get_rule_context().special_positions
+        }
+        candidates = generate_candidates(models, request, candidate_generators)
+        logger.info(f"{candidates.size} candidates generated for User ID {user_id}.")
+        if candidates.size == 0:
+            return pd.DataFrame()
 
+        # Stage 2: ranking of the candidates only
         # Compute predicted ratings (dot product of user and item latent factors for CF)
-        predicted_ratings = np.dot(item_factors, user_latent_factors)
+        cf_scores = models['item_factors'][candidates] @ models['latent_matrix'][user_idx]
 
-        # Create CF scores as a Series with DishID as index
-        dish_ids_cf = models['user_item_matrix'].columns  # Dishes in CF model
-        cf_scores = pd.Series(predicted_ratings, index=dish_ids_cf)
+        # Content-Based Filtering (CBF) Scores from the precomputed profile (mean similarity
+        # to the purchased dishes; zeros if the user has no purchased dishes)
+        if purchased.size == 0:
+            logger.warning(f"User ID {user_id} has no purchased dishes. CBF scores are zeros.")
+        cbf_scores = profile_scores(models['cbf_profiles'], user_idx, candidates)
 
-        # Content-Based Filtering (CBF) Scores
-        user_purchased_dishes = models['user_item_matrix'].loc[user_id]
-        purchased_dishes = user_purchased_dishes[user_purchased_dishes > 0].index.tolist()
-
-        if not purchased_dishes:
-            logger.warning(f"User ID {user_id} has no purchased dishes. Setting CBF scores to zeros.")
-            cbf_scores = pd.Series(0, index=models['dish_features_agg']['DishID'])
-        else:
-            # Map purchased dishes to indices in dish_features_agg
-            purchased_indices = models['dish_features_agg'][models['dish_features_agg']['DishID'].isin(purchased_dishes)].index.tolist()
-            if not purchased_indices:
-                logger.warning(f"No matching purchased dishes found in dish features. Setting CBF scores to zeros.")
-                cbf_scores = pd.Series(0, index=models['dish_features_agg']['DishID'])
-            else:
-                # Use content similarity matrix to get CBF scores
-                cbf_scores_array = models['content_similarity'][purchased_indices].mean(axis=0)
-                # Create CBF scores as a Series with DishID as index
-                dish_ids_cbf = models['dish_features_agg']['DishID']
-                cbf_scores = pd.Series(cbf_scores_array, index=dish_ids_cbf)
-
-        # Align CF and CBF scores based on DishID
-        cf_scores = cf_scores.reindex(cbf_scores.index).fillna(0)
-        cbf_scores = cbf_scores.fillna(0)
-
-        # Calculate dynamic weights for the user based on interaction level
-        alpha, beta = calculate_dynamic_weights(user_id)
+        # Dynamic weights for the user based on interaction level (precomputed per snapshot)
+        alpha, beta = models['alpha'][user_idx], models['beta'][user_idx]
         logger.info(f"Dynamic weights for User ID {user_id}: alpha (CF) = {alpha}, beta (CBF) = {beta}")
 
         # Combine CF and CBF scores with dynamic weights
-        final_scores = alpha * cf_scores.values + beta * cbf_scores.values
-
-        # Create Recommendations DataFrame
-        recommendations = pd.DataFrame({
-            'DishID': cbf_scores.index,
-            'Score': final_scores
-        })
-
-        # Exclude already purchased dishes
-        recommendations = recommendations[~recommendations['DishID'].isin(purchased_dishes)]
-
-        # Merge with dish details
-        recommendations = recommendations.merge(models['dish_features_agg'], on='DishID', how='left')
+        scores = alpha * cf_scores + beta * cbf_scores
+        popularity = dishes['Popularity'][candidates]
 
-        # Ensure 'Popularity' exists and calculate it if missing
-        if 'Popularity' not in recommendations.columns:
-            logger.info("Calculating popularity based on order count and rating data.")
-            recommendations['Popularity'] = recommendations['OrderCount'] + (recommendations['AverageRating'] * 2)
-
-        # Cap popular dishes (exclude top 20% most popular dishes)
-        popularity_threshold = recommendations['Popularity'].quantile(0.8)
-        recommendations = recommendations[recommendations['Popularity'] < popularity_threshold]
+        # Cap popular dishes (exclude the catalog's top 20% most popular dishes)
+        keep = popularity < models['popularity_cap']
+        positions, scores, popularity = candidates[keep], scores[keep], popularity[keep]
+        if positions.size == 0:
+            return pd.DataFrame()
 
         # Stronger penalty for popular dishes to encourage diversity
-        def dish_is_popular(dish_id):
-            popularity = recommendations.set_index('DishID').loc[dish_id, 'Popularity']
-            return popularity > recommendations['Popularity'].quantile(0.6)
+        penalty = np.where(popularity > models['popularity_penalty_threshold'], 0.7, 1.0).astype(np.float32)
+        scores = scores * penalty
 
-        recommendations['Penalty'] = recommendations['DishID'].apply(lambda x: 0.7 if dish_is_popular(x) else 1.0)
-        recommendations['Score'] *= recommendations['Penalty']
-
-        # Add a larger random factor to encourage diversity
-        recommendations['Score'] += np.random.uniform(0, 0.3, size=recommendations.shape[0])
+        # Add a random factor to encourage diversity; seeded per user, model version and
+        # time bucket so that the same inputs give the same list within a bucket
+        scores = scores + exploration_noise(
+            user_id, models.get('snapshot_version'), positions,
+            strength=Config.EXPLORATION_STRENGTH, period=Config.EXPLORATION_PERIOD
+        )
 
         # Apply Business Rules (e.g., dietary restrictions, promotions, inventory)
-        recommendations = apply_business_rules(recommendations, user_id, models['preferences'])
-
-        # Ensure category diversity
-        categories = recommendations['Category'].value_counts()
-        min_categories = 3  # Require at least 3 categories in the top results
-        top_n_with_categories = pd.DataFrame()
-
-        for category in categories.index:
-            top_n_with_categories = pd.concat([
-                top_n_with_categories,
-                recommendations[recommendations['Category'] == category].head(2)  # Allow max 2 dishes per category
-            ])
-            if len(top_n_with_categories) >= TOP_N:
-                break
-
-        # Handle any NaN values in 'Score' column
-        top_n_with_categories['Score'] = top_n_with_categories['Score'].fillna(0)
-
-        # Get Top N Recommendations with category diversity
-        top_n = top_n_with_categories.sort_values(by='Score', ascending=False).head(TOP_N)
+        positions, scores, reasons = apply_rules_to_candidates(user_id, positions, scores)
+
+        # Ensure category diversity: re-rank the scored candidates with per-category limits
+        selected = rerank(
+            models, positions, scores,
+            mode=Config.RERANK_MODE,
+            top_n=TOP_N,
+            max_per_category=Config.MAX_PER_CATEGORY,
+            mmr_lambda=Config.MMR_LAMBDA
+        )
+
+        # Get Top N Recommendations with category diversity; only these are materialized
+        top_n = dish_frame(dishes, positions[selected], Score=np.nan_to_num(scores[selected]))
         top_n['Reason'] = 'Hybrid Score with Dynamic Weights and Category Diversity'
 
         logger.info(f"Top {TOP_N} hybrid recommendations with dynamic weights generated for User ID {user_id}.")
@@ -330,6 +846,9 @@ def generate_content_based_recommendations(user_id):
     """
     Generate top N recommendations for a user based on their preferences.
 
+    Cold-start users are served from the ranked list of their preference segment
+    (precomputed per snapshot), followed by a personal business-rule pass.
+
     Parameters:
         user_id (int): The ID of the user.
 
@@ -339,133 +858,130 @@ def generate_content_based_recommendations(user_id):
     try:
         logger.info(f"Generating content-based recommendations for User ID {user_id}.")
 
-        # Fetch user preferences
-        user_prefs = models['preferences'][models['preferences']['UserID'] == user_id]
-        if user_prefs.empty:
+        # Look up the user's preference segment
+        position = lookup(models['preferences']['user_ids'], user_id)
+        if position < 0:
             logger.warning(f"No preferences found for User ID {user_id}. Cannot generate content-based recommendations.")
             return pd.DataFrame()
+        if len(models['segment_lists']) == 0:
+            logger.warning("No cold-start segments available. Using popular dishes.")
+            return recommend_popular_dishes(models['dishes'], models['popular_order'], user_id=user_id)
 
-        # Calculate weighted preferences
-        user_prefs = user_prefs.copy()
-        user_prefs['Weight'] = user_prefs['PreferenceScore'] / user_prefs['PreferenceScore'].sum()
+        segment = models['segment_of_user'][position]
+        positions = models['segment_lists'][segment]
+        scores = models['segment_scores'][segment]
+        ranked = positions >= 0
 
-        # Check for favorite dishes
-        favorite_dishes = user_prefs['FavoriteDish'].dropna().unique().tolist()
+        # If the segment matches no dishes, fall back to globally popular dishes
+        if not ranked.any():
+            logger.warning(f"No dishes found for the preference segment of User ID {user_id}. Using popular dishes.")
+            return recommend_popular_dishes(models['dishes'], models['popular_order'], user_id=user_id)
 
-        if not favorite_dishes:
-            logger.info(f"User ID {user_id} has preferences but no favorite dishes. Using CategoryID for recommendations.")
+        # Apply Business Rules for this user (dietary restrictions, promotions, inventory)
+        positions, scores, _ = apply_rules_to_candidates(user_id, positions[ranked], scores[ranked])
 
-            # Ensure 'CategoryID' exists in both user_prefs and dish_features_agg
-            if 'CategoryID' not in models['dish_features_agg'].columns:
-                logger.error("CategoryID column not found in dish features.")
-                return pd.DataFrame()
+        # Get Top N Recommendations
+        recommendations = top_n_frame(positions, np.nan_to_num(scores), 'Preference-Based')
 
-            # Use CategoryID to recommend dishes
-            category_ids = user_prefs['CategoryID'].dropna().unique().tolist()
-            potential_dishes = models['dish_features_agg'][models['dish_features_agg']['CategoryID'].isin(category_ids)]
-
-            # If no matches found, expand criteria to popular or related categories
-            if potential_dishes.empty:
-                logger.warning(f"No dishes found for the preferred categories for User ID {user_id}. Using popular dishes.")
-                # Fallback to globally popular dishes if no category matches
-                potential_dishes = recommend_popular_dishes(models['dish_features_agg'])
-
-            if potential_dishes.empty:
-                logger.warning(f"Still no recommendations found for User ID {user_id} even after fallback.")
-                return pd.DataFrame()
-
-            # Calculate scores based on CategoryID
-            scores_by_category = user_prefs.groupby('CategoryID')['Weight'].sum()
-            potential_dishes['Score'] = potential_dishes['CategoryID'].map(scores_by_category)
+        logger.info(f"Top {TOP_N} content-based recommendations generated for User ID {user_id} (segment {segment}).")
+        return recommendations[['DishID', 'DishName', 'Category', 'Ingredient', 'Score', 'Reason']]
+    except Exception as e:
+        logger.error(f"Error generating content-based recommendations for User ID {user_id}: {e}")
+        return pd.DataFrame()
 
-            # Handle NaN values in 'Score' column
-            potential_dishes['Score'] = potential_dishes['Score'].fillna(0)
+def generate_group_recommendations(user_ids, strategy=None, top_n=TOP_N):
+    """
+    Recommend dishes for a party in one vectorized pass.
 
-            # Remove dishes with zero score if necessary
-            potential_dishes = potential_dishes[potential_dishes['Score'] > 0]
+    All members are scored over the whole catalog at once (see app/group.py), their
+    normalized scores are aggregated with the group strategy, and the usual popularity
+    cap and penalty, business rules and diversity re-ranking run once for the group. The
+    dietary penalty uses the union of the members' restrictions. Dishes members ordered
+    before are kept: at a shared table they are good picks.
 
-            # Apply Business Rules
-            recommendations = apply_business_rules(potential_dishes, user_id, models['preferences'])
+    Parameters:
+        user_ids (list): Member user ids.
+        strategy (str, optional): 'average', 'least_misery' or 'most_pleasure'
+                                  (defaults to Config.GROUP_STRATEGY).
+        top_n (int): Number of dishes to return.
 
-            # Get Top N Recommendations
-            recommendations = recommendations.sort_values(by='Score', ascending=False).head(TOP_N)
-            recommendations['Reason'] = 'Category-Based Preference'
+    Returns:
+        pd.DataFrame: Top dishes with DishID, DishName, Category, Ingredient, Score and Reason.
 
-        else:
-            # Handle favorite dishes logic if present
-            favorite_indices = models['dish_features_agg'][models['dish_features_agg']['DishID'].isin(favorite_dishes)].index.tolist()
-            if not favorite_indices:
-                logger.warning(f"No matching favorite dishes found for User ID {user_id}.")
-                return pd.DataFrame()
-
-            # Compute content similarity based recommendations
-            weighted_content = np.zeros(models['content_similarity'].shape[1])
-            for idx, row in user_prefs.iterrows():
-                if pd.notnull(row['FavoriteDish']):
-                    dish_id = row['FavoriteDish']
-                    dish_entry = models['dish_features_agg'][models['dish_features_agg']['DishID'] == dish_id]
-                    if not dish_entry.empty:
-                        dish_idx = dish_entry.index[0]
-                        weighted_content += row['Weight'] * models['content_similarity'][dish_idx]
-
-            cbf_scores = weighted_content
-
-            # Handle any NaN values
-            cbf_scores = np.nan_to_num(cbf_scores)
-
-            # Create Recommendations DataFrame
-            recommendations = pd.DataFrame({
-                'DishID': models['dish_features_agg']['DishID'],
-                'Score': cbf_scores
-            })
-
-            # Merge with dish details
-            recommendations = recommendations.merge(models['dish_features_agg'], on='DishID', how='left')
-
-            # Apply Business Rules
-            recommendations = apply_business_rules(recommendations, user_id, models['preferences'])
-
-            # Handle any NaN values in 'Score' column
-            recommendations['Score'] = recommendations['Score'].fillna(0)
-
-            # Get Top N Recommendations
-            recommendations = recommendations.sort_values(by='Score', ascending=False).head(TOP_N)
-            recommendations['Reason'] = 'Preference-Based'
-
-        logger.info(f"Top {TOP_N} content-based recommendations generated for User ID {user_id}.")
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    strategy = (strategy or Config.GROUP_STRATEGY).lower()
+    try:
+        logger.info(f"Generating group recommendations for {len(user_ids)} users ({strategy}).")
+        scores, scored = group_member_scores(models, user_ids)
+        if len(scored) == 0:
+            logger.warning("No group member has interactions or preferences. Recommending popular dishes.")
+            return recommend_popular_dishes(models['dishes'], models['popular_order'])
+
+        group_scores = aggregate_scores(scores, strategy)
+
+        # Same popularity cap and penalty as the individual ranker
+        popularity = models['dishes']['Popularity']
+        group_scores = np.where(popularity > models['popularity_penalty_threshold'], 0.7, 1.0) * group_scores
+        group_scores[popularity >= models['popularity_cap']] = -np.inf
+
+        # Only the best-scored dishes go through the rules and the re-ranking
+        positions = np.flatnonzero(np.isfinite(group_scores))
+        pool = min(Config.CANDIDATES_PER_GENERATOR, positions.size)
+        if pool == 0:
+            return pd.DataFrame()
+        positions = positions[np.argpartition(-group_scores[positions], pool - 1)[:pool]]
+        group_scores = group_scores[positions].astype(np.float32)
+
+        restriction_bits = union_restriction_bits(models['preferences'], user_ids)
+        batch = rules_engine.evaluate(get_rule_context(), positions, group_scores, restriction_bits=restriction_bits)
+        keep = batch.keep[0]
+        positions, group_scores = positions[keep], batch.scores[0][keep]
+
+        selected = rerank(
+            models, positions, group_scores,
+            mode=Config.RERANK_MODE,
+            top_n=top_n,
+            max_per_category=Config.MAX_PER_CATEGORY,
+            mmr_lambda=Config.MMR_LAMBDA
+        )
+        recommendations = dish_frame(models['dishes'], positions[selected], Score=np.nan_to_num(group_scores[selected]))
+        recommendations['Reason'] = f"Group Recommendation ({strategy.replace('_', ' ').title()})"
+
+        logger.info(f"Top {len(recommendations)} group recommendations generated for {len(scored)} scored members.")
         return recommendations[['DishID', 'DishName', 'Category', 'Ingredient', 'Score', 'Reason']]
+    except ValueError:
+        raise
     except Exception as e:
-        logger.error(f"Error generating content-based recommendations for User ID {user_id}: {e}")
+        logger.error(f"Error generating group recommendations for User IDs {list(user_ids)}: {e}")
         return pd.DataFrame()
 
-def recommend_popular_dishes(dish_features_agg):
+def recommend_popular_dishes(dishes, popular_order=None, user_id=None):
     """
     Fallback to globally popular dishes when specific preferences cannot be matched.
 
     Parameters:
-        dish_features_agg (pd.DataFrame): Aggregated dish features.
+        dishes (dict): Column-wise dish metadata of the compact model.
+        popular_order (np.ndarray, optional): Precomputed catalog positions by descending popularity.
+        user_id (int, optional): Apply this user's business rules to the popular list.
 
     Returns:
         pd.DataFrame: DataFrame containing popular dishes.
     """
     try:
-        # If a 'Popularity' column does not exist, calculate popularity based on available data
-        if 'Popularity' not in dish_features_agg.columns:
-            logger.info("Calculating popularity based on available data (e.g., orders, ratings).")
-            # Example of creating a popularity score: combining ratings and orders
-            dish_features_agg['Popularity'] = (
-                dish_features_agg.get('RatingCount', 0) +  # Assumes a column 'RatingCount' exists
-                dish_features_agg.get('OrderCount', 0)    # Assumes a column 'OrderCount' exists
-            )
-
-        # Handle any NaN values in 'Popularity' column
-        dish_features_agg['Popularity'] = dish_features_agg['Popularity'].fillna(0)
+        if popular_order is None:
+            popular_order = np.argsort(-dishes['Popularity'], kind='stable')
 
-        # Sort by the calculated popularity score
-        popular_dishes = dish_features_agg.sort_values(by='Popularity', ascending=False).head(TOP_N)
+        # Take the most popular dishes (a wider list when the rules may filter some out)
+        positions = popular_order[:Config.SEGMENT_LIST_SIZE if user_id is not None else TOP_N]
+        scores = dishes['Popularity'][positions]  # Use popularity as the score
+        if user_id is not None:
+            positions, scores, _ = apply_rules_to_candidates(user_id, positions, scores)
+            order = np.argsort(-dishes['Popularity'][positions], kind='stable')[:TOP_N]
+            positions, scores = positions[order], scores[order]
 
-        # Add a 'Score' column to match the expected schema
-        popular_dishes['Score'] = popular_dishes['Popularity']  # Use popularity as the score
+        popular_dishes = dish_frame(dishes, positions, Score=scores)
 
         # Set the 'Reason' for recommendations
         popular_dishes['Reason'] = 'Popular Dish'
@@ -476,6 +992,89 @@ def recommend_popular_dishes(dish_features_agg):
         logger.error(f"Error generating popular dish recommendations: {e}")
         return pd.DataFrame()
 
+def get_frequently_ordered_with(dish_id, limit=10):
+    """
+    Dishes most frequently ordered together with a dish.
+
+    Parameters:
+        dish_id (int): The ID of the dish.
+        limit (int): Maximum number of dishes to return.
+
+    Returns:
+        list or None: Dicts with DishID, DishName, Category, Score (lift or PMI) and
+                      Count (shared baskets); None if the dish is unknown.
+    """
+    if 'cooccurrence_neighbors' not in models:
+        return None
+    position = lookup(models['dish_ids'], dish_id)
+    if position < 0:
+        return None
+    neighbors = models['cooccurrence_neighbors'][position][:limit]
+    present = neighbors >= 0
+    neighbors = neighbors[present]
+    dishes = models['dishes']
+    return [
+        {
+            'DishID': int(dishes['DishID'][neighbor]),
+            'DishName': dishes['DishName'][neighbor],
+            'Category': dishes['Category'][neighbor],
+            'Score': float(score),
+            'Count': int(count)
+        }
+        for neighbor, score, count in zip(
+            neighbors,
+            models['cooccurrence_scores'][position][:limit][present],
+            models['cooccurrence_counts'][position][:limit][present]
+        )
+    ]
+
+def get_similar_dishes(dish_id, limit=10, user_id=None, feature_ranges=None):
+    """
+    Dishes similar to a dish, from the precomputed neighbor lists.
+
+    Out-of-stock dishes are dropped using the cached inventory, and when a user is given,
+    dishes in any of the user's dietary restriction categories are dropped as well.
+
+    Parameters:
+        dish_id (int): The ID of the dish.
+        limit (int): Maximum number of dishes to return.
+        user_id (int, optional): Apply this user's dietary restrictions.
+        feature_ranges (dict, optional): Feature name -> (minimum, maximum) intensity, e.g.
+                                         {'Spiciness': (None, 3)}.
+
+    Returns:
+        list or None: Dicts with DishID, DishName, Category and Score; None if the dish is unknown.
+
+    Raises:
+        KeyError: If a feature in feature_ranges is unknown.
+    """
+    if 'similar_dishes' not in models:
+        return None
+    position = lookup(models['dish_ids'], dish_id)
+    if position < 0:
+        return None
+
+    neighbors = models['similar_dishes'][position]
+    scores = models['similar_dish_scores'][position]
+    keep = get_rule_context().quantity[neighbors] > 0
+    if user_id is not None:
+        restriction_bits = user_restriction_bits(models['preferences'], user_id)
+        keep &= ~bitsets_intersect(models['category_bits'][neighbors], restriction_bits)
+    if feature_ranges:
+        keep &= feature_range_mask(models['feature_names'], models['feature_values'], feature_ranges)[neighbors]
+    neighbors, scores = neighbors[keep][:limit], scores[keep][:limit]
+
+    dishes = models['dishes']
+    return [
+        {
+            'DishID': int(dishes['DishID'][neighbor]),
+            'DishName': dishes['DishName'][neighbor],
+            'Category': dishes['Category'][neighbor],
+            'Score': float(score)
+        }
+        for neighbor, score in zip(neighbors, scores)
+    ]
+
 def insert_recommendations(user_id, recommendations_df):
     """
     Insert generated recommendations into the DishRecommendation table after clearing old ones.
@@ -489,18 +1088,7 @@ def insert_recommendations(user_id, recommendations_df):
             logger.info(f"No recommendations to insert for User ID {user_id}.")
             return
 
-        logger.info(f"Clearing old recommendations for User ID {user_id}.")
-
-        # Delete old recommendations for the user
-        delete_query = """
-        DELETE FROM DishRecommendation WHERE UserID = :user_id
-        """
-        with engine.connect() as connection:
-            connection.execute(text(delete_query), {'user_id': user_id})
-        
-        logger.info(f"Old recommendations cleared for User ID {user_id}.")
-
-        logger.info(f"Inserting new recommendations for User ID {user_id} into the database.")
+        logger.info(f"Replacing recommendations for User ID {user_id} in the database.")
         
         # Ensure the 'Score' and 'Reason' fields exist in the DataFrame
         if 'Score' not in recommendations_df.columns:
@@ -509,37 +1097,122 @@ def insert_recommendations(user_id, recommendations_df):
             recommendations_df['Reason'] = 'Popular Dish'  # Set a default reason if missing
 
         # Prepare records for insertion
-        records = recommendations_df.to_dict(orient='records')
+        records = [
+            {
+                'UserID': user_id,
+                'DishID': record['DishID'],
+                'Reason': record.get('Reason', 'Popular Dish'),
+                'Score': record.get('Score', 0)
+            }
+            for record in recommendations_df.to_dict(orient='records')
+        ]
+        delete_query = """
+        DELETE FROM DishRecommendation WHERE UserID = :user_id
+        """
         insert_query = """
         INSERT OR REPLACE INTO DishRecommendation (UserID, DishID, Reason, Score)
         VALUES (:UserID, :DishID, :Reason, :Score)
         """
 
-        # Use a transaction context manager to handle commit and rollback automatically
-        with engine.begin() as connection:  # Automatically starts a transaction
+        # Delete and insert in one transaction so the SQLite write lock is taken once
+        # and readers never see the user without recommendations
+        with current_location().engine.begin() as connection:  # Automatically starts a transaction
             try:
-                for record in records:
-                    connection.execute(
-                        text(insert_query),
-                        {
-                            'UserID': user_id,
-                            'DishID': record['DishID'],
-                            'Reason': record.get('Reason', 'Popular Dish'),
-                            'Score': record.get('Score', 0)
-                        }
-                    )
+                connection.execute(text(delete_query), {'user_id': user_id})
+                connection.execute(text(insert_query), records)  # executemany
                 logger.info(f"Recommendations inserted successfully for User ID {user_id}.")
             except Exception as e:
                 logger.error(f"Error inserting recommendations for User ID {user_id}: {e}")
                 raise  # The transaction will be rolled back automatically
 
+        store_serving_list(user_id, recommendations_df)
+
     except Exception as e:
         logger.error(f"Failed to insert recommendations for User ID {user_id}: {e}")
 
 
+def store_serving_list(user_id, recommendations_df):
+    """
+    Write a user's top-N list to the serving store (buffered inside bulk_serving_writes()).
+
+    Parameters:
+        user_id (int): The ID of the user.
+        recommendations_df (pd.DataFrame): Recommendations with DishID, Score and Reason.
+    """
+    store = current_location().serving_store
+    if store is None:
+        return
+    try:
+        ranked = recommendations_df.sort_values('Score', ascending=False, kind='stable')
+        blob = encode_recommendations(ranked['DishID'], ranked['Score'], ranked['Reason'])
+        pending = _serving_writes.get()
+        if pending is not None:
+            pending.append((user_id, blob))
+        else:
+            store.put_many([(user_id, blob)])
+    except Exception as e:
+        logger.error(f"Error writing the serving list of User ID {user_id}: {e}")
+
+@contextmanager
+def bulk_serving_writes():
+    """Buffer the serving-store writes made inside the block and write them in one transaction."""
+    pending = []
+    token = _serving_writes.set(pending)
+    try:
+        yield pending
+    finally:
+        _serving_writes.reset(token)
+        store = current_location().serving_store
+        if pending and store is not None:
+            try:
+                store.put_many(pending)
+                logger.info(f"Wrote {len(pending)} recommendation lists to the serving store.")
+            except Exception as e:
+                logger.error(f"Error writing {len(pending)} lists to the serving store: {e}")
+
+def read_serving_list(user_id):
+    """
+    Read a user's stored recommendations from the serving store.
+
+    One key lookup; the display columns come from the models and out-of-stock dishes are
+    dropped with the cached inventory of the business rules.
+
+    Parameters:
+        user_id (int): The ID of the user.
+
+    Returns:
+        pd.DataFrame or None: The columns of get_user_recommendations(), or None if the
+                              serving store holds no list for the user.
+    """
+    store = current_location().serving_store
+    if store is None or 'dish_details' not in models:
+        return None
+    blob = store.get(user_id)
+    if blob is None:
+        return None
+
+    dish_ids, scores, reasons = decode_recommendations(blob)
+    positions = lookup_many(models['dish_ids'], dish_ids)
+    known = positions >= 0
+    quantity = np.zeros(len(dish_ids), dtype=np.float64)
+    quantity[known] = get_rule_context().quantity[positions[known]]
+    keep = np.flatnonzero(known & (quantity > 0))[:TOP_N]
+
+    # One DataFrame construction (adding columns one at a time costs more than the lookup)
+    return pd.DataFrame({
+        'DishID': dish_ids[keep].astype(np.int64),
+        **{column: values[positions[keep]] for column, values in models['dish_details'].items()},
+        'Reason': reasons[keep],
+        'Score': scores[keep].astype(np.float64),
+        'TotalQuantity': quantity[keep]
+    })
+
 def get_user_recommendations(user_id):
     """
-    Retrieve stored recommendations for a user from the database.
+    Retrieve stored recommendations for a user.
+
+    Served from the serving store when it holds the user's list (see read_serving_list()),
+    otherwise from the DishRecommendation table of the transactional database.
     
     Parameters:
         user_id (int): The ID of the user.
@@ -550,6 +1223,11 @@ def get_user_recommendations(user_id):
     try:
         logger.info(f"Retrieving recommendations for User ID {user_id}.")
 
+        recommendations = read_serving_list(user_id)
+        if recommendations is not None:
+            logger.info(f"Recommendations retrieved from the serving store for User ID {user_id}.")
+            return recommendations
+
         query = """
         SELECT Dish.DishID, Dish.Name AS Name, Dish.Description, Dish.Price, Dish.ImageURL, 
                DishRecommendation.Reason, DishRecommendation.Score, SUM(Storage.Quantity) AS TotalQuantity
@@ -563,7 +1241,7 @@ def get_user_recommendations(user_id):
         ORDER BY DishRecommendation.Score DESC
         LIMIT :top_n
         """
-        with engine.connect() as connection:
+        with current_location().engine.connect() as connection:
             recommendations = pd.read_sql(
                 text(query),
                 connection,
@@ -580,13 +1258,16 @@ def get_user_recommendations(user_id):
         logger.error(f"Error retrieving recommendations for User ID {user_id}: {e}")
         return pd.DataFrame()
 
-def save_user_preferences(user_id, preferences):
+def persist_user_preferences(user_id, preferences):
     """
-    Save user preferences to the database and generate recommendations.
+    Write user preferences to the database without regenerating anything.
     
     Parameters:
         user_id (int): The ID of the user.
         preferences (dict): A dictionary containing user preferences.
+
+    Returns:
+        bool: True if the preferences were committed, False otherwise.
     """
     try:
         query = """
@@ -598,7 +1279,7 @@ def save_user_preferences(user_id, preferences):
             CategoryID = EXCLUDED.CategoryID,
             PreferenceScore = EXCLUDED.PreferenceScore
         """
-        with engine.connect() as connection:
+        with current_location().engine.begin() as connection:  # Commits on success
             connection.execute(
                 text(query),
                 {
@@ -609,12 +1290,176 @@ def save_user_preferences(user_id, preferences):
                     'preference_score': preferences.get('PreferenceScore')
                 }
             )
+        current_location().dirty_users.mark([user_id], 'preferences')
+        logger.info(f"Preferences saved for User ID {user_id}.")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving preferences for User ID {user_id}: {e}")
+        return False
+
+def regenerate_user_recommendations(user_id):
+    """
+    Retrain on the latest data and regenerate recommendations for one user.
+
+    Used by the background regeneration workers after a preference update.
+
+    Parameters:
+        user_id (int): The ID of the user.
+
+    Returns:
+        bool: True if recommendations were generated and stored successfully.
+
+    Raises:
+        RuntimeError: If the retrain failed; the user's recommendations are left for the
+                      next successful retrain instead of being regenerated from the old models.
+    """
+    # Re-initialize the models to reflect updated preferences
+    if not initialize_models(fresh=True):  # Retrain models with updated data
+        raise RuntimeError(f"Retrain of location '{current_location().name}' failed. Recommendations were not regenerated.")
+    
+    # Generate new recommendations with updated models
+    return generate_and_store_recommendations(user_id, fresh=True)
+
+def scan_dirty_users():
+    """
+    Mark the users whose ratings, orders, preferences, or top-N dishes' stock or specials
+    changed since the previous scan.
+
+    Returns:
+        int: Number of users marked dirty.
+    """
+    try:
+        location = current_location()
+        rule_context = None
+        if 'dish_ids' in models:
+            rule_context = load_rule_context(
+                models['dish_ids'], models['category_bits'], models['category_index'], location.engine
+            )
+        return location.dirty_users.scan(location.engine, rule_context)
+    except Exception as e:
+        logger.error(f"Error scanning for changed user data: {e}")
+        return 0
+
+def regenerate_dirty_users(limit=None, reasons=None, include_stale=None):
+    """
+    Regenerate the stored recommendations of dirty users and of users past the staleness bound.
+
+    Users without stored recommendations are skipped; theirs are generated on request.
+
+    Parameters:
+        limit (int, optional): Maximum number of users to regenerate (defaults to
+                               Config.DIRTY_REGENERATION_LIMIT); the rest wait for the next run.
+        reasons (set, optional): Only regenerate users dirty for these reasons alone
+                                 (see DirtyUserTracker.due_users).
+        include_stale (bool, optional): Also regenerate users past the staleness bound
+                                        (defaults to True when `reasons` is not given).
+
+    Returns:
+        int: Number of users regenerated.
+    """
+    if limit is None:
+        limit = Config.DIRTY_REGENERATION_LIMIT
+    try:
+        location = current_location()
+        due = location.dirty_users.due_users(
+            location.engine, limit=limit or None, reasons=reasons, include_stale=include_stale
+        )
+    except Exception as e:
+        logger.error(f"Error listing users to regenerate: {e}")
+        return 0
+    if not due:
+        logger.info("No dirty or stale recommendations to regenerate.")
+        return 0
+
+    regenerated = 0
+    with bulk_serving_writes():
+        for user_id, reason in due:
+            logger.info(f"Regenerating recommendations for User ID {user_id} ({reason}).")
+            if generate_and_store_recommendations(user_id):
+                regenerated += 1
+    logger.info(f"Regenerated recommendations for {regenerated} of {len(due)} dirty or stale users.")
+    timings = ', '.join(
+        f"{name}={timing['mean_ms']:.3f}ms x{timing['calls']}" for name, timing in rules_engine.timings().items()
+    )
+    logger.info(f"Business rule mean times since startup: {timings}.")
+    return regenerated
+
+def refresh_rule_data():
+    """
+    Keep stored recommendations in line with specials, inventory and the staleness bound.
+
+    Reloads specials and inventory and regenerates, from the current models, the users whose
+    stored top-N is affected by stock or specials changes and the users past the staleness
+    bound. The retrain scheduler runs it on every tick that starts no model run, since these
+    changes do not move its change counters. Users dirty because of new ratings, orders or
+    preferences keep waiting for the next full retrain, which is what their new inputs need.
+
+    Returns:
+        int: Number of users regenerated.
+    """
+    scan_dirty_users()
+    current_location().rule_contexts.invalidate()
+    return regenerate_dirty_users(reasons=RULE_DATA_REASONS, include_stale=True)
+
+def refresh_models():
+    """
+    Cheap incremental refresh between full retrains, without extraction or refitting.
+
+    Counts the baskets of newly completed orders into the co-occurrence index, then runs
+    refresh_rule_data().
+    """
+    logger.info("Refreshing recommendation models incrementally...")
+    if 'dish_ids' in models:
+        models.update(build_cooccurrence_index(models['dish_ids']))
+    refresh_rule_data()
+
+def retrain_models():
+    """
+    Full retrain followed by regeneration of dirty and stale users.
+
+    The scan runs first so that every change it marks is in the snapshot the new models
+    are trained on. If the retrain fails, nothing is regenerated: the dirty users stay
+    dirty until a retrain succeeds instead of being rebuilt from the previous models.
+
+    Raises:
+        RuntimeError: If the retrain failed.
+    """
+    scan_dirty_users()
+    if not initialize_models():
+        raise RuntimeError(f"Retrain of location '{current_location().name}' failed. Keeping the previous models.")
+    regenerate_dirty_users()
+
+def regenerate_location_user(key):
+    """Background job: regenerate_user_recommendations() for a (location, user_id) key."""
+    location, user_id = key
+    with location_scope(location):
+        return regenerate_user_recommendations(user_id)
+
+# Background pool that regenerates recommendations after preference updates, keyed by
+# (location, user_id)
+regeneration_queue = RegenerationQueue(
+    regenerate_location_user,
+    workers=Config.REGENERATION_WORKERS,
+    max_queue_size=Config.REGENERATION_QUEUE_SIZE,
+    status_ttl=Config.REGENERATION_STATUS_TTL
+)
+
+def save_user_preferences(user_id, preferences):
+    """
+    Save user preferences to the database and generate recommendations synchronously.
+
+    The API route persists preferences with persist_user_preferences() and hands the
+    regeneration to regeneration_queue instead, so the request is not held for the retrain.
+    
+    Parameters:
+        user_id (int): The ID of the user.
+        preferences (dict): A dictionary containing user preferences.
+    """
+    try:
+        if not persist_user_preferences(user_id, preferences):
+            return
         
-        # Re-initialize the models to reflect updated preferences
-        initialize_models()  # Retrain models with updated data
-        
-        # Generate new recommendations with updated models
-        generate_and_store_recommendations(user_id)
+        regenerate_user_recommendations(user_id)
         
         logger.info(f"Preferences saved and recommendations generated for User ID {user_id}.")
     except Exception as e:
@@ -633,10 +1478,10 @@ def save_user_ratings(user_id, ratings):
         # (Assuming you have appropriate SQL queries to handle this)
         
         # **Re-initialize the models to reflect updated ratings**
-        initialize_models()  # Retrain models with updated data
+        initialize_models(fresh=True)  # Retrain models with updated data
         
         # Generate new recommendations with updated models
-        generate_and_store_recommendations(user_id)
+        generate_and_store_recommendations(user_id, fresh=True)
         
         logger.info(f"Ratings saved and recommendations generated for User ID {user_id}.")
     except Exception as e:
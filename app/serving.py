@@ -0,0 +1,200 @@
+# app/serving.py
+
+import os
+import time
+import struct
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Blob layout: list length, dish ids (int32), scores (float32), reason codes (uint8), and the
+# distinct reasons as newline-separated UTF-8
+_HEADER = struct.Struct('<I')
+
+
+def encode_recommendations(dish_ids, scores, reasons):
+    """
+    Serialize one user's top-N list into a compact blob.
+
+    Parameters:
+        dish_ids (array-like): Dish ids, best first.
+        scores (array-like): Scores aligned with dish_ids.
+        reasons (array-like): Reason strings aligned with dish_ids.
+
+    Returns:
+        bytes: The serialized list.
+    """
+    dish_ids = np.asarray(dish_ids, dtype='<i4')
+    scores = np.asarray(scores, dtype='<f4')
+    distinct, codes = np.unique(np.asarray(reasons, dtype=str), return_inverse=True)
+    if len(distinct) > 255:
+        raise ValueError("Too many distinct reasons in one recommendation list.")
+    return b''.join([
+        _HEADER.pack(len(dish_ids)),
+        dish_ids.tobytes(),
+        scores.tobytes(),
+        codes.astype(np.uint8).tobytes(),
+        '\n'.join(distinct).encode('utf-8')
+    ])
+
+
+def decode_recommendations(blob):
+    """
+    Deserialize a blob written by encode_recommendations().
+
+    Returns:
+        tuple: (dish ids int32, scores float32, reasons object array).
+    """
+    (n,) = _HEADER.unpack_from(blob)
+    offset = _HEADER.size
+    dish_ids = np.frombuffer(blob, dtype='<i4', count=n, offset=offset)
+    offset += 4 * n
+    scores = np.frombuffer(blob, dtype='<f4', count=n, offset=offset)
+    offset += 4 * n
+    codes = np.frombuffer(blob, dtype=np.uint8, count=n, offset=offset)
+    distinct = np.array(bytes(blob[offset + n:]).decode('utf-8').split('\n'), dtype=object)
+    return dish_ids, scores, distinct[codes] if n else np.empty(0, dtype=object)
+
+
+class MemoryServingStore:
+    """Serving store held in process memory (single-process deployments and development)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lists = {}
+
+    def get(self, user_id):
+        """Return the user's blob, or None if nothing is stored."""
+        return self._lists.get(int(user_id))
+
+    def put_many(self, items):
+        """Store (user_id, blob) pairs, replacing the users' previous lists."""
+        with self._lock:
+            self._lists.update((int(user_id), blob) for user_id, blob in items)
+
+    def close(self):
+        """Nothing to release; the lists go with the store."""
+
+    def __len__(self):
+        return len(self._lists)
+
+
+class SqliteServingStore:
+    """
+    Serving store in its own SQLite file, separate from the transactional database.
+
+    One row per user keyed by UserID (a WITHOUT ROWID table, so a read is one B-tree
+    lookup). The file runs in WAL mode, so reads never wait for the bulk writes. Each
+    thread keeps its own connection until close(); after that, every call opens and
+    closes a connection of its own, so callers that still hold the store keep working.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = set()     # Connections not closed yet, of every thread
+        self._busy = set()     # Connections running a call right now
+        self._closed = False
+        with self._use() as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS ServingRecommendation "
+                "(UserID INTEGER PRIMARY KEY, Payload BLOB NOT NULL, UpdatedAt REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _connect(self):
+        # Only ever used by one thread at a time, but closed by whichever thread calls close()
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def _use(self):
+        """The calling thread's connection, marked busy so that close() leaves it to this thread."""
+        connection = getattr(self._local, 'connection', None)
+        with self._lock:
+            reuse = connection is not None and connection in self._open
+            if reuse:
+                self._busy.add(connection)
+        if not reuse:
+            connection = self._connect()
+            with self._lock:
+                self._open.add(connection)
+                self._busy.add(connection)
+            self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            with self._lock:
+                self._busy.discard(connection)
+                release = self._closed
+                if release:
+                    self._open.discard(connection)
+            if release:
+                connection.close()
+
+    def get(self, user_id):
+        """Return the user's blob, or None if nothing is stored."""
+        with self._use() as connection:
+            row = connection.execute(
+                "SELECT Payload FROM ServingRecommendation WHERE UserID = ?", (int(user_id),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def put_many(self, items):
+        """Store (user_id, blob) pairs in one transaction, replacing the users' previous lists."""
+        now = time.time()
+        with self._use() as connection, connection:  # Commits on success
+            connection.executemany(
+                "INSERT OR REPLACE INTO ServingRecommendation (UserID, Payload, UpdatedAt) VALUES (?, ?, ?)",
+                [(int(user_id), blob, now) for user_id, blob in items]
+            )
+
+    def close(self):
+        """Close the connections of every thread; connections in use are closed when their call ends."""
+        with self._lock:
+            self._closed = True
+            idle = self._open - self._busy
+            self._open -= idle
+        for connection in idle:
+            connection.close()
+        if idle:
+            logger.info(f"Closed {len(idle)} serving store connections of {self.path}.")
+
+    def __len__(self):
+        with self._use() as connection:
+            return connection.execute("SELECT COUNT(*) FROM ServingRecommendation").fetchone()[0]
+
+
+# Available serving store backends
+SERVING_STORES = {
+    'sqlite': SqliteServingStore,
+    'memory': MemoryServingStore,
+}
+
+
+def create_serving_store(backend, path=None):
+    """
+    Create the serving store for the given backend name.
+
+    Parameters:
+        backend (str): 'sqlite', 'memory' or 'none' (serve from the transactional database).
+        path (str, optional): Database file of the 'sqlite' backend.
+
+    Returns:
+        The store, or None for 'none'.
+    """
+    backend = backend.lower()
+    if backend == 'none':
+        return None
+    if backend not in SERVING_STORES:
+        raise ValueError(f"Unknown serving store '{backend}'. Available stores: {sorted(SERVING_STORES) + ['none']}")
+    return SERVING_STORES[backend](path) if backend == 'sqlite' else SERVING_STORES[backend]()
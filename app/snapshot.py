@@ -0,0 +1,278 @@
+# app/snapshot.py
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+MODEL_FILE = 'model.pkl'  # Models trained on the snapshot (see Snapshot.save_model)
+
+# Cheap aggregate queries whose results change whenever the extracted data can change.
+# Row counts and max rowids catch inserts and deletes; the totals catch in-place updates.
+SOURCE_FINGERPRINT_QUERIES = {
+    'UserRating': "SELECT COUNT(*), MAX(rowid), TOTAL(Rating), TOTAL(DishID) FROM UserRating",
+    'Customer': "SELECT COUNT(*), MAX(rowid), TOTAL(UserID) FROM Customer",
+    'Order': "SELECT COUNT(*), MAX(rowid), TOTAL(Status = 'Completed'), TOTAL(CustomerID) FROM \"Order\"",
+    'OrderItem': "SELECT COUNT(*), MAX(rowid), TOTAL(DishID) FROM OrderItem",
+    'UserPreference': (
+        "SELECT COUNT(*), MAX(rowid), TOTAL(PreferenceScore), TOTAL(CategoryID), "
+        "TOTAL(DietaryRestrictions), TOTAL(FavoriteDish) FROM UserPreference"
+    ),
+    'Dish': (
+        "SELECT COUNT(*), MAX(rowid), GROUP_CONCAT(Name), TOTAL(Price), "
+        "GROUP_CONCAT(Description), GROUP_CONCAT(ImageURL) FROM Dish"
+    ),
+    'Category': "SELECT COUNT(*), MAX(rowid), GROUP_CONCAT(Name) FROM Category",
+    'DishCategory': "SELECT COUNT(*), MAX(rowid), TOTAL(CategoryID) FROM DishCategory",
+    'Ingredient': "SELECT COUNT(*), MAX(rowid), GROUP_CONCAT(Name) FROM Ingredient",
+    'DishIngredient': "SELECT COUNT(*), MAX(rowid), TOTAL(IngredientID) FROM DishIngredient",
+    'DishFeature': "SELECT COUNT(*), MAX(rowid), GROUP_CONCAT(Name) FROM DishFeature",
+    'DishFeatureMapping': "SELECT COUNT(*), MAX(rowid), TOTAL(FeatureValue) FROM DishFeatureMapping",
+}
+
+
+def compute_source_fingerprint(engine):
+    """
+    Fingerprint the source tables read by the extraction stage.
+
+    Parameters:
+        engine (sqlalchemy.Engine): Database engine.
+
+    Returns:
+        str: Hex digest that changes when any extracted table changes.
+    """
+    digest = hashlib.sha256()
+    with engine.connect() as connection:
+        for table, query in sorted(SOURCE_FINGERPRINT_QUERIES.items()):
+            row = connection.execute(text(query)).fetchone()
+            digest.update(f"{table}:{tuple(row)};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_string_column(series):
+    return not (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype))
+
+
+class SnapshotWriter:
+    """
+    Write extracted tables into a new snapshot version and publish it atomically.
+
+    Each column is stored in its own file: numeric columns as raw little-endian arrays
+    (so chunks can be appended while streaming), string columns as fixed-width unicode
+    `.npy` files with an optional null mask. The version only becomes visible to readers
+    once commit() swaps the LATEST pointer.
+    """
+
+    def __init__(self, root, fingerprint):
+        self.root = root
+        self.fingerprint = fingerprint
+        os.makedirs(root, exist_ok=True)
+        self.version = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{fingerprint[:8]}"
+        self.path = tempfile.mkdtemp(prefix='.building-', dir=root)
+        self.tables = {}
+
+    def write_table(self, name, frame):
+        """Write a whole DataFrame as table `name`."""
+        columns = {}
+        for column in frame.columns:
+            series = frame[column]
+            if _is_string_column(series):
+                columns[column] = self._write_string_column(name, column, series)
+            else:
+                columns[column] = self._append_numeric_column(name, column, series, None)
+        self.tables[name] = {'rows': len(frame), 'columns': columns}
+
+    def append_chunk(self, name, chunk):
+        """Append a DataFrame chunk to table `name`. Only numeric columns can be appended."""
+        table = self.tables.setdefault(name, {'rows': 0, 'columns': {}})
+        for column in chunk.columns:
+            if _is_string_column(chunk[column]):
+                raise ValueError(f"Cannot append string column '{column}' to snapshot table '{name}'.")
+            table['columns'][column] = self._append_numeric_column(
+                name, column, chunk[column], table['columns'].get(column)
+            )
+        table['rows'] += len(chunk)
+
+    def _append_numeric_column(self, table, column, series, spec):
+        if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            # Nullable integer/float columns are stored as float64 with NaN for missing values
+            series = series.astype('float64')
+        if spec is None:
+            dtype = np.dtype(series.dtype).newbyteorder('<')
+            spec = {'kind': 'numeric', 'file': f"{table}.{column}.bin", 'dtype': dtype.str}
+        values = series.to_numpy(dtype=np.dtype(spec['dtype']))
+        with open(os.path.join(self.path, spec['file']), 'ab') as handle:
+            handle.write(np.ascontiguousarray(values).tobytes())
+        return spec
+
+    def _write_string_column(self, table, column, series):
+        nulls = series.isna().to_numpy()
+        values = series.where(~nulls, '').astype(str).to_numpy(dtype=str)
+        spec = {'kind': 'string', 'file': f"{table}.{column}.npy"}
+        np.save(os.path.join(self.path, spec['file']), values)
+        if nulls.any():
+            spec['null_file'] = f"{table}.{column}.null.npy"
+            np.save(os.path.join(self.path, spec['null_file']), nulls)
+        return spec
+
+    def commit(self, keep=2):
+        """
+        Publish the snapshot and prune older versions.
+
+        Parameters:
+            keep (int): Number of most recent versions to keep on disk.
+
+        Returns:
+            Snapshot: Reader for the published version.
+        """
+        manifest = {
+            'version': self.version,
+            'fingerprint': self.fingerprint,
+            'created_at': datetime.now().isoformat(),
+            'tables': self.tables
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+
+        final_path = os.path.join(self.root, self.version)
+        os.rename(self.path, final_path)
+
+        # Swap the LATEST pointer atomically so readers never see a partial snapshot
+        pointer_tmp = os.path.join(self.root, f".{LATEST_FILE}.{os.getpid()}")
+        with open(pointer_tmp, 'w') as handle:
+            handle.write(self.version)
+        os.replace(pointer_tmp, os.path.join(self.root, LATEST_FILE))
+
+        prune_snapshots(self.root, keep=keep)
+        logger.info(f"Snapshot {self.version} written to {final_path}.")
+        return Snapshot(final_path)
+
+    def abort(self):
+        """Discard the partially written snapshot."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of one snapshot version."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as handle:
+            self.manifest = json.load(handle)
+        self.version = self.manifest['version']
+        self.fingerprint = self.manifest['fingerprint']
+        self.tables = self.manifest['tables']
+
+    def columns(self, table):
+        """
+        Return the columns of `table` as memory-mapped NumPy arrays (no data is copied).
+
+        String columns with nulls are returned as object arrays with None restored.
+        Tables that were never written (e.g. no chunks streamed) have no columns.
+        """
+        spec = self.tables.get(table, {'rows': 0, 'columns': {}})
+        arrays = {}
+        for column, column_spec in spec['columns'].items():
+            file_path = os.path.join(self.path, column_spec['file'])
+            if column_spec['kind'] == 'numeric':
+                dtype = np.dtype(column_spec['dtype'])
+                if spec['rows'] == 0:
+                    arrays[column] = np.empty(0, dtype=dtype)
+                else:
+                    arrays[column] = np.memmap(file_path, dtype=dtype, mode='r', shape=(spec['rows'],))
+            else:
+                values = np.load(file_path, mmap_mode='r')
+                if 'null_file' in column_spec:
+                    nulls = np.load(os.path.join(self.path, column_spec['null_file']))
+                    values = values.astype(object)
+                    values[nulls] = None
+                arrays[column] = values
+        return arrays
+
+    def frame(self, table):
+        """Load `table` as a pandas DataFrame."""
+        arrays = self.columns(table)
+        frame = pd.DataFrame({
+            column: values.astype(object) if values.dtype.kind == 'U' else np.asarray(values)
+            for column, values in arrays.items()
+        })
+        return frame
+
+    def save_model(self, models):
+        """
+        Store the models trained on this snapshot next to its data, so that they can be
+        loaded again without retraining as long as the source tables are unchanged.
+
+        Parameters:
+            models (dict): Picklable models and arrays.
+        """
+        tmp_path = os.path.join(self.path, f".{MODEL_FILE}.{os.getpid()}")
+        with open(tmp_path, 'wb') as handle:
+            pickle.dump(models, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(self.path, MODEL_FILE))
+
+    def load_model(self):
+        """Return the models stored by save_model(), or None if there are none."""
+        try:
+            with open(os.path.join(self.path, MODEL_FILE), 'rb') as handle:
+                return pickle.load(handle)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error loading the models of snapshot {self.version}: {e}")
+            return None
+
+    def iter_chunks(self, table, chunksize=50000):
+        """Yield `table` as DataFrames of at most `chunksize` rows read from the memory maps."""
+        arrays = self.columns(table)
+        rows = self.tables.get(table, {'rows': 0})['rows']
+        for start in range(0, rows, chunksize):
+            end = min(start + chunksize, rows)
+            yield pd.DataFrame({column: np.array(values[start:end]) for column, values in arrays.items()})
+
+
+def load_latest_snapshot(root):
+    """
+    Open the most recently published snapshot under `root`.
+
+    Returns:
+        Snapshot or None: The snapshot, or None if nothing has been published yet.
+    """
+    pointer = os.path.join(root, LATEST_FILE)
+    try:
+        with open(pointer) as handle:
+            version = handle.read().strip()
+        return Snapshot(os.path.join(root, version))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading snapshot from {root}: {e}")
+        return None
+
+
+def prune_snapshots(root, keep=2):
+    """Delete all but the `keep` most recent published snapshot versions."""
+    try:
+        with open(os.path.join(root, LATEST_FILE)) as handle:
+            latest = handle.read().strip()
+    except FileNotFoundError:
+        latest = None
+
+    versions = sorted(
+        entry for entry in os.listdir(root)
+        if os.path.isfile(os.path.join(root, entry, MANIFEST_FILE))
+    )
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != latest:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
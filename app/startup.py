@@ -0,0 +1,98 @@
+# app/startup.py
+
+import time
+import threading
+from config.config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    Startup state of the recommendation models, loaded by a background thread.
+
+    'starting' until the thread runs, 'loading' while it imports the recommendation stack
+    and loads or trains the default location's snapshot, 'ready' once those models are
+    live. A failed attempt is logged and retried every `retry_interval` seconds; the state
+    stays 'loading' and `last_error` holds the failure.
+    """
+
+    def __init__(self, retry_interval=60):
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self.state = 'starting'
+        self.attempts = 0
+        self.last_error = None
+        self.started_at = time.time()
+        self.ready_at = None
+
+    def start(self, target):
+        """Run `target` on a daemon thread until it succeeds (once per process)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(target,), name='model-warmup', daemon=True)
+            self._thread.start()
+
+    def _run(self, target):
+        while True:
+            with self._lock:
+                self.state = 'loading'
+                self.attempts += 1
+            try:
+                target()
+            except Exception as e:
+                logger.error(f"Error loading the recommendation models (attempt {self.attempts}): {e}")
+                with self._lock:
+                    self.last_error = str(e)
+                time.sleep(self.retry_interval)
+                continue
+            with self._lock:
+                self.state = 'ready'
+                self.last_error = None
+                self.ready_at = time.time()
+            self._ready.set()
+            logger.info(f"Recommendation models live {self.ready_at - self.started_at:.1f}s after startup.")
+            return
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the models are live; returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def status(self):
+        """Return the state, attempts, last_error and the seconds since startup (and until ready)."""
+        with self._lock:
+            return {
+                'state': self.state,
+                'attempts': self.attempts,
+                'last_error': self.last_error,
+                'uptime_seconds': round(time.time() - self.started_at, 3),
+                'ready_seconds': round(self.ready_at - self.started_at, 3) if self.ready_at else None
+            }
+
+
+def warm_up():
+    """
+    Import the recommendation stack and load the default location's models.
+
+    Reuses the model artifact of an unchanged snapshot, trains otherwise (see
+    services.initialize_models()).
+
+    Raises:
+        RuntimeError: If no models could be built (e.g. the database has no data yet).
+    """
+    # Deferred: pulls in pandas, scikit-learn and SQLAlchemy
+    from .services import model_registry
+    state = model_registry.get(Config.DEFAULT_LOCATION)
+    if not state.models:
+        raise RuntimeError(f"No models could be built for location '{Config.DEFAULT_LOCATION}'.")
+
+
+# Readiness of this process, reported by /readyz
+readiness = Readiness(retry_interval=Config.STARTUP_RETRY_INTERVAL)
@@ -0,0 +1,169 @@
+# app/streaming.py
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionAccumulator:
+    """
+    Accumulate ratings and orders chunk by chunk into sufficient statistics.
+
+    Only per-(user, dish) sums and counts are kept, so memory is bounded by the number of
+    distinct interactions rather than by the number of raw rows read from the database.
+    Pending chunks are merged into the running totals every `compact_every` rows.
+    """
+
+    def __init__(self, compact_every=1000000):
+        self.compact_every = compact_every
+        self._ratings = pd.DataFrame(columns=['UserID', 'DishID', 'RatingSum', 'RatingCount'])
+        self._orders = pd.DataFrame(columns=['UserID', 'DishID', 'PurchaseCount'])
+        self._pending_ratings = []
+        self._pending_orders = []
+        self._pending_rows = 0
+
+    def add_ratings(self, chunk):
+        """Add a chunk with UserID, DishID and Rating columns."""
+        if chunk.empty:
+            return
+        self._pending_ratings.append(pd.DataFrame({
+            'UserID': chunk['UserID'].astype(np.int64),
+            'DishID': chunk['DishID'].astype(np.int64),
+            'RatingSum': chunk['Rating'].astype(np.float32),
+            'RatingCount': np.ones(len(chunk), dtype=np.int32)
+        }))
+        self._pending_rows += len(chunk)
+        self._maybe_compact()
+
+    def add_orders(self, chunk):
+        """Add a chunk with UserID, DishID and PurchaseCount columns."""
+        if chunk.empty:
+            return
+        self._pending_orders.append(pd.DataFrame({
+            'UserID': chunk['UserID'].astype(np.int64),
+            'DishID': chunk['DishID'].astype(np.int64),
+            'PurchaseCount': chunk['PurchaseCount'].astype(np.float32)
+        }))
+        self._pending_rows += len(chunk)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._pending_rows >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Merge pending chunks into the running per-(user, dish) totals."""
+        if self._pending_ratings:
+            self._ratings = (
+                pd.concat([self._ratings] + self._pending_ratings, ignore_index=True)
+                .groupby(['UserID', 'DishID'], as_index=False)
+                .sum()
+            )
+        if self._pending_orders:
+            self._orders = (
+                pd.concat([self._orders] + self._pending_orders, ignore_index=True)
+                .groupby(['UserID', 'DishID'], as_index=False)
+                .sum()
+            )
+        self._pending_ratings = []
+        self._pending_orders = []
+        self._pending_rows = 0
+
+    def finalize(self):
+        """
+        Build sparse statistic matrices over the users and dishes seen so far.
+
+        Returns:
+            dict: 'user_ids' and 'dish_ids' (sorted pd.Index), plus CSR matrices
+                  'rating_sum', 'rating_count' and 'order_count' (users x dishes).
+        """
+        self.compact()
+
+        user_ids = pd.Index(np.union1d(self._ratings['UserID'], self._orders['UserID']).astype(np.int64))
+        dish_ids = pd.Index(np.union1d(self._ratings['DishID'], self._orders['DishID']).astype(np.int64))
+        shape = (len(user_ids), len(dish_ids))
+
+        def to_csr(frame, column):
+            rows = user_ids.get_indexer(frame['UserID'])
+            cols = dish_ids.get_indexer(frame['DishID'])
+            values = frame[column].to_numpy(dtype=np.float32)
+            return sp.csr_matrix((values, (rows, cols)), shape=shape)
+
+        return {
+            'user_ids': user_ids,
+            'dish_ids': dish_ids,
+            'rating_sum': to_csr(self._ratings, 'RatingSum'),
+            'rating_count': to_csr(self._ratings, 'RatingCount'),
+            'order_count': to_csr(self._orders, 'PurchaseCount')
+        }
+
+
+def build_interaction_matrix(stats):
+    """
+    Turn accumulated statistics into the sparse User-Item interaction matrix.
+
+    Mirrors preprocess_interaction_data: order counts are rescaled to 1-5 by the global
+    maximum, and each cell is the mean of its ratings and normalized order count.
+
+    Parameters:
+        stats (dict): Output of InteractionAccumulator.finalize().
+
+    Returns:
+        pd.DataFrame: Sparse-backed User-Item interaction matrix.
+    """
+    order_count = stats['order_count']
+    max_count = order_count.data.max() if order_count.nnz else 0
+
+    normalized_orders = order_count.copy()
+    if max_count > 0:
+        normalized_orders.data = normalized_orders.data / max_count * 5
+
+    has_order = order_count.copy()
+    has_order.data = np.ones_like(has_order.data)
+
+    totals = stats['rating_sum'] + normalized_orders
+    counts = stats['rating_count'] + has_order
+
+    # Element-wise mean over the observed cells only
+    means = totals.multiply(counts.power(-1)).tocsr().astype(np.float32)
+
+    # fillna only swaps the sparse fill value (NaN -> 0); nothing is densified
+    return pd.DataFrame.sparse.from_spmatrix(
+        means, index=stats['user_ids'], columns=stats['dish_ids']
+    ).fillna(0)
+
+
+def build_streaming_confidence_matrix(stats, order_weight=1.0, rating_weight=0.2):
+    """Implicit-feedback strengths from the same statistics (see build_confidence_matrix)."""
+    return (order_weight * stats['order_count'] + rating_weight * stats['rating_sum']).tocsr()
+
+
+def stream_interaction_statistics(rating_chunks, order_chunks, compact_every=1000000):
+    """
+    Consume rating and order chunks into an InteractionAccumulator.
+
+    Parameters:
+        rating_chunks (iterable of pd.DataFrame): Chunks of UserID, DishID, Rating.
+        order_chunks (iterable of pd.DataFrame): Chunks of UserID, DishID, PurchaseCount.
+        compact_every (int): Number of pending rows that triggers a merge.
+
+    Returns:
+        dict: Output of InteractionAccumulator.finalize().
+    """
+    accumulator = InteractionAccumulator(compact_every=compact_every)
+    n_chunks = 0
+    for chunk in rating_chunks:
+        accumulator.add_ratings(chunk)
+        n_chunks += 1
+    for chunk in order_chunks:
+        accumulator.add_orders(chunk)
+        n_chunks += 1
+    stats = accumulator.finalize()
+    logger.info(
+        f"Streamed {n_chunks} interaction chunks into a {len(stats['user_ids'])} x {len(stats['dish_ids'])} "
+        f"matrix."
+    )
+    return stats
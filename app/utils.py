@@ -1,25 +1,55 @@
 # app/utils.py
 
 import pandas as pd
+import numpy as np
+import scipy.sparse as sp
 from sqlalchemy import text
 import logging
-from .models import engine, TOP_N
+from .models import get_engine, TOP_N
+from .compact import build_category_bitsets, lookup_many, to_id_array
+from .rules import RuleContext, DEFAULT_RULES, create_rules_engine
 
 logger = logging.getLogger(__name__)
 
+USER_RATINGS_QUERY = """
+SELECT 
+    Customer.UserID, 
+    UserRating.DishID, 
+    UserRating.Rating
+FROM UserRating
+JOIN Customer ON UserRating.CustomerID = Customer.CustomerID
+WHERE UserRating.Rating IS NOT NULL
+"""
+
+USER_ORDERS_QUERY = """
+SELECT 
+    Customer.UserID, 
+    OrderItem.DishID, 
+    COUNT(*) AS PurchaseCount
+FROM "Order"
+JOIN OrderItem ON "Order".OrderID = OrderItem.OrderID
+JOIN Customer ON "Order".CustomerID = Customer.CustomerID
+WHERE "Order".Status = 'Completed'
+GROUP BY Customer.UserID, OrderItem.DishID
+"""
+
+# Completed order lines with their order date, for time-based evaluation splits
+ORDER_EVENTS_QUERY = """
+SELECT 
+    "Order".OrderID, 
+    "Order".OrderDate, 
+    Customer.UserID, 
+    OrderItem.DishID
+FROM "Order"
+JOIN OrderItem ON "Order".OrderID = OrderItem.OrderID
+JOIN Customer ON "Order".CustomerID = Customer.CustomerID
+WHERE "Order".Status = 'Completed'
+"""
+
 def extract_user_ratings(engine):
     """Extract user ratings from UserRating table by mapping CustomerID to UserID."""
-    query = """
-    SELECT 
-        Customer.UserID, 
-        UserRating.DishID, 
-        UserRating.Rating
-    FROM UserRating
-    JOIN Customer ON UserRating.CustomerID = Customer.CustomerID
-    WHERE UserRating.Rating IS NOT NULL
-    """
     try:
-        ratings = pd.read_sql(query, engine)
+        ratings = pd.read_sql(USER_RATINGS_QUERY, engine)
         logger.info("User ratings extracted successfully.")
         return ratings
     except Exception as e:
@@ -28,25 +58,36 @@ def extract_user_ratings(engine):
 
 def extract_user_orders(engine):
     """Extract user orders from Order and OrderItem tables by mapping CustomerID to UserID."""
-    query = """
-    SELECT 
-        Customer.UserID, 
-        OrderItem.DishID, 
-        COUNT(*) AS PurchaseCount
-    FROM "Order"
-    JOIN OrderItem ON "Order".OrderID = OrderItem.OrderID
-    JOIN Customer ON "Order".CustomerID = Customer.CustomerID
-    WHERE "Order".Status = 'Completed'
-    GROUP BY Customer.UserID, OrderItem.DishID
-    """
     try:
-        orders = pd.read_sql(query, engine)
+        orders = pd.read_sql(USER_ORDERS_QUERY, engine)
         logger.info("User orders extracted successfully.")
         return orders
     except Exception as e:
         logger.error(f"Error extracting user orders: {e}")
         return pd.DataFrame()
 
+def extract_order_events(engine):
+    """Extract every completed order line (OrderID, OrderDate, UserID, DishID) with its order date."""
+    try:
+        events = pd.read_sql(ORDER_EVENTS_QUERY, engine)
+        events['OrderDate'] = pd.to_datetime(events['OrderDate'], errors='coerce')
+        return events.dropna(subset=['OrderDate'])
+    except Exception as e:
+        logger.error(f"Error extracting order events: {e}")
+        return pd.DataFrame(columns=['OrderID', 'OrderDate', 'UserID', 'DishID'])
+
+def extract_user_ratings_chunked(engine, chunksize=50000):
+    """Yield user ratings in DataFrame chunks of at most `chunksize` rows."""
+    with engine.connect() as connection:
+        for chunk in pd.read_sql(text(USER_RATINGS_QUERY), connection, chunksize=chunksize):
+            yield chunk
+
+def extract_user_orders_chunked(engine, chunksize=50000):
+    """Yield per-user order counts in DataFrame chunks of at most `chunksize` rows."""
+    with engine.connect() as connection:
+        for chunk in pd.read_sql(text(USER_ORDERS_QUERY), connection, chunksize=chunksize):
+            yield chunk
+
 def extract_dish_features(engine):
     """
     Extract dish features including categories, ingredients, and additional features like spiciness, 
@@ -133,8 +174,102 @@ def preprocess_interaction_data(ratings, orders):
         logger.error(f"Error in preprocessing interaction data: {e}")
         return pd.DataFrame()
 
-def preprocess_dish_features(dish_features_df):
-    """Aggregate dish features into a combined text field and apply weights as string concatenation."""
+def build_confidence_matrix(ratings, orders, user_index, dish_index, order_weight=1.0, rating_weight=0.2):
+    """
+    Build a sparse implicit-feedback matrix aligned with the User-Item interaction matrix.
+
+    Unlike preprocess_interaction_data, raw order counts are kept (not rescaled by the global
+    maximum) so that repeat orders add confidence linearly, and ratings contribute on top.
+
+    Parameters:
+        ratings (pd.DataFrame): UserID, DishID, Rating.
+        orders (pd.DataFrame): UserID, DishID, PurchaseCount.
+        user_index (pd.Index): Row order (UserIDs) of the interaction matrix.
+        dish_index (pd.Index): Column order (DishIDs) of the interaction matrix.
+        order_weight (float): Feedback strength per completed order.
+        rating_weight (float): Feedback strength per rating star.
+
+    Returns:
+        scipy.sparse.csr_matrix: Users x Dishes feedback strengths.
+    """
+    frames = []
+    if not orders.empty:
+        frames.append(pd.DataFrame({
+            'UserID': orders['UserID'],
+            'DishID': orders['DishID'],
+            'Strength': orders['PurchaseCount'].astype(float) * order_weight
+        }))
+    if not ratings.empty:
+        frames.append(pd.DataFrame({
+            'UserID': ratings['UserID'],
+            'DishID': ratings['DishID'],
+            'Strength': ratings['Rating'].astype(float) * rating_weight
+        }))
+    if not frames:
+        return sp.csr_matrix((len(user_index), len(dish_index)))
+
+    feedback = pd.concat(frames, ignore_index=True)
+    rows = user_index.get_indexer(feedback['UserID'])
+    cols = dish_index.get_indexer(feedback['DishID'])
+    known = (rows >= 0) & (cols >= 0)
+
+    # Duplicate (user, dish) entries are summed by the COO -> CSR conversion
+    return sp.coo_matrix(
+        (feedback['Strength'].values[known], (rows[known], cols[known])),
+        shape=(len(user_index), len(dish_index))
+    ).tocsr()
+
+def extract_dish_popularity(engine):
+    """Extract per-dish order count and average rating from OrderItem and UserRating tables."""
+    query = """
+    SELECT
+        Dish.DishID,
+        COALESCE(COUNT(OrderItem.OrderID), 0) AS OrderCount,
+        COALESCE(AVG(UserRating.Rating), 0) AS AverageRating
+    FROM Dish
+    LEFT JOIN OrderItem ON Dish.DishID = OrderItem.DishID
+    LEFT JOIN UserRating ON Dish.DishID = UserRating.DishID
+    GROUP BY Dish.DishID
+    """
+    try:
+        dish_popularity = pd.read_sql(query, engine)
+        logger.info("Dish popularity extracted successfully.")
+        return dish_popularity
+    except Exception as e:
+        logger.error(f"Error extracting dish popularity: {e}")
+        return pd.DataFrame()
+
+def extract_dish_details(engine):
+    """Extract the display columns of every dish (served with stored recommendations) from the Dish table."""
+    query = "SELECT DishID, Name, Description, Price, ImageURL FROM Dish"
+    try:
+        dish_details = pd.read_sql(query, engine)
+        return dish_details
+    except Exception as e:
+        logger.error(f"Error extracting dish details: {e}")
+        return pd.DataFrame(columns=['DishID', 'Name', 'Description', 'Price', 'ImageURL'])
+
+def extract_active_special_dishes(engine):
+    """Extract the dishes whose special promotion is currently running from the SpecialDish table."""
+    query = """
+    SELECT SpecialDishID FROM SpecialDish
+    WHERE SpecialStartDate <= :current_date AND SpecialEndDate >= :current_date
+    """
+    try:
+        current_date = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+        with engine.connect() as connection:
+            special_dishes = pd.read_sql(text(query), connection, params={'current_date': current_date})
+        return special_dishes
+    except Exception as e:
+        logger.error(f"Error extracting special dishes: {e}")
+        return pd.DataFrame(columns=['SpecialDishID'])
+
+def preprocess_dish_features(dish_features_df, dish_order_rating=None):
+    """
+    Aggregate dish features into a combined text field and apply weights as string concatenation.
+
+    `dish_order_rating` (see extract_dish_popularity) is queried from the database when not given.
+    """
     try:
         # Handle missing values
         dish_features_df = dish_features_df.fillna('')
@@ -162,19 +297,8 @@ def preprocess_dish_features(dish_features_df):
         )
 
         # Add order count and average rating (if available) from OrderItem and UserRating tables
-        dish_order_rating_query = """
-        SELECT
-            Dish.DishID,
-            COALESCE(COUNT(OrderItem.OrderID), 0) AS OrderCount,
-            COALESCE(AVG(UserRating.Rating), 0) AS AverageRating
-        FROM Dish
-        LEFT JOIN OrderItem ON Dish.DishID = OrderItem.DishID
-        LEFT JOIN UserRating ON Dish.DishID = UserRating.DishID
-        GROUP BY Dish.DishID
-        """
-
-        # Execute the query and retrieve order and rating data
-        dish_order_rating = pd.read_sql(dish_order_rating_query, engine)
+        if dish_order_rating is None:
+            dish_order_rating = extract_dish_popularity(get_engine())
 
         # Merge the order count and rating into the aggregated dish features
         dish_features_agg = dish_features_agg.merge(dish_order_rating, on='DishID', how='left')
@@ -188,80 +312,105 @@ def preprocess_dish_features(dish_features_df):
         logger.error(f"Error in preprocessing dish features: {e}")
         return pd.DataFrame()
 
-def apply_business_rules(recommendations, user_id, preferences_df):
-    """Apply business rules such as dietary restrictions, availability, and special promotions."""
+def extract_dish_inventory(engine):
+    """Extract the total stock of the ingredients of every dish from the Storage table."""
+    query = """
+    SELECT Dish.DishID, SUM(Storage.Quantity) AS TotalQuantity
+    FROM Dish
+    JOIN DishIngredient ON Dish.DishID = DishIngredient.DishID
+    JOIN Storage ON DishIngredient.IngredientID = Storage.IngredientID
+    GROUP BY Dish.DishID
+    """
+    try:
+        with engine.connect() as connection:
+            inventory = pd.read_sql(text(query), connection)
+        return inventory
+    except Exception as e:
+        logger.error(f"Error extracting dish inventory: {e}")
+        return pd.DataFrame(columns=['DishID', 'TotalQuantity'])
+
+def extract_dish_categories(engine):
+    """Extract every (DishID, CategoryID) pair from the DishCategory table."""
+    query = "SELECT DishID, CategoryID FROM DishCategory"
+    try:
+        dish_categories = pd.read_sql(query, engine)
+        return dish_categories
+    except Exception as e:
+        logger.error(f"Error extracting dish categories: {e}")
+        return pd.DataFrame(columns=['DishID', 'CategoryID'])
+
+def extract_dish_feature_values(engine):
+    """Extract the numeric intensity of every dish feature from the DishFeatureMapping table."""
+    query = """
+    SELECT DishFeatureMapping.DishID, DishFeatureMapping.FeatureID,
+           DishFeature.Name AS FeatureName, DishFeatureMapping.FeatureValue
+    FROM DishFeatureMapping
+    JOIN DishFeature ON DishFeatureMapping.FeatureID = DishFeature.FeatureID
+    """
+    try:
+        feature_values = pd.read_sql(query, engine)
+        return feature_values
+    except Exception as e:
+        logger.error(f"Error extracting dish feature values: {e}")
+        return pd.DataFrame(columns=['DishID', 'FeatureID', 'FeatureName', 'FeatureValue'])
+
+def load_rule_context(dish_ids, category_bits, category_index, engine):
+    """
+    Load the current specials and inventory into a RuleContext over the given dishes.
+
+    Parameters:
+        dish_ids (np.ndarray): Sorted dish ids (the catalog the rules are evaluated on).
+        category_bits (np.ndarray): Category bitsets aligned with dish_ids.
+        category_index (np.ndarray): Sorted category ids, one per bit.
+        engine (sqlalchemy.Engine): Database engine.
+
+    Returns:
+        RuleContext: Per-dish rule data.
+    """
+    special_dishes = extract_active_special_dishes(engine)
+    inventory = extract_dish_inventory(engine)
+    return RuleContext(dish_ids, category_bits, category_index, special_dishes['SpecialDishID'], inventory)
+
+def apply_business_rules(recommendations, user_id, preferences_df, rule_context=None, rules_engine=None):
+    """
+    Apply business rules such as dietary restrictions, availability, and special promotions.
+
+    DataFrame front end of the vectorized rules engine (see app/rules.py). Returns the dishes
+    that pass the rules with the same columns, an adjusted 'Score' and an updated 'Reason'.
+    """
     try:
         logger.info(f"Applying business rules for User ID {user_id}.")
 
         # Ensure the 'Reason' column exists in recommendations DataFrame
         if 'Reason' not in recommendations.columns:
             recommendations['Reason'] = ''  # Initialize with empty strings
+        if recommendations.empty:
+            return recommendations
 
         # Fetch user preferences
         user_prefs = preferences_df[preferences_df['UserID'] == user_id]
+        dietary_restrictions_ids = user_prefs['DietaryRestrictions'].dropna().unique()
 
-        # Dietary Restrictions
-        dietary_restrictions_ids = user_prefs['DietaryRestrictions'].dropna().unique().tolist()
-        if dietary_restrictions_ids:
-            logger.info(f"Applying dietary restrictions: {dietary_restrictions_ids}")
-            recommendations['Penalty'] = recommendations['Category'].apply(
-                lambda x: 0.5 if x in dietary_restrictions_ids else 1.0
-            )
-            recommendations['Score'] *= recommendations['Penalty']
-            recommendations = recommendations.drop(columns=['Penalty'])
-
-        # Special Promotions
-        current_date = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-        special_query = """
-        SELECT SpecialDishID FROM SpecialDish
-        WHERE SpecialStartDate <= :current_date AND SpecialEndDate >= :current_date
-        """
-        with engine.connect() as connection:
-            special_dishes = pd.read_sql(
-                text(special_query),
-                connection,
-                params={'current_date': current_date}
-            )
-
-        if not special_dishes.empty:
-            special_dish_ids = special_dishes['SpecialDishID'].tolist()
-            logger.info(f"Applying special promotions for Dish IDs: {special_dish_ids}")
-            recommendations.loc[recommendations['DishID'].isin(special_dish_ids), 'Score'] += 1
-            recommendations['Reason'] = recommendations.apply(
-                lambda row: 'Special Promotion' if row['DishID'] in special_dish_ids else row['Reason'], axis=1
-            )
-
-        # Inventory Constraints
-        inventory_query = """
-        SELECT Dish.DishID, SUM(Storage.Quantity) AS TotalQuantity
-        FROM Dish
-        JOIN DishIngredient ON Dish.DishID = DishIngredient.DishID
-        JOIN Storage ON DishIngredient.IngredientID = Storage.IngredientID
-        GROUP BY Dish.DishID
-        """
-        with engine.connect() as connection:
-            available_dishes = pd.read_sql(
-                text(inventory_query),
-                connection
-            )
-        recommendations = recommendations.merge(available_dishes, on='DishID', how='left')
-        recommendations['TotalQuantity'] = recommendations['TotalQuantity'].fillna(0)
-
-        # Update availability status based on inventory
-        recommendations['AvailabilityStatus'] = recommendations['TotalQuantity'].apply(
-            lambda x: 'In Stock' if x > 0 else 'Out of Stock'
-        )
+        dish_ids = to_id_array(recommendations['DishID'])
+        if rule_context is None:
+            catalog = np.unique(dish_ids)
+            engine = get_engine()
+            category_index, category_bits = build_category_bitsets(catalog, extract_dish_categories(engine))
+            rule_context = load_rule_context(catalog, category_bits, category_index, engine)
+        rules_engine = rules_engine or create_rules_engine(DEFAULT_RULES)
 
-        # Filter only dishes that are 'In Stock'
-        recommendations = recommendations[recommendations['AvailabilityStatus'] == 'In Stock']
-
-        # Penalize dishes with low inventory instead of excluding them
-        low_stock_threshold = 5  # Set a threshold for low stock
-        recommendations['InventoryPenalty'] = recommendations['TotalQuantity'].apply(
-            lambda x: 0.5 if x < low_stock_threshold else 1.0
+        positions = lookup_many(rule_context.dish_ids, dish_ids)
+        known = positions >= 0
+        batch = rules_engine.evaluate(
+            rule_context, positions[known], recommendations['Score'].to_numpy()[known],
+            [dietary_restrictions_ids]
         )
-        recommendations['Score'] *= recommendations['InventoryPenalty']
-        recommendations = recommendations.drop(columns=['InventoryPenalty', 'TotalQuantity', 'AvailabilityStatus'])
+
+        recommendations = recommendations[known].copy()
+        recommendations['Score'] = batch.scores[0]
+        tagged = batch.reasons[0] != ''
+        recommendations.loc[tagged, 'Reason'] = batch.reasons[0][tagged]
+        recommendations = recommendations[batch.keep[0]]
 
         logger.info("Business rules applied to recommendations.")
         return recommendations
@@ -0,0 +1,160 @@
+# app/workers.py
+
+import time
+import queue
+import itertools
+import threading
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RegenerationQueueFull(Exception):
+    """Raised when the regeneration backlog is at capacity."""
+
+
+class RegenerationQueue:
+    """
+    Bounded background worker pool that regenerates recommendations per user.
+
+    Every submit() bumps the user's requested version. Updates for a user that is already
+    queued are coalesced into the queued job; updates that arrive while the user's job is
+    running schedule exactly one follow-up job. Clients poll status() and compare
+    'completed_version' with the version returned by submit(). The status of a user whose
+    last job finished more than `status_ttl` seconds ago is forgotten. Versions are drawn
+    from one counter shared by all users, so a user's versions keep increasing (they are
+    not consecutive) even after the status was forgotten.
+    """
+
+    def __init__(self, job, workers=2, max_queue_size=1000, status_ttl=3600):
+        self.job = job
+        self.workers = workers
+        self.status_ttl = status_ttl
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._status = {}
+        self._versions = itertools.count(1)   # Requested versions, increasing across users and expiry
+        self._last_expiry = time.monotonic()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"regeneration-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.workers} recommendation regeneration workers.")
+
+    def submit(self, user_id):
+        """
+        Request a regeneration for a user.
+
+        Parameters:
+            user_id (int): The ID of the user.
+
+        Returns:
+            int: The requested version; the job is done once completed_version reaches it.
+
+        Raises:
+            RegenerationQueueFull: If a new job is needed but the queue is at capacity.
+        """
+        self.start()
+        with self._lock:
+            self._expire()
+            status = self._status.setdefault(user_id, {
+                'requested_version': 0,
+                'completed_version': 0,
+                'state': 'idle',
+                'queued': False,
+                'error': None,
+                'updated_at': None,
+                'finished_at': None
+            })
+            previous_version = status['requested_version']
+            version = status['requested_version'] = next(self._versions)
+            if status['queued'] or status['state'] == 'running':
+                # Coalesced into the queued job, or picked up again when the running one finishes
+                logger.info(f"Coalesced regeneration request v{version} for User ID {user_id}.")
+                return version
+            try:
+                self._queue.put_nowait(user_id)
+            except queue.Full:
+                status['requested_version'] = previous_version
+                raise RegenerationQueueFull(f"Regeneration queue is full ({self._queue.maxsize} users).")
+            status['queued'] = True
+            status['state'] = 'queued'
+        return version
+
+    def status(self, user_id):
+        """Return a copy of the regeneration status for a user, or None if never submitted (or expired)."""
+        with self._lock:
+            status = self._status.get(user_id)
+            if status is None:
+                return None
+            return {key: value for key, value in status.items() if key not in ('queued', 'finished_at')}
+
+    def _expire(self):
+        # Forget finished users past the TTL; scans at most once per minute (or per TTL if shorter)
+        now = time.monotonic()
+        if now - self._last_expiry < min(self.status_ttl, 60):
+            return
+        self._last_expiry = now
+        expired = [
+            user_id for user_id, status in self._status.items()
+            if status['finished_at'] is not None and now - status['finished_at'] > self.status_ttl
+        ]
+        for user_id in expired:
+            del self._status[user_id]
+        if expired:
+            logger.info(f"Expired the regeneration status of {len(expired)} users.")
+
+    def _worker(self):
+        while True:
+            user_id = self._queue.get()
+            try:
+                self._run(user_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, user_id):
+        with self._lock:
+            status = self._status[user_id]
+            status['queued'] = False
+            status['state'] = 'running'
+            status['finished_at'] = None
+            target_version = status['requested_version']
+
+        error = None
+        try:
+            if not self.job(user_id):
+                error = 'Regeneration did not produce recommendations.'
+        except Exception as e:
+            logger.error(f"Background regeneration failed for User ID {user_id}: {e}")
+            error = str(e)
+
+        with self._lock:
+            status['completed_version'] = target_version
+            status['error'] = error
+            status['updated_at'] = datetime.now().isoformat()
+            status['state'] = 'failed' if error else 'done'
+            status['finished_at'] = time.monotonic()
+            if status['requested_version'] > target_version:
+                # Updates arrived while running: regenerate once more with the latest data
+                try:
+                    self._queue.put_nowait(user_id)
+                    status['queued'] = True
+                    status['state'] = 'queued'
+                    status['finished_at'] = None
+                except queue.Full:
+                    status['state'] = 'stale'
+                    logger.warning(f"Regeneration queue full; follow-up for User ID {user_id} dropped.")
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._queue.join()
@@ -22,4 +22,143 @@ class Config:
     # Number of Recommendations
     TOP_N = int(os.getenv('TOP_N', 10))
     
+    # Collaborative Filtering backend: 'svd' (Truncated SVD) or 'als' (implicit-feedback ALS)
+    CF_BACKEND = os.getenv('CF_BACKEND', 'svd')
+    CF_COMPONENTS = int(os.getenv('CF_COMPONENTS', 50))  # Number of latent factors
+    
+    # Implicit ALS settings (used when CF_BACKEND = 'als')
+    ALS_ITERATIONS = int(os.getenv('ALS_ITERATIONS', 15))
+    ALS_REGULARIZATION = float(os.getenv('ALS_REGULARIZATION', 0.1))
+    ALS_ALPHA = float(os.getenv('ALS_ALPHA', 40.0))        # Confidence scaling: c_ui = 1 + alpha * r_ui
+    ALS_CG_STEPS = int(os.getenv('ALS_CG_STEPS', 3))       # Conjugate-gradient steps per half-iteration
+    ALS_NUM_THREADS = int(os.getenv('ALS_NUM_THREADS', 0)) # 0 = use all available cores
+    ALS_ORDER_WEIGHT = float(os.getenv('ALS_ORDER_WEIGHT', 1.0))    # Feedback strength per completed order
+    ALS_RATING_WEIGHT = float(os.getenv('ALS_RATING_WEIGHT', 0.2))  # Feedback strength per rating star
+    
+    # Training mode: 'batch' loads all interactions into pandas, 'streaming' reads them in
+    # chunks into a sparse matrix and fits with bounded working memory
+    TRAINING_MODE = os.getenv('TRAINING_MODE', 'batch')
+    STREAMING_CHUNK_SIZE = int(os.getenv('STREAMING_CHUNK_SIZE', 50000))  # Rows per read / users per fold-in step
+    
+    # Local columnar snapshot of the extracted training data
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+    SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', 2))  # Number of snapshot versions kept on disk
+    
+    # Background regeneration after preference updates
+    REGENERATION_WORKERS = int(os.getenv('REGENERATION_WORKERS', 2))
+    REGENERATION_QUEUE_SIZE = int(os.getenv('REGENERATION_QUEUE_SIZE', 1000))  # Max users waiting
+    REGENERATION_STATUS_TTL = int(os.getenv('REGENERATION_STATUS_TTL', 3600))  # Seconds a finished job's status is kept
+    
+    # Two-stage recommendation pipeline: candidate generators (comma-separated, from
+    # 'cf', 'cbf', 'cooccurrence', 'specials', 'popular') and candidates proposed by each of them
+    CANDIDATE_GENERATORS = os.getenv('CANDIDATE_GENERATORS', 'cf,cbf,cooccurrence,specials,popular')
+    CANDIDATES_PER_GENERATOR = int(os.getenv('CANDIDATES_PER_GENERATOR', 200))
+    NEIGHBORS_PER_DISH = int(os.getenv('NEIGHBORS_PER_DISH', 50))  # Precomputed content neighbors per dish
+    
+    # "Frequently ordered together" index built from OrderItem baskets
+    COOCCURRENCE_TOP_K = int(os.getenv('COOCCURRENCE_TOP_K', 20))           # Dishes kept per dish
+    COOCCURRENCE_MEASURE = os.getenv('COOCCURRENCE_MEASURE', 'lift')        # 'lift' or 'pmi'
+    COOCCURRENCE_MIN_COUNT = int(os.getenv('COOCCURRENCE_MIN_COUNT', 2))    # Minimum shared baskets
+    COOCCURRENCE_MAX_PAIRS = int(os.getenv('COOCCURRENCE_MAX_PAIRS', 2000000))  # Exact pair counts kept in memory
+    
+    # Business rules, evaluated in order (from 'dietary_penalty', 'promotion_boost',
+    # 'out_of_stock_filter', 'low_stock_penalty'), and their parameters
+    BUSINESS_RULES = os.getenv('BUSINESS_RULES', 'dietary_penalty,promotion_boost,out_of_stock_filter,low_stock_penalty')
+    DIETARY_PENALTY = float(os.getenv('DIETARY_PENALTY', 0.5))      # Score multiplier for restricted categories
+    PROMOTION_BOOST = float(os.getenv('PROMOTION_BOOST', 1.0))      # Score added to running specials
+    LOW_STOCK_THRESHOLD = float(os.getenv('LOW_STOCK_THRESHOLD', 5))
+    LOW_STOCK_PENALTY = float(os.getenv('LOW_STOCK_PENALTY', 0.5))  # Score multiplier below the threshold
+    RULE_DATA_TTL = int(os.getenv('RULE_DATA_TTL', 60))             # Seconds specials/inventory are cached
+    
+    # "Similar dishes" lists: neighbors kept per dish (before request-time filtering) and the
+    # weight of the TF-IDF content similarity in the blend with CF item-factor similarity
+    SIMILAR_DISHES_TOP_K = int(os.getenv('SIMILAR_DISHES_TOP_K', 50))
+    SIMILAR_CONTENT_WEIGHT = float(os.getenv('SIMILAR_CONTENT_WEIGHT', 0.5))
+    
+    # Precomputed CBF profile per user: only the top-k scores per user are stored (other
+    # dishes score 0); 0 keeps the full dense n_users x n_dishes matrix (opt-in, small catalogs)
+    CBF_PROFILE_TOP_K = int(os.getenv('CBF_PROFILE_TOP_K', 100))
+    
+    # Cold-start users: preference profiles clustered into segments, each with a ranked list
+    COLD_START_SEGMENTS = int(os.getenv('COLD_START_SEGMENTS', 16))
+    SEGMENT_LIST_SIZE = int(os.getenv('SEGMENT_LIST_SIZE', 100))  # Dishes ranked per segment
+    
+    # Diversity re-ranking: 'quota' (greedy, per-category limit), 'mmr' (maximal marginal
+    # relevance over content neighbors, with the same limit) or 'none'
+    RERANK_MODE = os.getenv('RERANK_MODE', 'quota')
+    MAX_PER_CATEGORY = int(os.getenv('MAX_PER_CATEGORY', 2))
+    MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', 0.7))  # 1.0 = relevance only, 0.0 = diversity only
+    
+    # Dirty-user tracking: after each retrain only users whose inputs changed are regenerated,
+    # plus users whose stored recommendations are older than the staleness bound
+    STALENESS_BOUND = int(os.getenv('STALENESS_BOUND', 86400))          # Seconds
+    DIRTY_REGENERATION_LIMIT = int(os.getenv('DIRTY_REGENERATION_LIMIT', 500))  # Users per run, 0 = no limit
+    # Order statuses that can still become 'Completed' (comma-separated); orders in any other
+    # status (cancelled, refunded, ...) are never waited for
+    OPEN_ORDER_STATUSES = tuple(
+        status.strip() for status in os.getenv('OPEN_ORDER_STATUSES', 'Pending').split(',') if status.strip()
+    )
+    
+    # Retrain scheduling driven by the volume of new ratings, completed orders and preference rows
+    RETRAIN_CHECK_INTERVAL = int(os.getenv('RETRAIN_CHECK_INTERVAL', 60))        # Seconds between checks
+    REFRESH_CHANGE_THRESHOLD = int(os.getenv('REFRESH_CHANGE_THRESHOLD', 1))     # Changes for an incremental refresh
+    RETRAIN_CHANGE_THRESHOLD = int(os.getenv('RETRAIN_CHANGE_THRESHOLD', 500))   # Changes for a full retrain
+    RETRAIN_MIN_INTERVAL = int(os.getenv('RETRAIN_MIN_INTERVAL', 300))   # Seconds between full retrains, at least
+    RETRAIN_MAX_INTERVAL = int(os.getenv('RETRAIN_MAX_INTERVAL', 3600))  # Full retrain after this if anything changed
+    
+    # Threads running independent extraction queries and model-build stages concurrently
+    # (0 = ThreadPoolExecutor default)
+    MODEL_BUILD_WORKERS = int(os.getenv('MODEL_BUILD_WORKERS', 4))
+    
+    # Incremental content index: IDF weights are recomputed (with all similarities) once this
+    # fraction of the catalog was added, edited or removed since the last recomputation
+    CONTENT_IDF_REFRESH_RATIO = float(os.getenv('CONTENT_IDF_REFRESH_RATIO', 0.1))
+    
+    # Weight of the numeric feature intensities (DishFeatureMapping.FeatureValue) in the content
+    # similarity; the TF-IDF text similarity gets the rest
+    NUMERIC_FEATURE_WEIGHT = float(os.getenv('NUMERIC_FEATURE_WEIGHT', 0.3))
+    
+    # Group (party/table) recommendations: how member scores are aggregated ('average',
+    # 'least_misery' or 'most_pleasure') and the largest accepted party
+    GROUP_STRATEGY = os.getenv('GROUP_STRATEGY', 'average')
+    GROUP_MAX_SIZE = int(os.getenv('GROUP_MAX_SIZE', 20))
+    
+    # Multi-location serving: one catalog per restaurant location. The default location uses
+    # the engine of app/models.py and SNAPSHOT_DIR; any other location uses LOCATION_DATABASE_URI
+    # with '{location}' replaced by its name, and its own directory under SNAPSHOT_DIR
+    DEFAULT_LOCATION = os.getenv('DEFAULT_LOCATION', 'default')
+    LOCATION_DATABASE_URI = os.getenv('LOCATION_DATABASE_URI', 'sqlite:///locations/{location}.db')
+    # Memory of all resident locations (models, content index, co-occurrence counts); least
+    # recently used locations are evicted beyond it (0 = no budget)
+    MODEL_MEMORY_BUDGET_MB = int(os.getenv('MODEL_MEMORY_BUDGET_MB', 0))
+    # Seconds before a location whose models failed to load is tried again (doubled after each
+    # consecutive failure); requests in between get the popularity fallback or a 503
+    LOCATION_RETRY_BACKOFF = int(os.getenv('LOCATION_RETRY_BACKOFF', 60))
+    
+    # Read-optimized store of the precomputed top-N lists, separate from the transactional
+    # database: 'sqlite' (one file per location in SERVING_STORE_DIR), 'memory' or 'none'
+    SERVING_STORE = os.getenv('SERVING_STORE', 'sqlite')
+    SERVING_STORE_DIR = os.getenv('SERVING_STORE_DIR', 'serving')
+    
+    # Exploration noise added to the hybrid scores: uniform in [0, EXPLORATION_STRENGTH), seeded
+    # per user, model version and EXPLORATION_PERIOD-second bucket (0 = never rotate)
+    EXPLORATION_STRENGTH = float(os.getenv('EXPLORATION_STRENGTH', 0.3))
+    EXPLORATION_PERIOD = int(os.getenv('EXPLORATION_PERIOD', 3600))
+    
+    # Offline evaluation (python -m app.evaluation): time-based folds, metric cut-off, test
+    # users sampled per fold (0 = all) and worker processes (0 = one per CPU)
+    EVALUATION_FOLDS = int(os.getenv('EVALUATION_FOLDS', 3))
+    EVALUATION_K = int(os.getenv('EVALUATION_K', 10))
+    EVALUATION_MAX_USERS = int(os.getenv('EVALUATION_MAX_USERS', 200))
+    EVALUATION_WORKERS = int(os.getenv('EVALUATION_WORKERS', 0))
+    
+    # Startup: the models load in the background (a failed attempt is retried after
+    # STARTUP_RETRY_INTERVAL seconds); until they are live, reads are served from a cached
+    # popularity list (FALLBACK_LIST_SIZE dishes, refreshed every FALLBACK_TTL seconds) and
+    # other endpoints answer 503 with Retry-After: STARTUP_RETRY_AFTER
+    STARTUP_RETRY_INTERVAL = int(os.getenv('STARTUP_RETRY_INTERVAL', 60))
+    STARTUP_RETRY_AFTER = int(os.getenv('STARTUP_RETRY_AFTER', 5))
+    FALLBACK_TTL = int(os.getenv('FALLBACK_TTL', 60))
+    FALLBACK_LIST_SIZE = int(os.getenv('FALLBACK_LIST_SIZE', 50))
+    
     # Other configurations can be added here
@@ -1,18 +1,64 @@
 from app import create_app
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.services import initialize_models
+from app.startup import readiness
+from config.config import Config
 import logging
 
 app = create_app()
 
+# The recommendation services are imported by the jobs below: app.startup loads them in the
+# background, and the first tick runs once the models are live
+
 def retrain_recommendation_models():
-    logging.info("Retraining recommendation models...")
-    initialize_models()
+    from app.services import current_location, retrain_models
+    logging.info(f"Retraining recommendation models of location '{current_location().name}'...")
+    retrain_models()
+
+def create_retrain_scheduler():
+    from app.scheduler import RetrainScheduler, count_changes
+    from app.services import current_location, refresh_models, refresh_rule_data
+    # Full retrain or incremental refresh, depending on how much the training inputs changed;
+    # inventory, specials and stale recommendations are handled on the ticks in between.
+    # Ticks run inside the location's scope, so every callback acts on that location.
+    return RetrainScheduler(
+        full_retrain=retrain_recommendation_models,
+        incremental_refresh=refresh_models,
+        maintenance=refresh_rule_data,
+        counter=lambda: count_changes(current_location().engine),
+        refresh_threshold=Config.REFRESH_CHANGE_THRESHOLD,
+        retrain_threshold=Config.RETRAIN_CHANGE_THRESHOLD,
+        min_interval=Config.RETRAIN_MIN_INTERVAL,
+        max_interval=Config.RETRAIN_MAX_INTERVAL
+    )
+
+# One retrain scheduler per resident location, created on the first tick after it is loaded
+retrain_schedulers = {}
+
+def tick_resident_locations():
+    """Run the retrain scheduler of every resident location; evicted locations are forgotten."""
+    if not readiness.is_ready():
+        return  # Still loading the models at startup
+    from app.services import model_registry, scan_dirty_users, use_location
+    resident = dict(model_registry.resident())
+    for location in set(retrain_schedulers).difference(resident):
+        del retrain_schedulers[location]
+    for location, state in resident.items():
+        if not state.models:
+            continue  # Not loaded yet (or the load failed): nothing to keep fresh
+        with use_location(state):
+            retrain_scheduler = retrain_schedulers.get(location)
+            if retrain_scheduler is None:
+                # Loaded since the last tick: its models reflect the current data
+                retrain_scheduler = retrain_schedulers[location] = create_retrain_scheduler()
+                scan_dirty_users()
+                retrain_scheduler.start()
+                continue
+            retrain_scheduler.tick()
 
 if __name__ == '__main__':
-    # Set up the scheduler to run the retraining function every 10 minutes
+    # Check the change volume periodically; the scheduler skips ticks while a run is in progress
     scheduler = BackgroundScheduler()
-    scheduler.add_job(retrain_recommendation_models, 'interval', minutes=10)
+    scheduler.add_job(tick_resident_locations, 'interval', seconds=Config.RETRAIN_CHECK_INTERVAL, max_instances=1)
     scheduler.start()
 
     try:
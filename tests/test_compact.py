@@ -0,0 +1,125 @@
+# tests/test_compact.py
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from app.cf_backends import ALSBackend
+from app.compact import (
+    bitsets_intersect, build_category_bitsets, build_dish_columns, build_neighbor_table, build_user_profiles,
+    category_bitmask, category_membership, dish_frame, lookup, lookup_many, profile_scores, to_id_array
+)
+
+
+def test_lookup_matches_dataframe_index():
+    rng = np.random.default_rng(3)
+    ids = np.unique(rng.integers(1, 5000, size=700)).astype(np.int32)
+    values = np.concatenate([rng.choice(ids, size=200), rng.integers(-10, 5100, size=200)]).astype(np.int32)
+
+    expected = pd.Index(ids).get_indexer(values)
+
+    np.testing.assert_array_equal(lookup_many(ids, values), expected)
+    assert [lookup(ids, value) for value in values] == expected.tolist()
+    np.testing.assert_array_equal(lookup_many(ids[:0], values), np.full(len(values), -1))
+
+
+def test_to_id_array_maps_missing_values():
+    ids = to_id_array(pd.Series([3, None, 7.0, '', '12']))
+    assert ids.dtype == np.int32
+    assert ids.tolist() == [3, -1, 7, -1, 12]
+
+
+def test_dish_frame_matches_dataframe_rows():
+    features = pd.DataFrame({
+        'DishID': [30, 10, 20, 40],
+        'DishName': ['D30', 'D10', 'D20', None],
+        'CategoryID': [3, 1, 2, 1],
+        'OrderCount': [5, 1, np.nan, 2],
+    })
+    dishes, order = build_dish_columns(features)
+    wanted = [40, 10, 30]
+
+    frame = dish_frame(dishes, lookup_many(dishes['DishID'], np.array(wanted)), Score=[0.3, 0.2, 0.1])
+
+    expected = features.set_index('DishID').loc[wanted].reset_index()
+    assert order.tolist() == [1, 2, 0, 3]
+    assert frame['DishID'].tolist() == wanted
+    assert frame['DishName'].tolist() == expected['DishName'].fillna('').tolist()
+    assert frame['CategoryID'].tolist() == expected['CategoryID'].tolist()
+    np.testing.assert_allclose(frame['OrderCount'], expected['OrderCount'].fillna(0))
+    assert frame['Score'].tolist() == [0.3, 0.2, 0.1]
+
+
+def test_category_bitsets_match_dataframe_membership():
+    rng = np.random.default_rng(5)
+    dish_ids = np.arange(1, 51, dtype=np.int32)
+    # More than 64 categories, so the bitsets span several words
+    pairs = pd.DataFrame({
+        'DishID': rng.integers(1, 55, size=300),
+        'CategoryID': rng.integers(1, 150, size=300),
+    }).drop_duplicates()
+    category_index, bitsets = build_category_bitsets(dish_ids, pairs)
+    assert bitsets.shape == (len(dish_ids), 3)
+
+    queried = [1, 64, 65, 128, 149, 999]
+    membership = category_membership(bitsets, category_index, queried)
+    for column, category in enumerate(queried):
+        members = set(pairs.loc[pairs['CategoryID'] == category, 'DishID'])
+        np.testing.assert_array_equal(membership[:, column], np.isin(dish_ids, list(members)))
+
+    restrictions = [3, 70, 140]
+    mask = category_bitmask(category_index, restrictions, bitsets.shape[1])
+    restricted = set(pairs.loc[pairs['CategoryID'].isin(restrictions), 'DishID'])
+    np.testing.assert_array_equal(bitsets_intersect(bitsets, mask), np.isin(dish_ids, list(restricted)))
+
+
+def test_neighbor_table_matches_argsort():
+    rng = np.random.default_rng(11)
+    similarity = rng.uniform(size=(30, 30)).astype(np.float32)
+
+    neighbors, scores = build_neighbor_table(similarity, k=5, chunk_size=7)
+
+    masked = similarity.copy()
+    np.fill_diagonal(masked, -np.inf)
+    expected = np.argsort(-masked, axis=1, kind='stable')[:, :5]
+    np.testing.assert_array_equal(neighbors, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(similarity, expected, axis=1))
+
+
+def test_als_fold_in_solves_the_normal_equations():
+    rng = np.random.default_rng(13)
+    interactions = sp.random(12, 20, density=0.3, random_state=1, format='csr') * 5
+    backend = ALSBackend(n_components=4, iterations=3, regularization=0.1, alpha=2.0, num_threads=1)
+    backend.fit(interactions)
+
+    user_factors = backend.fold_in_users(interactions)
+
+    Y = backend.item_factors
+    dense = interactions.toarray()
+    for user in rng.choice(12, size=4, replace=False):
+        confidence = 1.0 + backend.alpha * dense[user]
+        preference = (dense[user] > 0).astype(float)
+        A = Y.T @ (confidence[:, None] * Y) + backend.regularization * np.eye(Y.shape[1])
+        expected = np.linalg.solve(A, Y.T @ (confidence * preference))
+        np.testing.assert_allclose(user_factors[user], expected, rtol=1e-4, atol=1e-8)
+
+
+def test_top_k_profiles_match_the_dense_profiles():
+    rng = np.random.default_rng(17)
+    interactions = sp.random(40, 25, density=0.15, random_state=2, format='csr')
+    similarity = rng.uniform(size=(25, 25)).astype(np.float32)
+
+    dense = build_user_profiles(interactions, similarity, top_k=0, chunk_size=16)['cbf_profiles']
+    sparse = build_user_profiles(interactions, similarity, top_k=5, chunk_size=16)['cbf_profiles']
+
+    assert sp.issparse(sparse) and not sp.issparse(dense)
+    for user in range(40):
+        row = sparse[user]
+        if not interactions[user].nnz:
+            assert row.nnz == 0   # No purchases: nothing stored
+            continue
+        expected = np.sort(dense[user])[-5:]
+        np.testing.assert_allclose(np.sort(row.data), expected, rtol=1e-6)
+        positions = np.arange(25)
+        scores = profile_scores(sparse, user, positions)
+        np.testing.assert_allclose(scores[row.indices], dense[user, row.indices], rtol=1e-6)
+        assert np.count_nonzero(scores) == 5
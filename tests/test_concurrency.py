@@ -0,0 +1,194 @@
+# tests/test_concurrency.py
+
+import contextvars
+import threading
+import time
+import pytest
+from app.concurrency import SingleFlight, TaskGraph
+
+location = contextvars.ContextVar('location', default=None)
+
+
+def test_tasks_run_after_their_dependencies_with_their_results_in_order():
+    finished = []
+
+    def task(name, value):
+        def run(*args):
+            finished.append(name)
+            return value + sum(args)
+        return run
+
+    graph = TaskGraph()
+    graph.add('a', task('a', 1))
+    graph.add('b', task('b', 10))
+    graph.add('c', lambda b, a: (b, a), 'b', 'a')
+    graph.add('d', task('d', 100), 'a', 'b')
+
+    results = graph.run(max_workers=4)
+
+    assert results == {'a': 1, 'b': 10, 'c': (10, 1), 'd': 111}
+    assert finished.index('d') > max(finished.index('a'), finished.index('b'))
+
+
+def test_graph_rejects_unknown_and_duplicate_tasks():
+    graph = TaskGraph()
+    graph.add('a', lambda: 1)
+    with pytest.raises(ValueError, match='already'):
+        graph.add('a', lambda: 2)
+    with pytest.raises(ValueError, match='unknown'):
+        graph.add('b', lambda x: x, 'missing')
+
+
+def test_tasks_see_the_callers_context_variables():
+    graph = TaskGraph()
+    graph.add('first', location.get)
+    graph.add('second', lambda first: (first, location.get()), 'first')
+
+    token = location.set('downtown')
+    try:
+        results = graph.run(max_workers=2)
+    finally:
+        location.reset(token)
+
+    assert results == {'first': 'downtown', 'second': ('downtown', 'downtown')}
+    assert location.get() is None
+
+
+def test_failure_is_raised_without_waiting_for_running_tasks():
+    release = threading.Event()
+    dependents = []
+
+    def fail():
+        raise RuntimeError("query failed")
+
+    graph = TaskGraph()
+    graph.add('slow', lambda: release.wait(10))
+    graph.add('broken', fail)
+    graph.add('dependent', lambda result: dependents.append(result), 'broken')
+
+    start = time.perf_counter()
+    try:
+        with pytest.raises(RuntimeError, match='query failed'):
+            graph.run(max_workers=2)
+        # Raised while 'slow' is still blocked, and the dependent task never ran
+        assert time.perf_counter() - start < 5
+        assert not release.is_set()
+        assert dependents == []
+    finally:
+        release.set()
+
+
+class CountingSingleFlight(SingleFlight):
+    """Counts the callers that joined an execution, so tests can wait for them deterministically."""
+
+    def __init__(self):
+        super().__init__()
+        self.joined = 0
+
+    def _wait(self, call):
+        with self._lock:
+            self.joined += 1
+        return super()._wait(call)
+
+
+def wait_until(condition):
+    deadline = time.perf_counter() + 5
+    while not condition():
+        assert time.perf_counter() < deadline
+        time.sleep(0.005)
+
+
+def run_in_threads(count, target):
+    # Start `count` threads running target(); return (results, errors) once they finish
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    single_flight = CountingSingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load(location):
+        calls.append(location)
+        started.set()
+        release.wait(5)
+        return {'location': location}
+
+    leader, results, errors = run_in_threads(1, lambda: single_flight.do('downtown', load, 'downtown'))
+    assert started.wait(5)
+    followers, follower_results, _ = run_in_threads(5, lambda: single_flight.do('downtown', load, 'downtown'))
+    other = single_flight.do('airport', lambda: 'airport')   # Other keys are not blocked
+    wait_until(lambda: single_flight.joined == 5)
+    assert single_flight.in_flight('downtown')
+
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert calls == ['downtown'] and other == 'airport' and not errors
+    # Every caller receives the very same object
+    assert len(results + follower_results) == 6
+    assert all(result is results[0] for result in follower_results)
+    assert not single_flight.in_flight('downtown')
+
+
+def test_error_is_raised_to_every_waiting_caller_and_not_cached():
+    single_flight = CountingSingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise RuntimeError("snapshot is corrupt")
+
+    leader, _, errors = run_in_threads(1, lambda: single_flight.do('key', load))
+    assert started.wait(5)
+    followers, _, follower_errors = run_in_threads(3, lambda: single_flight.do('key', load))
+    wait_until(lambda: single_flight.joined == 3)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert [str(error) for error in errors + follower_errors] == ["snapshot is corrupt"] * 4
+    # The next call runs again
+    assert single_flight.do('key', lambda: 'recovered') == 'recovered'
+
+
+def test_fresh_callers_share_one_follow_up_execution():
+    single_flight = CountingSingleFlight()
+    started, release = threading.Event(), threading.Event()
+    versions = iter(range(1, 10))
+
+    def load():
+        version = next(versions)
+        if version == 1:
+            started.set()
+            release.wait(5)
+        return version
+
+    leader, results, _ = run_in_threads(1, lambda: single_flight.do('key', load))
+    assert started.wait(5)
+    fresh, fresh_results, _ = run_in_threads(3, lambda: single_flight.do('key', load, fresh=True))
+    # One fresh caller leads the queued follow-up, the other two join it
+    wait_until(lambda: single_flight.joined == 2 and 'key' in single_flight._pending)
+    release.set()
+    for thread in leader + fresh:
+        thread.join(5)
+
+    # The fresh callers never see the run that started before them, and run it only once more
+    assert results == [1]
+    assert fresh_results == [2, 2, 2]
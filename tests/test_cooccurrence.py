@@ -0,0 +1,99 @@
+# tests/test_cooccurrence.py
+
+from collections import Counter
+from itertools import combinations
+import numpy as np
+import pandas as pd
+from app.cooccurrence import CooccurrenceCounter, CountMinSketch, pair_keys, split_pair_keys
+
+
+def test_pair_keys_round_trip():
+    first = np.array([1, 7, 2_000_000_000])
+    second = np.array([2, 9, 2_000_000_001])
+    decoded_first, decoded_second = split_pair_keys(pair_keys(first, second))
+    np.testing.assert_array_equal(decoded_first, first)
+    np.testing.assert_array_equal(decoded_second, second)
+
+
+def test_sketch_overestimate_bounds():
+    rng = np.random.default_rng(1)
+    keys = np.unique(rng.integers(1, 1 << 40, size=5000))
+    counts = rng.integers(1, 20, size=len(keys))
+    sketch = CountMinSketch(width=1024, depth=4)
+    # Added in two parts, as successive prunes do
+    sketch.add(keys[:2000], counts[:2000])
+    sketch.add(keys[2000:], counts[2000:])
+
+    error = sketch.estimate(keys) - counts
+
+    # Never under-estimates, and the error is at most e/width of the total for most keys
+    assert error.min() >= 0
+    bound = np.e / sketch.width * counts.sum()
+    assert np.mean(error > bound) < np.exp(-sketch.depth) * 2
+    assert error.max() <= counts.sum()
+
+
+def test_sketch_estimate_of_unseen_keys():
+    sketch = CountMinSketch(width=64, depth=3)
+    assert sketch.estimate(np.array([5, 6])).tolist() == [0, 0]
+    assert len(sketch.estimate(np.array([], dtype=np.int64))) == 0
+
+
+def basket_rows(baskets, first_order_id=1):
+    return pd.DataFrame(
+        [(order_id, dish_id) for order_id, basket in enumerate(baskets, first_order_id) for dish_id in basket],
+        columns=['OrderID', 'DishID']
+    )
+
+
+def served_counts(counter, dish_ids):
+    index = counter.build_index(dish_ids, top_k=len(dish_ids) - 1, min_count=1)
+    counts = {}
+    for row, rank in np.argwhere(index['neighbors'] >= 0):
+        pair = tuple(sorted((int(dish_ids[row]), int(dish_ids[index['neighbors'][row, rank]]))))
+        counts[pair] = int(index['counts'][row, rank])
+    return counts
+
+
+def test_counts_are_exact_until_the_first_eviction():
+    rng = np.random.default_rng(4)
+    baskets = [rng.choice(np.arange(1, 12), size=3, replace=False) for _ in range(100)]
+    counter = CooccurrenceCounter(max_pairs=1000)
+    counter._add_baskets(basket_rows(baskets))
+
+    expected = Counter(pair for basket in baskets for pair in combinations(sorted(basket), 2))
+    assert counter.n_evicted == 0
+    assert served_counts(counter, np.arange(1, 12, dtype=np.int32)) == dict(expected)
+
+
+def test_pruned_counts_are_bounded_and_never_under_counted():
+    rng = np.random.default_rng(2)
+    baskets = [rng.choice(np.arange(1, 30), size=rng.integers(2, 6), replace=False) for _ in range(400)]
+    rows = basket_rows(baskets)
+    counter = CooccurrenceCounter(max_pairs=60, sketch_width=256, sketch_depth=4)
+    for start in range(0, len(baskets), 50):
+        counter._add_baskets(rows[(rows['OrderID'] > start) & (rows['OrderID'] <= start + 50)])
+        assert len(counter.pair_counts) <= counter.max_pairs
+        assert len(counter.pair_base) <= len(counter.pair_counts)
+
+    expected = Counter(pair for basket in baskets for pair in combinations(sorted(basket), 2))
+    assert counter.n_baskets == len(baskets)
+    assert counter.n_evicted > 0
+    served = served_counts(counter, np.arange(1, 30, dtype=np.int32))
+    assert served
+    assert all(count >= expected[pair] for pair, count in served.items())
+
+
+def test_evicted_pair_re_enters_the_index():
+    # Pair (1, 2) is rare while the table fills up and gets evicted, then becomes popular
+    early = [[1, 2]] + [[dish, dish + 1] for dish in range(10, 40, 2) for _ in range(3)]
+    counter = CooccurrenceCounter(max_pairs=10, sketch_width=1024)
+    counter._add_baskets(basket_rows(early))
+    first_key = int(pair_keys(np.array([1]), np.array([2]))[0])
+    assert first_key not in counter.pair_counts.index
+
+    counter._add_baskets(basket_rows([[1, 2]] * 5, first_order_id=len(early) + 1))
+
+    served = served_counts(counter, np.arange(1, 40, dtype=np.int32))
+    assert served[(1, 2)] >= 6
+    assert counter.pair_base.loc[first_key] >= 1
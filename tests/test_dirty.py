@@ -0,0 +1,107 @@
+# tests/test_dirty.py
+
+import pytest
+from sqlalchemy import create_engine, text
+from app.dirty import DirtyUserTracker
+
+SCHEMA = [
+    'CREATE TABLE Customer (CustomerID INTEGER PRIMARY KEY, UserID INTEGER)',
+    'CREATE TABLE UserRating (CustomerID INTEGER, DishID INTEGER, Rating REAL)',
+    'CREATE TABLE UserPreference (UserID INTEGER, DietaryRestrictions INTEGER)',
+    'CREATE TABLE "Order" (OrderID INTEGER PRIMARY KEY, CustomerID INTEGER, Status TEXT)',
+    'CREATE TABLE DishRecommendation (UserID INTEGER, DishID INTEGER)',
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dirty.db'}")
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text('INSERT INTO Customer VALUES (1, 10), (2, 20), (3, 30)'))
+        connection.execute(text('INSERT INTO UserRating VALUES (1, 1, 4.0)'))
+        # Order 2 is still open when tracking starts
+        connection.execute(text('''INSERT INTO "Order" VALUES (1, 1, 'Completed'), (2, 2, 'Pending')'''))
+        connection.execute(text('INSERT INTO DishRecommendation VALUES (10, 1), (20, 2), (30, 3)'))
+    yield engine
+    engine.dispose()
+
+
+def execute(engine, statement):
+    with engine.begin() as connection:
+        connection.execute(text(statement))
+
+
+def dirty_users(tracker, engine):
+    return dict(tracker.due_users(engine, include_stale=False))
+
+
+def test_first_scan_only_records_the_watermarks(engine):
+    tracker = DirtyUserTracker()
+
+    assert tracker.scan(engine) == 0
+
+    assert tracker._watermarks == (1, 0, 2)
+    assert tracker.stats() == {'dirty_users': 0, 'tracked_users': 0, 'open_orders': 1}
+
+
+def test_watermarks_advance_so_each_change_is_seen_once(engine):
+    tracker = DirtyUserTracker()
+    tracker.scan(engine)
+
+    execute(engine, 'INSERT INTO UserRating VALUES (2, 3, 5.0)')
+    execute(engine, 'INSERT INTO UserPreference VALUES (30, 1)')
+    execute(engine, '''INSERT INTO "Order" VALUES (3, 1, 'Completed')''')
+    assert tracker.scan(engine) == 3
+    assert tracker._watermarks == (2, 1, 3)
+    assert dirty_users(tracker, engine) == {10: 'orders', 20: 'ratings', 30: 'preferences'}
+
+    # Nothing new: the rows above are behind the watermarks now
+    for user_id in (10, 20, 30):
+        tracker.mark_generated(user_id)
+    assert tracker.scan(engine) == 0
+    assert dirty_users(tracker, engine) == {}
+
+
+def test_open_orders_dirty_their_user_when_they_complete(engine):
+    tracker = DirtyUserTracker()
+    tracker.scan(engine)
+
+    # A new open order is passed by the watermark but stays tracked
+    execute(engine, '''INSERT INTO "Order" VALUES (3, 3, 'Pending')''')
+    assert tracker.scan(engine) == 0
+    assert tracker.stats()['open_orders'] == 2
+
+    # Order 2 (open before tracking started) completes, order 3 is cancelled
+    execute(engine, '''UPDATE "Order" SET Status = 'Completed' WHERE OrderID = 2''')
+    execute(engine, '''UPDATE "Order" SET Status = 'Cancelled' WHERE OrderID = 3''')
+    assert tracker.scan(engine) == 1
+
+    assert dirty_users(tracker, engine) == {20: 'orders'}
+    assert tracker.stats()['open_orders'] == 0
+
+
+def test_deleted_open_order_stops_being_tracked(engine):
+    tracker = DirtyUserTracker()
+    tracker.scan(engine)
+
+    execute(engine, 'DELETE FROM "Order" WHERE OrderID = 2')
+
+    assert tracker.scan(engine) == 0
+    assert tracker.stats()['open_orders'] == 0
+
+
+def test_due_users_lists_dirty_users_first_then_stale_ones(engine):
+    tracker = DirtyUserTracker(staleness_bound=-1)
+    tracker.mark([30], 'ratings')
+    tracker.mark([30], 'preferences')
+    tracker.mark([99], 'ratings')   # No stored recommendations: generated on its next request
+
+    due = tracker.due_users(engine)
+
+    assert due[0] == (30, 'preferences,ratings')
+    assert sorted(due[1:]) == [(10, 'stale'), (20, 'stale')]
+    assert tracker.stats()['dirty_users'] == 1
+    assert tracker.due_users(engine, limit=1) == [(30, 'preferences,ratings')]
+    assert tracker.due_users(engine, reasons={'ratings'}) == []
@@ -0,0 +1,84 @@
+# tests/test_evaluation.py
+
+import numpy as np
+import pytest
+from app import evaluation, services
+from app.evaluation import _apply_overrides, parameter_grid, ranking_metrics
+from config.config import Config
+
+
+def test_single_hit_at_second_rank():
+    precision, recall, ndcg = ranking_metrics(np.array([1, 2, 3]), np.array([2]), 3)
+    assert precision == pytest.approx(1 / 3)
+    assert recall == pytest.approx(1.0)
+    assert ndcg == pytest.approx(1 / np.log2(3))
+
+
+def test_perfect_ranking():
+    precision, recall, ndcg = ranking_metrics(np.array([5, 6, 7, 8]), np.array([6, 5]), 2)
+    assert (precision, recall, ndcg) == pytest.approx((1.0, 1.0, 1.0))
+
+
+def test_no_hits():
+    assert ranking_metrics(np.array([1, 2, 3]), np.array([4, 5]), 3) == (0.0, 0.0, 0.0)
+
+
+def test_partial_hits_with_more_relevant_than_k():
+    # Hits at ranks 1 and 3; the ideal list has relevant dishes at ranks 1, 2 and 3
+    precision, recall, ndcg = ranking_metrics(np.array([1, 9, 2, 8]), np.array([1, 2, 3, 4, 5]), 3)
+    assert precision == pytest.approx(2 / 3)
+    assert recall == pytest.approx(2 / 5)
+    assert ndcg == pytest.approx((1 + 1 / 2) / (1 + 1 / np.log2(3) + 1 / 2))
+
+
+def test_short_recommendation_list():
+    # Fewer recommendations than k still count as k slots for precision
+    precision, recall, ndcg = ranking_metrics(np.array([3]), np.array([3]), 5)
+    assert precision == pytest.approx(1 / 5)
+    assert recall == pytest.approx(1.0)
+    assert ndcg == pytest.approx(1.0)
+
+
+def test_parameter_grid_expands_every_combination():
+    grid = parameter_grid({'CF_COMPONENTS': [20, 50], 'RERANK_MODE': ['mmr', 'quota', 'none']})
+
+    assert len(grid) == 6
+    assert grid[0] == {'CF_COMPONENTS': 20, 'RERANK_MODE': 'mmr'}
+    assert {(entry['CF_COMPONENTS'], entry['RERANK_MODE']) for entry in grid} == {
+        (components, mode) for components in (20, 50) for mode in ('mmr', 'quota', 'none')
+    }
+    assert parameter_grid({}) == [{}]
+
+
+@pytest.mark.parametrize('name', ['TOP_N', 'REGENERATION_STATUS_TTL', 'SERVING_STORE', 'RULE_DATA_TTL'])
+def test_parameter_grid_rejects_settings_outside_the_allow_list(name):
+    with pytest.raises(ValueError, match='no effect'):
+        parameter_grid({'CF_COMPONENTS': [20], name: [1]})
+
+
+def test_parameter_grid_rejects_unknown_settings():
+    with pytest.raises(ValueError, match='Unknown'):
+        parameter_grid({'CF_COMPONENT': [20]})
+
+
+@pytest.fixture
+def restore_config():
+    generators, engine = services.candidate_generators, services.rules_engine
+    yield
+    _apply_overrides({})
+    evaluation._defaults.clear()
+    services.candidate_generators, services.rules_engine = generators, engine
+
+
+def test_apply_overrides_rebuilds_import_time_objects_and_restores(restore_config):
+    default_rules, default_penalty = Config.BUSINESS_RULES, Config.DIETARY_PENALTY
+
+    _apply_overrides({'BUSINESS_RULES': 'dietary_penalty', 'DIETARY_PENALTY': 0.25})
+    assert [rule.name for rule in services.rules_engine.rules] == ['dietary_penalty']
+    assert services.rules_engine.rules[0].factor == 0.25
+
+    # The next configuration starts from the defaults, not from the previous overrides
+    _apply_overrides({'CANDIDATES_PER_GENERATOR': 7})
+    assert (Config.BUSINESS_RULES, Config.DIETARY_PENALTY) == (default_rules, default_penalty)
+    assert len(services.rules_engine.rules) == len(default_rules.split(','))
+    assert all(generator.k == 7 for generator in services.candidate_generators)
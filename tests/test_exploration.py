@@ -0,0 +1,33 @@
+# tests/test_exploration.py
+
+import numpy as np
+from app.exploration import exploration_noise, splitmix64
+
+
+def test_splitmix64_reference_value():
+    # First output of the reference SplitMix64 generator seeded with 0
+    assert splitmix64(np.array([0], dtype=np.uint64))[0] == 0xE220A8397B1DCDAF
+
+
+def test_noise_does_not_depend_on_the_candidate_set():
+    full = exploration_noise(5, 'v1', np.arange(1000), strength=0.3, now=0)
+    subset = np.array([999, 3, 512])
+
+    np.testing.assert_array_equal(exploration_noise(5, 'v1', subset, strength=0.3, now=0), full[subset])
+    assert full.dtype == np.float32
+    assert full.min() >= 0 and full.max() < 0.3
+
+
+def test_noise_changes_with_user_version_and_bucket():
+    positions = np.arange(50)
+    base = exploration_noise(5, 'v1', positions, period=3600, now=0)
+
+    np.testing.assert_array_equal(exploration_noise(5, 'v1', positions, period=3600, now=3599), base)
+    for other in (exploration_noise(6, 'v1', positions, period=3600, now=0),
+                  exploration_noise(5, 'v2', positions, period=3600, now=0),
+                  exploration_noise(5, 'v1', positions, period=3600, now=3600)):
+        assert not np.allclose(other, base)
+
+
+def test_zero_strength_disables_noise():
+    assert exploration_noise(5, 'v1', np.arange(4), strength=0).tolist() == [0.0] * 4
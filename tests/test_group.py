@@ -0,0 +1,77 @@
+# tests/test_group.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from app.compact import bitsets_intersect, build_category_bitsets, build_preference_index
+from app.group import aggregate_scores, group_member_scores, union_restriction_bits
+
+# Three members, four dishes; rows are min-max normalized before aggregation
+SCORES = np.array([
+    [1.0, 3.0, 5.0, 2.0],    # -> 0, 0.5, 1, 0.25
+    [4.0, 4.0, 0.0, 2.0],    # -> 1, 1, 0, 0.5
+    [2.0, 2.0, 2.0, 2.0],    # No preference between dishes -> all 0
+], dtype=np.float32)
+
+
+def test_average_aggregation_weighs_members_equally():
+    np.testing.assert_allclose(aggregate_scores(SCORES, 'average'), [1 / 3, 0.5, 1 / 3, 0.25])
+
+
+def test_least_misery_takes_the_least_happy_member():
+    np.testing.assert_allclose(aggregate_scores(SCORES[:2], 'least_misery'), [0.0, 0.5, 0.0, 0.25])
+    # The best dish for the group is the one nobody dislikes
+    assert int(np.argmax(aggregate_scores(SCORES[:2], 'Least_Misery'))) == 1
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError, match='Unknown group strategy'):
+        aggregate_scores(SCORES, 'median')
+
+
+def test_restrictions_of_every_member_are_combined():
+    dish_ids = np.arange(1, 6, dtype=np.int32)
+    category_index, category_bits = build_category_bitsets(
+        dish_ids, pd.DataFrame({'DishID': dish_ids, 'CategoryID': [1, 2, 3, 70, 70]})
+    )
+    preferences = pd.DataFrame({
+        'UserID': [1, 1, 2, 3],
+        'CategoryID': [1, 1, 2, 3],
+        'FavoriteDish': [1, 2, 3, 4],
+        'PreferenceScore': [1.0, 1.0, 1.0, 1.0],
+        'DietaryRestrictions': [2, 0, 70, 0],
+    })
+    preference_index = build_preference_index(preferences, category_index)
+
+    # Member 99 has no preferences and adds no restrictions
+    bits = union_restriction_bits(preference_index, [1, 2, 99])
+
+    np.testing.assert_array_equal(bitsets_intersect(category_bits, bits), [False, True, False, True, True])
+    assert not union_restriction_bits(preference_index, [3, 99]).any()
+    assert not union_restriction_bits(preference_index, []).any()
+
+
+def test_member_scores_mix_hybrid_and_segment_members():
+    model = {
+        'dish_ids': np.array([1, 2, 3], dtype=np.int32),
+        'user_ids': np.array([10, 20], dtype=np.int32),
+        'latent_matrix': np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32),
+        'item_factors': np.array([[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]], dtype=np.float32),
+        'cbf_profiles': np.array([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]], dtype=np.float32),
+        'alpha': np.array([1.0, 0.5], dtype=np.float32),
+        'beta': np.array([0.0, 0.5], dtype=np.float32),
+        'preferences': {'user_ids': np.array([30, 40], dtype=np.int32)},
+        'segment_of_user': np.array([0, 0], dtype=np.int32),
+        'segment_lists': np.array([[2, 0, -1]], dtype=np.int32),
+        'segment_scores': np.array([[0.9, 0.4, 0.0]], dtype=np.float32),
+    }
+
+    scores, scored = group_member_scores(model, [30, 10, 99, 20])
+
+    # Hybrid members first, then cold-start members; 99 has neither and is skipped
+    assert scored.tolist() == [10, 20, 30]
+    np.testing.assert_allclose(scores, [
+        [1.0, 0.0, 0.5],
+        [0.5, 0.5, 0.25],
+        [0.4, 0.0, 0.9],
+    ])
@@ -0,0 +1,103 @@
+# tests/test_registry.py
+
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import app.registry as registry
+from app.cooccurrence import CooccurrenceCounter
+from app.memory import nbytes_of
+from app.registry import LocationUnavailable, ModelRegistry
+
+
+class FakeState:
+    def __init__(self, name):
+        self.name = name
+        self.models = {}
+
+
+def make_registry(sizes, memory_budget=0, pinned=(), failing=(), retry_backoff=60):
+    loads, evicted = [], []
+
+    def loader(state):
+        loads.append(state.name)
+        if state.name in failing:
+            raise RuntimeError("snapshot is corrupt")
+        state.models = {'weights': np.zeros(sizes[state.name], dtype=np.uint8)}
+
+    model_registry = ModelRegistry(
+        factory=FakeState, loader=loader, sizer=lambda state: nbytes_of(state.models),
+        memory_budget=memory_budget, pinned=pinned, on_evict=lambda state: evicted.append(state.name),
+        retry_backoff=retry_backoff
+    )
+    return model_registry, loads, evicted
+
+
+def test_least_recently_used_location_is_evicted():
+    model_registry, loads, evicted = make_registry({'a': 400, 'b': 400, 'c': 400}, memory_budget=1000)
+    model_registry.get('a')
+    model_registry.get('b')
+    model_registry.get('a')          # 'b' is now the least recently used
+    model_registry.get('c')
+
+    assert evicted == ['b']
+    assert [name for name, _ in model_registry.resident()] == ['a', 'c']
+    stats = model_registry.stats()
+    assert stats['resident_bytes'] == 800
+    assert stats['locations']['b']['evictions'] == 1
+    assert stats['locations']['a']['hits'] == 1
+
+    model_registry.get('b')          # Loaded again on its next request
+    assert loads == ['a', 'b', 'c', 'b']
+
+
+def test_pinned_and_just_loaded_locations_are_never_evicted():
+    model_registry, _, evicted = make_registry({'default': 800, 'big': 900}, memory_budget=1000, pinned=['default'])
+    model_registry.get('default')
+    model_registry.get('big')
+
+    # Over budget, but the only candidates are pinned or just loaded
+    assert evicted == []
+    assert model_registry.evict('default') is False
+    assert model_registry.evict('big') is True
+    assert evicted == ['big']
+
+
+def test_failed_load_backs_off_and_doubles(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(registry, 'time', SimpleNamespace(time=lambda: clock[0], perf_counter=time.perf_counter))
+    failing = {'broken'}
+    model_registry, loads, _ = make_registry({'broken': 10}, failing=failing, retry_backoff=60)
+
+    with pytest.raises(LocationUnavailable) as error:
+        model_registry.get('broken')
+    assert error.value.retry_after == 60
+
+    clock[0] += 30
+    with pytest.raises(LocationUnavailable) as error:
+        model_registry.get('broken')   # Within the backoff: rejected without loading
+    assert error.value.retry_after == pytest.approx(30)
+    assert loads == ['broken']
+
+    clock[0] += 31
+    with pytest.raises(LocationUnavailable) as error:
+        model_registry.get('broken')   # Retried, failed again: the backoff doubles
+    assert error.value.retry_after == 120
+    assert loads == ['broken', 'broken']
+
+    failing.clear()
+    clock[0] += 121
+    state = model_registry.get('broken')
+    assert state.models
+    stats = model_registry.stats()['locations']['broken']
+    assert (stats['failures'], stats['rejected'], stats['consecutive_failures']) == (2, 1, 0)
+
+
+def test_sizer_counts_shared_objects_once():
+    counter = CooccurrenceCounter(sketch_width=1024, sketch_depth=2)
+    weights = np.zeros(1000, dtype=np.float32)
+
+    total = nbytes_of({'weights': weights, 'again': weights, 'counter': counter}, counter)
+
+    assert counter.nbytes >= counter.sketch.table.nbytes == 2 * 1024 * 8
+    assert total == weights.nbytes + counter.nbytes
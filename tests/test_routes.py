@@ -0,0 +1,35 @@
+# tests/test_routes.py
+
+import pytest
+from flask import Flask
+import app.routes as routes
+from app.startup import Readiness
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # The background load never runs: the app stays in its startup state
+    monkeypatch.setattr(routes, 'readiness', Readiness())
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(routes.main)
+    return flask_app.test_client()
+
+
+def test_health_is_green_while_the_models_load(client):
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "ok"}
+
+
+def test_readiness_is_red_while_the_models_load(client):
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['state'] == 'starting'
+
+
+@pytest.mark.parametrize('path', ['/api/locations', '/api/rules', '/api/recommendations/1/status'])
+def test_service_routes_answer_503_with_retry_after_while_the_models_load(client, path):
+    response = client.get(path)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(routes.Config.STARTUP_RETRY_AFTER)
+    assert 'loading' in response.get_json()['error']
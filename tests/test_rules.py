@@ -0,0 +1,99 @@
+# tests/test_rules.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from app.compact import build_category_bitsets
+from app.rules import DEFAULT_RULES, RuleContext, create_rules_engine
+from app.utils import apply_business_rules
+
+
+def reference_business_rules(recommendations, restrictions, special_dish_ids, inventory):
+    """The pandas business rules the rules engine replaced, without the database reads."""
+    recommendations = recommendations.copy()
+    if restrictions:
+        recommendations['Score'] *= recommendations['Category'].apply(lambda x: 0.5 if x in restrictions else 1.0)
+    recommendations.loc[recommendations['DishID'].isin(special_dish_ids), 'Score'] += 1
+    recommendations['Reason'] = recommendations.apply(
+        lambda row: 'Special Promotion' if row['DishID'] in special_dish_ids else row['Reason'], axis=1
+    )
+    recommendations = recommendations.merge(inventory, on='DishID', how='left')
+    recommendations['TotalQuantity'] = recommendations['TotalQuantity'].fillna(0)
+    recommendations = recommendations[recommendations['TotalQuantity'] > 0]
+    recommendations['Score'] *= recommendations['TotalQuantity'].apply(lambda x: 0.5 if x < 5 else 1.0)
+    return recommendations.drop(columns=['TotalQuantity'])
+
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(7)
+    dish_ids = np.arange(1, 41, dtype=np.int32) * 3
+    # One category per dish, so the old 'Category' column equals the DishCategory id
+    categories = rng.integers(1, 7, size=len(dish_ids))
+    dish_categories = pd.DataFrame({'DishID': dish_ids, 'CategoryID': categories})
+    special_dish_ids = rng.choice(dish_ids, size=8, replace=False).tolist()
+    # Some dishes have no inventory rows, some are out of stock, some run low
+    stocked = rng.choice(dish_ids, size=32, replace=False)
+    inventory = pd.DataFrame({
+        'DishID': stocked,
+        'TotalQuantity': rng.choice([0.0, 1.0, 3.0, 4.5, 5.0, 12.0, 40.0], size=len(stocked))
+    })
+    category_index, category_bits = build_category_bitsets(dish_ids, dish_categories)
+    context = RuleContext(dish_ids, category_bits, category_index, special_dish_ids, inventory)
+    return {
+        'dish_ids': dish_ids, 'categories': categories, 'special_dish_ids': special_dish_ids,
+        'inventory': inventory, 'context': context, 'rng': rng
+    }
+
+
+def recommendations_for(catalog, size):
+    rng = catalog['rng']
+    picked = rng.choice(len(catalog['dish_ids']), size=size, replace=False)
+    return pd.DataFrame({
+        'DishID': catalog['dish_ids'][picked],
+        'Category': catalog['categories'][picked],
+        'Score': rng.uniform(0.1, 5.0, size=size),
+        'Reason': 'Recommended for you',
+    })
+
+
+@pytest.mark.parametrize('restrictions', [[], [2], [1, 4, 6], [99]])
+def test_apply_business_rules_matches_pandas_rules(catalog, restrictions):
+    recommendations = recommendations_for(catalog, 25)
+    preferences = pd.DataFrame({
+        'UserID': [1] * len(restrictions) + [2],
+        'DietaryRestrictions': restrictions + [3],
+    })
+    expected = reference_business_rules(
+        recommendations, restrictions, catalog['special_dish_ids'], catalog['inventory']
+    )
+
+    result = apply_business_rules(
+        recommendations.copy(), 1, preferences,
+        rule_context=catalog['context'], rules_engine=create_rules_engine(DEFAULT_RULES)
+    )
+
+    assert result['DishID'].tolist() == expected['DishID'].tolist()
+    assert result['Reason'].tolist() == expected['Reason'].tolist()
+    np.testing.assert_allclose(result['Score'].to_numpy(), expected['Score'].to_numpy(), rtol=1e-6)
+
+
+def test_batch_evaluation_matches_per_user_evaluation(catalog):
+    context = catalog['context']
+    engine = create_rules_engine(DEFAULT_RULES)
+    positions = np.arange(0, 40, 2)
+    scores = catalog['rng'].uniform(0.1, 5.0, size=(3, len(positions)))
+    restrictions = [np.array([1, 2]), np.array([], dtype=np.int32), np.array([5])]
+
+    batch = engine.evaluate(context, positions, scores, restrictions)
+
+    for user in range(len(restrictions)):
+        single = engine.evaluate(context, positions, scores[user], [restrictions[user]])
+        np.testing.assert_array_equal(batch.scores[user], single.scores[0])
+        np.testing.assert_array_equal(batch.keep[user], single.keep[0])
+        np.testing.assert_array_equal(batch.reasons[user], single.reasons[0])
+
+
+def test_unknown_rule_name_is_rejected():
+    with pytest.raises(ValueError):
+        create_rules_engine('dietary_penalty,no_such_rule')
@@ -0,0 +1,99 @@
+# tests/test_scheduler.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from app.compact import build_category_bitsets
+from app.dirty import RULE_DATA_REASONS, DirtyUserTracker
+from app.rules import RuleContext
+from app.scheduler import RetrainScheduler, count_changes
+
+SCHEMA = [
+    'CREATE TABLE Customer (CustomerID INTEGER PRIMARY KEY, UserID INTEGER)',
+    'CREATE TABLE UserRating (CustomerID INTEGER, DishID INTEGER, Rating REAL)',
+    'CREATE TABLE UserPreference (UserID INTEGER, DietaryRestrictions INTEGER)',
+    'CREATE TABLE "Order" (OrderID INTEGER PRIMARY KEY, CustomerID INTEGER, Status TEXT)',
+    'CREATE TABLE DishRecommendation (UserID INTEGER, DishID INTEGER)',
+]
+
+DISH_IDS = np.array([1, 2, 3], dtype=np.int32)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scheduler.db'}")
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text('INSERT INTO Customer VALUES (1, 10), (2, 20)'))
+        connection.execute(text('INSERT INTO UserRating VALUES (1, 1, 4.0)'))
+        connection.execute(text('''INSERT INTO "Order" VALUES (1, 1, 'Completed')'''))
+        connection.execute(text('INSERT INTO DishRecommendation VALUES (10, 1), (10, 2), (20, 3)'))
+    yield engine
+    engine.dispose()
+
+
+def rule_context(quantities):
+    category_index, category_bits = build_category_bitsets(
+        DISH_IDS, pd.DataFrame({'DishID': DISH_IDS, 'CategoryID': [1, 1, 2]})
+    )
+    inventory = pd.DataFrame({'DishID': DISH_IDS, 'TotalQuantity': quantities})
+    return RuleContext(DISH_IDS, category_bits, category_index, (), inventory)
+
+
+def fail():
+    raise AssertionError("No model run expected.")
+
+
+def test_inventory_only_change_regenerates_affected_users(engine):
+    tracker = DirtyUserTracker()
+    current = {'context': rule_context([20.0, 20.0, 20.0])}
+    regenerated = []
+
+    def maintenance():
+        tracker.scan(engine, current['context'])
+        regenerated.extend(tracker.due_users(engine, reasons=RULE_DATA_REASONS, include_stale=True))
+
+    scheduler = RetrainScheduler(
+        full_retrain=fail, incremental_refresh=fail, maintenance=maintenance,
+        counter=lambda: count_changes(engine)
+    )
+    scheduler.start()
+    assert scheduler.tick() is None   # First scan only records the watermarks and stock levels
+    assert regenerated == []
+
+    # Dish 2 runs out of stock; ratings, orders and preferences do not change
+    current['context'] = rule_context([20.0, 0.0, 20.0])
+    assert scheduler.tick() is None
+
+    assert regenerated == [(10, 'dish_unavailable')]
+    assert scheduler.history() == []
+
+
+def test_training_changes_start_a_model_run_instead_of_maintenance(engine):
+    runs, maintenance_calls = [], []
+    scheduler = RetrainScheduler(
+        full_retrain=lambda: runs.append('full'), incremental_refresh=lambda: runs.append('incremental'),
+        maintenance=lambda: maintenance_calls.append(1), counter=lambda: count_changes(engine),
+        retrain_threshold=2
+    )
+    scheduler.start()
+
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO UserRating VALUES (2, 3, 5.0)'))
+    assert scheduler.tick() == 'incremental'
+    assert maintenance_calls == []
+
+    assert scheduler.tick() is None
+    assert maintenance_calls == [1]
+    assert [run['kind'] for run in scheduler.history()] == ['incremental']
+
+
+def test_maintenance_failure_does_not_break_the_tick(engine):
+    def maintenance():
+        raise RuntimeError("database is locked")
+
+    scheduler = RetrainScheduler(fail, fail, lambda: count_changes(engine), maintenance=maintenance)
+    scheduler.start()
+    assert scheduler.tick() is None
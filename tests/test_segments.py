@@ -0,0 +1,69 @@
+# tests/test_segments.py
+
+import numpy as np
+import pandas as pd
+from app.compact import build_category_bitsets, build_preference_index
+from app.segments import build_segments
+
+# Dishes 1-3 are category 1 (mains), 4-6 category 2 (desserts); dish 7 is in both
+DISH_IDS = np.arange(1, 8, dtype=np.int32)
+DISH_CATEGORIES = pd.DataFrame({
+    'DishID': [1, 2, 3, 4, 5, 6, 7, 7],
+    'CategoryID': [1, 1, 1, 2, 2, 2, 1, 2],
+})
+
+
+def segments_for(preferences, n_segments=2, list_size=10):
+    category_index, category_bits = build_category_bitsets(DISH_IDS, DISH_CATEGORIES)
+    preference_index = build_preference_index(preferences, category_index)
+    similarity = np.eye(len(DISH_IDS), dtype=np.float32)
+    segments = build_segments(
+        preference_index, DISH_IDS, category_bits, category_index, similarity,
+        n_segments=n_segments, list_size=list_size
+    )
+    return preference_index, segments
+
+
+def preference(user_id, category, favorite, score=1.0, restriction=0):
+    return {'UserID': user_id, 'CategoryID': category, 'FavoriteDish': favorite,
+            'PreferenceScore': score, 'DietaryRestrictions': restriction}
+
+
+def test_cold_users_get_the_ranked_list_of_their_segment():
+    preferences = pd.DataFrame([
+        preference(1, 1, 2), preference(2, 1, 2), preference(3, 1, 1),
+        preference(4, 2, 5), preference(5, 2, 5),
+    ])
+    preference_index, segments = segments_for(preferences)
+
+    segment_of = dict(zip(preference_index['user_ids'].tolist(), segments['segment_of_user'].tolist()))
+    assert segment_of[1] == segment_of[2] == segment_of[3] != segment_of[4] == segment_of[5]
+
+    mains = segments['segment_lists'][segment_of[1]]
+    desserts = segments['segment_lists'][segment_of[4]]
+    assert segments['segment_lists'].shape == (2, 10)
+    # Catalog positions: the favorite dish first, then its category; unrelated dishes are left out
+    assert DISH_IDS[mains[0]] == 2
+    assert set(DISH_IDS[mains[mains >= 0]]) == {1, 2, 3, 7}
+    assert DISH_IDS[desserts[0]] == 5
+    assert set(DISH_IDS[desserts[desserts >= 0]]) == {4, 5, 6, 7}
+    # -1 padded, with scores descending and zero past the end of the list
+    for lists, scores in zip(segments['segment_lists'], segments['segment_scores']):
+        assert np.all(lists[4:] == -1) and np.all(scores[4:] == 0)
+        assert np.all(np.diff(scores[:4]) <= 0) and np.all(scores[:4] > 0)
+
+
+def test_identical_profiles_form_a_single_segment():
+    preferences = pd.DataFrame([preference(1, 1, 1), preference(2, 1, 1)])
+    _, segments = segments_for(preferences, n_segments=8)
+
+    assert segments['segment_lists'].shape[0] == 1
+    assert segments['segment_of_user'].tolist() == [0, 0]
+
+
+def test_no_preferences_gives_no_segments():
+    preference_index, segments = segments_for(pd.DataFrame())
+
+    assert len(preference_index['user_ids']) == 0
+    assert segments['segment_lists'].shape == (0, 10)
+    assert len(segments['segment_of_user']) == 0
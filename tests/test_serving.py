@@ -0,0 +1,100 @@
+# tests/test_serving.py
+
+import threading
+import numpy as np
+import pytest
+from app.serving import (
+    MemoryServingStore, SqliteServingStore, create_serving_store, decode_recommendations, encode_recommendations
+)
+
+
+def test_blob_round_trip():
+    reasons = ['Recommended for you', 'Popular', 'Recommended for you', 'Chef’s special']
+    blob = encode_recommendations([42, 7, 1000000, 3], [0.9, 0.5, 0.25, 0.125], reasons)
+
+    dish_ids, scores, decoded_reasons = decode_recommendations(blob)
+
+    assert dish_ids.dtype == np.int32 and scores.dtype == np.float32
+    assert dish_ids.tolist() == [42, 7, 1000000, 3]
+    np.testing.assert_array_equal(scores, np.array([0.9, 0.5, 0.25, 0.125], dtype=np.float32))
+    assert decoded_reasons.tolist() == reasons
+
+
+def test_empty_list_round_trip():
+    dish_ids, scores, reasons = decode_recommendations(encode_recommendations([], [], []))
+    assert len(dish_ids) == len(scores) == len(reasons) == 0
+
+
+def test_too_many_distinct_reasons_are_rejected():
+    with pytest.raises(ValueError):
+        encode_recommendations(range(300), np.zeros(300), [f"reason {i}" for i in range(300)])
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def store(request, tmp_path):
+    store = create_serving_store(request.param, str(tmp_path / 'serving.db'))
+    yield store
+    store.close()
+
+
+def test_store_write_read_round_trip(store):
+    first = encode_recommendations([1, 2], [0.8, 0.4], ['Popular', 'Popular'])
+    second = encode_recommendations([3], [0.7], ['Recommended for you'])
+    store.put_many([(1, first), (2, second)])
+
+    assert store.get(1) == first
+    assert decode_recommendations(store.get(2))[0].tolist() == [3]
+    assert store.get(3) is None
+    assert len(store) == 2
+
+    # Writing a user again replaces its list
+    replacement = encode_recommendations([9], [0.1], ['Popular'])
+    store.put_many([(np.int64(1), replacement)])
+    assert store.get(1) == replacement
+    assert len(store) == 2
+
+
+def test_sqlite_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'serving.db')
+    blob = encode_recommendations([5], [1.0], ['Popular'])
+    writer = SqliteServingStore(path)
+    writer.put_many([(7, blob)])
+    writer.close()
+
+    reader = SqliteServingStore(path)
+    assert reader.get(7) == blob
+    reader.close()
+
+
+def test_create_serving_store_backends(tmp_path):
+    assert create_serving_store('none') is None
+    assert isinstance(create_serving_store('Memory'), MemoryServingStore)
+    with pytest.raises(ValueError, match='Unknown serving store'):
+        create_serving_store('redis')
+
+
+def test_close_releases_every_thread_connection(tmp_path):
+    store = SqliteServingStore(str(tmp_path / 'serving.db'))
+    store.put_many([(1, encode_recommendations([10], [1.0], ['Recommended for you']))])
+    worker = threading.Thread(target=store.get, args=(1,))
+    worker.start()
+    worker.join()
+    assert len(store._open) == 2
+
+    store.close()
+
+    assert not store._open
+    # Callers still holding the store keep working, on connections closed after each call
+    assert store.get(1) is not None
+    assert len(store) == 1
+    assert not store._open
+
+
+def test_connection_in_use_is_closed_when_its_call_ends(tmp_path):
+    store = SqliteServingStore(str(tmp_path / 'serving.db'))
+    with store._use() as connection:
+        store.close()
+        assert connection.execute('SELECT COUNT(*) FROM ServingRecommendation').fetchone() == (0,)
+    assert not store._open
+    with pytest.raises(Exception):
+        connection.execute('SELECT 1')
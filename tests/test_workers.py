@@ -0,0 +1,78 @@
+# tests/test_workers.py
+
+import threading
+import pytest
+from app.workers import RegenerationQueue, RegenerationQueueFull
+
+
+def test_versions_keep_increasing_after_the_status_expires():
+    regeneration_queue = RegenerationQueue(lambda user_id: True, workers=1, status_ttl=0)
+    first = regeneration_queue.submit(7)
+    regeneration_queue.join()
+    assert regeneration_queue.status(7)['completed_version'] == first
+
+    # The finished status is forgotten on the next submit, the version is not reused
+    second = regeneration_queue.submit(8)
+    assert regeneration_queue.status(7) is None
+    third = regeneration_queue.submit(7)
+    regeneration_queue.join()
+
+    assert first < second < third
+    assert regeneration_queue.status(7)['completed_version'] == third
+
+
+def test_updates_during_a_running_job_are_coalesced_into_one_follow_up():
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def job(user_id):
+        runs.append(user_id)
+        started.set()
+        release.wait(5)
+        return True
+
+    regeneration_queue = RegenerationQueue(job, workers=1)
+    regeneration_queue.submit(1)
+    assert started.wait(5)
+    regeneration_queue.submit(1)
+    latest = regeneration_queue.submit(1)
+    assert regeneration_queue.status(1)['state'] == 'running'
+
+    release.set()
+    regeneration_queue.join()
+
+    status = regeneration_queue.status(1)
+    assert runs == [1, 1]
+    assert (status['state'], status['completed_version'], status['error']) == ('done', latest, None)
+
+
+def test_failed_job_reports_its_error():
+    def job(user_id):
+        raise RuntimeError("retrain failed")
+
+    regeneration_queue = RegenerationQueue(job, workers=1)
+    version = regeneration_queue.submit(3)
+    regeneration_queue.join()
+
+    status = regeneration_queue.status(3)
+    assert (status['state'], status['completed_version'], status['error']) == ('failed', version, 'retrain failed')
+
+
+def test_full_queue_rejects_without_bumping_the_version():
+    started, release = threading.Event(), threading.Event()
+
+    def job(user_id):
+        started.set()
+        return release.wait(5)
+
+    regeneration_queue = RegenerationQueue(job, workers=1, max_queue_size=1)
+    try:
+        regeneration_queue.submit(1)
+        assert started.wait(5)          # User 1 is running, the queue is empty
+        regeneration_queue.submit(2)    # Fills the queue
+        with pytest.raises(RegenerationQueueFull):
+            regeneration_queue.submit(3)
+        assert regeneration_queue.status(3)['requested_version'] == 0
+    finally:
+        release.set()
+        regeneration_queue.join()